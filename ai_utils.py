@@ -0,0 +1,241 @@
+import copy
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+
+from model_server import ModelClient, ServerGenerator
+from trace_utils import count, span
+
+GUI_MODEL_NAME = "bigcode/santacoder"
+# Prompt headers whose past key/values stay in memory (one per repo the process serves)
+PREFIX_CACHE_SIZE = 4
+
+def detect_device():
+    # Pipeline device index: first CUDA GPU if there is one, otherwise CPU
+    try:
+        import torch
+        return 0 if torch.cuda.is_available() else -1
+    except Exception:
+        return -1
+
+class ModelLoader:
+    # Builds the text-generation pipeline on a background thread so the window shows immediately.
+    # `generator` stays None until the state is "ready"; callers fall back to rule-based output.
+    IDLE, LOADING, READY, FAILED = "idle", "loading", "ready", "failed"
+
+    def __init__(self, model_name=GUI_MODEL_NAME, **pipeline_kwargs):
+        self.model_name = model_name
+        self.pipeline_kwargs = pipeline_kwargs
+        self.state = self.IDLE
+        self.generator = None
+        self.device = None
+        self.error = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self.state in (self.LOADING, self.READY):
+                return
+            self.state = self.LOADING
+        threading.Thread(target=self._load, daemon=True).start()
+
+    def _load(self):
+        try:
+            # Share the daemon's already-loaded model when model_server.py is running
+            client = ModelClient()
+            if client.available():
+                self.generator = ServerGenerator(client)
+                self.model_name = client.model_name
+                self.device = "server"
+                self.state = self.READY
+                return
+            from transformers import pipeline
+            self.device = detect_device()
+            with span("model.load", model=self.model_name):
+                self.generator = pipeline("text-generation", model=self.model_name,
+                                          device=self.device, **self.pipeline_kwargs)
+            self.state = self.READY
+        except Exception as e:
+            self.error = e
+            self.state = self.FAILED
+
+    @property
+    def ready(self):
+        return self.state == self.READY
+
+    def describe(self):
+        if self.state == self.READY:
+            if self.device == "server":
+                return f"AI model ready (model server: {self.model_name})"
+            return f"AI model ready ({'GPU' if self.device >= 0 else 'CPU'})"
+        if self.state == self.FAILED:
+            return "AI model unavailable, using rule-based suggestions"
+        if self.state == self.LOADING:
+            return "AI model loading, using rule-based suggestions"
+        return "AI model not loaded"
+
+# -----------------------------
+# Early stopping
+# -----------------------------
+# Lines the candidate cleaner would throw away anyway: echoed code, tracebacks, comments
+JUNK_LINE_RE = re.compile(
+    r'return None|print\(|traceback|^\s*#|^\s*exception|\bdef \w+\(|^\s*(?:from \S+ )?import \w|```|[{};]\s*$',
+    re.I
+)
+MAX_CANDIDATE_WORDS = 12
+
+class CandidateLineStopper:
+    """transformers stopping criterion that ends each sequence once it has `lines` complete
+    lines, once the line being written passes `max_words`, or once it turns into code.
+
+    The prompt length is taken from the first call (prompt + one new token), so it also
+    works inside the pipeline and with left-padded batches. One instance serves exactly
+    one generate() call: a later call has another padded width. Returns one flag per row.
+    """
+    def __init__(self, tok, lines=3, max_words=MAX_CANDIDATE_WORDS):
+        self.tok = tok
+        self.lines = lines
+        self.max_words = max_words
+        self.prompt_len = None
+
+    def finished(self, text):
+        *complete, current = text.split("\n")
+        complete = [l for l in complete if l.strip()]
+        if len(complete) >= self.lines:
+            return True
+        if len(current.split()) > self.max_words:
+            return True
+        return any(JUNK_LINE_RE.search(l) for l in complete[-1:] + [current])
+
+    def __call__(self, input_ids, scores, **kwargs):
+        import torch
+        if self.prompt_len is None:
+            self.prompt_len = input_ids.shape[1] - 1
+        texts = self.tok.batch_decode(input_ids[:, self.prompt_len:], skip_special_tokens=True)
+        return torch.tensor([self.finished(t) for t in texts], dtype=torch.bool, device=input_ids.device)
+
+def apply_stop_lines(gen_kwargs, tok):
+    # Turns the serializable `stop_lines` option into a stopping_criteria list
+    lines = gen_kwargs.pop("stop_lines", None)
+    if lines:
+        from transformers import StoppingCriteriaList
+        gen_kwargs["stopping_criteria"] = StoppingCriteriaList([CandidateLineStopper(tok, lines)])
+    return gen_kwargs
+
+# -----------------------------
+# Generation
+# -----------------------------
+def _count_generated(gen, prompt, texts):
+    # Pipelines return text only, so the continuations are re-encoded for the tokens.generated counter
+    tok = getattr(gen, "tokenizer", None)
+    if tok is None:
+        return
+    total = 0
+    for text in texts:
+        if text.startswith(prompt):
+            text = text[len(prompt):]  # return_full_text=True
+        total += len(tok.encode(text, add_special_tokens=False))
+    count("tokens.generated", total)
+
+def generate_candidates(gen, prompt, n=3, prefix=None, **gen_kwargs):
+    # One pipeline call returning n sampled continuations: the prompt is encoded and prefilled once.
+    # `prefix` is the leading part of the prompt that repeats across calls; the model server
+    # keeps its past key/values, so only the rest is prefilled there.
+    if prefix and isinstance(gen, ServerGenerator):
+        gen_kwargs["prefix"] = prefix
+    if hasattr(gen, "tokenizer"):
+        apply_stop_lines(gen_kwargs, gen.tokenizer)
+    with span("generate", n=n):
+        outputs = gen(prompt, num_return_sequences=n, **gen_kwargs)
+    texts = [o.get("generated_text", "") for o in outputs]
+    _count_generated(gen, prompt, texts)
+    return texts
+
+def generate_batch(gen, prompts, n=3, batch_size=8, **gen_kwargs):
+    # Same as generate_candidates for several prompts at once, run as left-padded batches.
+    # Returns one list of n continuations per prompt, in prompt order.
+    prompts = list(prompts)
+    if not prompts:
+        return []
+    tok = gen.tokenizer
+    if tok.pad_token_id is None:
+        tok.pad_token = tok.eos_token
+    tok.padding_side = "left"  # decoder-only models continue from the right edge
+    results = []
+    with span("generate.batch", prompts=len(prompts), n=n):
+        # One pipeline call (= one generate() call) per chunk, each with its own stopper
+        for start in range(0, len(prompts), batch_size):
+            chunk = prompts[start:start + batch_size]
+            kwargs = apply_stop_lines(dict(gen_kwargs), tok)
+            outputs = gen(chunk, num_return_sequences=n, batch_size=batch_size, **kwargs)
+            results += [[o.get("generated_text", "") for o in out] for out in outputs]
+    for prompt, texts in zip(prompts, results):
+        _count_generated(gen, prompt, texts)
+    return results
+
+class PrefixCache:
+    # Past key/values of static prompt headers (seed examples + rules), most recently used last.
+    # Keyed by a hash of the header token ids, so new seed examples or a new template recompute it.
+    # Keeps `size` headers: the model server sees one per repo it is asked about.
+    def __init__(self, size=1):
+        self.size = size
+        self.entries = OrderedDict()
+
+    def get(self, model, prefix_ids):
+        key = (id(model), hashlib.sha256(repr(prefix_ids).encode("ascii")).hexdigest())
+        past = self.entries.pop(key, None)
+        if past is None:
+            import torch
+            ids = torch.tensor([prefix_ids], device=model.device)
+            with torch.no_grad():
+                past = model(ids, use_cache=True).past_key_values
+            count("prefix_cache.miss")
+        else:
+            count("prefix_cache.hit")
+        self.entries[key] = past
+        while len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+        return past
+
+    def clear(self):
+        self.entries.clear()
+
+prefix_cache = PrefixCache(PREFIX_CACHE_SIZE)
+
+def _expand_past(past, n):
+    # generate() mutates Cache objects in place, so always hand it a private copy
+    if hasattr(past, "batch_repeat_interleave"):
+        past = copy.deepcopy(past)
+        if n > 1:
+            past.batch_repeat_interleave(n)
+        return past
+    if n == 1:
+        return past
+    return tuple(tuple(t.repeat_interleave(n, dim=0) for t in layer) for layer in past)
+
+def generate_from_ids(model, tok, prefix_ids, suffix_ids, n=3, cache=None, stats=None, **gen_kwargs):
+    # n continuations of prefix_ids + suffix_ids where only the suffix is prefilled.
+    # `stats`, if given, receives the number of generated (non-padding) tokens.
+    import torch
+    cache = cache or prefix_cache
+    past = cache.get(model, prefix_ids)
+    input_ids = torch.tensor([list(prefix_ids) + list(suffix_ids)], device=model.device).repeat(n, 1)
+    gen_kwargs.setdefault("pad_token_id", tok.eos_token_id)
+    apply_stop_lines(gen_kwargs, tok)
+    with torch.no_grad():
+        out = model.generate(
+            input_ids=input_ids,
+            attention_mask=torch.ones_like(input_ids),
+            past_key_values=_expand_past(past, n),
+            **gen_kwargs
+        )
+    new_tokens = out[:, input_ids.shape[1]:]
+    if stats is not None:
+        stats["new_tokens"] = int((new_tokens != gen_kwargs["pad_token_id"]).sum())
+    return tok.batch_decode(new_tokens, skip_special_tokens=True)
+
+def generate_with_prefix(model, tok, prefix_text, suffix_text, n=3, cache=None, **gen_kwargs):
+    prefix_ids = tok.encode(prefix_text)
+    suffix_ids = tok.encode(suffix_text, add_special_tokens=False)
+    return generate_from_ids(model, tok, prefix_ids, suffix_ids, n=n, cache=cache, **gen_kwargs)
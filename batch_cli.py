@@ -0,0 +1,272 @@
+# batch_cli.py
+"""Headless batch mode: suggest commit messages for the staged changes of many repositories.
+
+    python batch_cli.py ~/wt/a ~/wt/b --out suggestions.jsonl
+    python batch_cli.py --jobs jobs.jsonl --workers 8 --max-tasks-per-child 50 --memory-mb 512
+    find ~/wt -maxdepth 1 -mindepth 1 | python batch_cli.py --repos-from - --stub
+
+Staged diffs are collected in a process pool (one job per repo), prompts are sent
+to the model in batches, and one JSON line per job is written as soon as its batch
+finishes. Jobs in a --jobs file look like {"repo": "/path", "id": "optional", "candidates": 3}.
+Generation uses the model_server daemon when it is running, otherwise loads the
+model in-process; --stub needs neither.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+from candidate_utils import normalize_candidates, post_process_continuation
+from git_backend import get_backend
+from model_server import DEFAULT_MODEL, MAX_BATCH, BackendModel, ModelClient, PipelineModel, StubModel
+from prompt_utils import prompt_prefix, prompt_suffix
+import trace_utils
+
+DEFAULT_CANDIDATES = 3
+DEFAULT_MAX_TOKENS = 400
+DEFAULT_READ_BYTES = 64_000
+SAMPLE_KWARGS = {"max_new_tokens": 60, "do_sample": True, "top_p": 0.92}
+
+# -----------------------------
+# Collection (runs in pool workers)
+# -----------------------------
+def _init_worker(memory_mb):
+    # Hard cap on each worker's address space so one huge diff cannot take the host down
+    if memory_mb:
+        try:
+            import resource
+            limit = memory_mb * 1024 * 1024
+            resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+        except (ImportError, ValueError, OSError):
+            pass
+
+def _seed_examples(repo, paths):
+    path = os.path.join(repo, "commit_examples.txt")
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            lines = [l.strip() for l in f if l.strip()]
+        if lines:
+            return lines[:10]
+    from history_index import similar_subjects
+    examples = [l for l in similar_subjects(repo, paths, k=8) if ":" in l][:5]
+    if examples:
+        return examples
+    examples = [subject for _, subject in get_backend().log_subjects(repo, 8) if ":" in subject][:5]
+    return examples or ["chore: update project files"]
+
+def collect_job(job, max_tokens=DEFAULT_MAX_TOKENS, read_bytes=DEFAULT_READ_BYTES):
+    """Staged diff -> prompt for one job; never raises, errors are reported in the result."""
+    from classify_utils import classify_staged
+    from diff_utils import changed_paths, compact_staged_diff
+    started = time.perf_counter()
+    result = {"id": job["id"], "repo": job["repo"], "candidates_wanted": job["candidates"]}
+    try:
+        repo = job["repo"]
+        paths = changed_paths(["diff", "--staged"], repo)
+        result["files"] = paths
+        if not paths:
+            result["error"] = "no staged changes"
+            return result
+        summary = "Changed files: " + ", ".join(paths[:10]) + (", ..." if len(paths) > 10 else "")
+        diff_text = compact_staged_diff(repo, max_tokens=max_tokens, read_bytes=read_bytes)
+        seeds = _seed_examples(repo, paths)
+        result["prompt"] = prompt_prefix(seeds) + prompt_suffix(summary, diff_text, job["candidates"])
+        result["fallback"] = classify_staged(repo, max_bytes=read_bytes).message()
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+    finally:
+        result["collect_seconds"] = round(time.perf_counter() - started, 4)
+    return result
+
+# -----------------------------
+# Generation
+# -----------------------------
+class ServerBatch:
+    # The daemon batches requests that arrive together, so a batch is sent as concurrent calls
+    def __init__(self, client, batch_size):
+        self.client = client
+        self.name = client.model_name
+        self.pool = ThreadPoolExecutor(max_workers=batch_size)
+
+    def generate_batch(self, prompts, n, **params):
+        futures = [self.pool.submit(self.client.generate, p, n, **params) for p in prompts]
+        return [f.result() for f in futures]
+
+def load_generator(args):
+    if args.stub:
+        return StubModel()
+    if not args.no_server:
+        client = ModelClient()
+        if client.available():
+            return ServerBatch(client, args.batch_size)
+    if args.backend:
+        return BackendModel(args.model, args.backend)
+    return PipelineModel(args.model)
+
+def generate_results(model, batch, stats):
+    by_n = {}
+    for item in batch:
+        by_n.setdefault(item["candidates_wanted"], []).append(item)
+    started = time.perf_counter()
+    for n, items in by_n.items():
+        try:
+            with trace_utils.span("generate.batch", prompts=len(items), n=n):
+                outputs = model.generate_batch([i["prompt"] for i in items], n, stop_lines=n, **SAMPLE_KWARGS)
+        except Exception as e:
+            outputs = [[] for _ in items]
+            for item in items:
+                item["error"] = f"generation failed: {type(e).__name__}: {e}"
+        for item, outs in zip(items, outputs):
+            item["candidates"] = normalize_candidates([post_process_continuation(o) for o in outs])
+    stats["generate_seconds"] += time.perf_counter() - started
+    stats["batches"] += 1
+
+# -----------------------------
+# Jobs and output
+# -----------------------------
+def read_jobs(args):
+    jobs = []
+
+    def add(repo, job_id=None, candidates=None):
+        jobs.append({"id": job_id or str(len(jobs)), "repo": os.path.abspath(os.path.expanduser(repo)),
+                     "candidates": int(candidates or args.candidates)})
+
+    for repo in args.repos:
+        add(repo)
+    if args.repos_from:
+        f = sys.stdin if args.repos_from == "-" else open(args.repos_from, encoding="utf-8")
+        with f:
+            for line in f:
+                if line.strip():
+                    add(line.strip())
+    if args.jobs:
+        with open(args.jobs, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    job = json.loads(line)
+                    add(job["repo"], job.get("id"), job.get("candidates"))
+    return jobs
+
+def write_result(out, item):
+    candidates = item.get("candidates") or []
+    record = {
+        "id": item["id"],
+        "repo": item["repo"],
+        "candidates": candidates,
+        "selected": candidates[0] if candidates else item.get("fallback"),
+        "source": "model" if candidates else ("fallback" if item.get("fallback") else None),
+        "files": len(item.get("files") or []),
+        "collect_seconds": item.get("collect_seconds"),
+    }
+    if item.get("error"):
+        record["error"] = item["error"]
+    out.write(json.dumps(record, ensure_ascii=False) + "\n")
+    out.flush()
+
+def run_batch(args, jobs, out, log=sys.stderr):
+    stats = {"jobs": len(jobs), "ok": 0, "failed": 0, "batches": 0, "generate_seconds": 0.0}
+    started = time.perf_counter()
+    model = None
+    pending_prompts = []
+
+    def flush():
+        nonlocal model
+        if not pending_prompts:
+            return
+        if model is None:
+            with trace_utils.span("model.load"):
+                model = load_generator(args)
+        generate_results(model, pending_prompts, stats)
+        for item in pending_prompts:
+            write_result(out, item)
+            stats["ok" if item.get("candidates") else "failed"] += 1
+        pending_prompts.clear()
+
+    pool = ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker,
+                               initargs=(args.memory_mb,), max_tasks_per_child=args.max_tasks_per_child)
+    # Only a bounded number of jobs is in flight, so results and prompts never pile up in memory
+    in_flight = {}  # future -> job, so a dead worker's record still names its job
+    queued = iter(jobs)
+    with pool:
+        while True:
+            while len(in_flight) < args.workers * 2:
+                job = next(queued, None)
+                if job is None:
+                    break
+                in_flight[pool.submit(collect_job, job, args.max_tokens, args.max_diff_bytes)] = job
+            if not in_flight:
+                break
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                job = in_flight.pop(future)
+                try:
+                    item = future.result()
+                except Exception as e:  # worker died, e.g. hit --memory-mb
+                    item = {"id": job["id"], "repo": job["repo"],
+                            "error": f"worker failed: {type(e).__name__}: {e}"}
+                if "prompt" in item:
+                    pending_prompts.append(item)
+                else:
+                    write_result(out, item)
+                    stats["failed"] += 1
+            if len(pending_prompts) >= args.batch_size:
+                flush()
+        flush()
+
+    elapsed = time.perf_counter() - started
+    stats["seconds"] = round(elapsed, 3)
+    stats["generate_seconds"] = round(stats["generate_seconds"], 3)
+    stats["jobs_per_sec"] = round(len(jobs) / elapsed, 2) if elapsed else 0.0
+    try:
+        import resource
+        stats["peak_worker_rss_mb"] = round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024, 1)
+    except ImportError:
+        pass
+    print(f"{stats['jobs']} jobs in {elapsed:.2f}s ({stats['jobs_per_sec']} jobs/s): "
+          f"{stats['ok']} ok, {stats['failed']} failed, {stats['batches']} batches, "
+          f"{stats['generate_seconds']}s generating", file=log)
+    return stats
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("repos", nargs="*", help="repository paths")
+    parser.add_argument("--repos-from", metavar="FILE", help="file with one repo path per line ('-' for stdin)")
+    parser.add_argument("--jobs", metavar="JSONL", help="job file with one {\"repo\": ...} object per line")
+    parser.add_argument("--out", default="-", help="JSONL output path (default: stdout)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2,
+                        help="processes collecting diffs")
+    parser.add_argument("--max-tasks-per-child", type=int, default=100,
+                        help="recycle each worker process after this many repos")
+    parser.add_argument("--memory-mb", type=int, default=0,
+                        help="address-space limit per worker process (0 = unlimited)")
+    parser.add_argument("--max-diff-bytes", type=int, default=DEFAULT_READ_BYTES,
+                        help="bytes of each staged diff read before compaction")
+    parser.add_argument("--max-tokens", type=int, default=DEFAULT_MAX_TOKENS,
+                        help="token budget of the diff section of each prompt")
+    parser.add_argument("--batch-size", type=int, default=MAX_BATCH)
+    parser.add_argument("--candidates", type=int, default=DEFAULT_CANDIDATES)
+    parser.add_argument("--model", default=DEFAULT_MODEL)
+    parser.add_argument("--backend", default=None, help="torch, int8 or onnx (in-process only)")
+    parser.add_argument("--no-server", action="store_true", help="do not use a running model_server.py")
+    parser.add_argument("--stub", action="store_true", help="deterministic stub model, for dry runs")
+    parser.add_argument("--stats", metavar="PATH", help="also write the throughput report as JSON")
+    args = parser.parse_args(argv)
+
+    jobs = read_jobs(args)
+    if not jobs:
+        parser.error("no repositories given")
+    out = sys.stdout if args.out == "-" else open(args.out, "w", encoding="utf-8")
+    try:
+        stats = run_batch(args, jobs, out)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    if args.stats:
+        with open(args.stats, "w", encoding="utf-8") as f:
+            json.dump(stats, f, indent=2)
+    return 0 if stats["ok"] else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,36 @@
+# benchmarks/bench_history_export.py
+"""Throughput of export_utils.export_history on a synthetic history built with git fast-import.
+
+    python benchmarks/bench_history_export.py [--commits 1000000] [--repo /tmp/history-bench]
+
+The repo is reused when it already has the requested number of commits.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from export_utils import export_history
+from synthetic_repo import build_history_repo
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--commits", type=int, default=1_000_000)
+    parser.add_argument("--repo", default=os.path.join(tempfile.gettempdir(), "history-bench"))
+    args = parser.parse_args()
+    start = time.perf_counter()
+    try:
+        build_history_repo(args.repo, args.commits)
+    except FileExistsError as e:
+        raise SystemExit(f"{e}; pick another --repo")
+    print(f"repo ready in {time.perf_counter() - start:.1f}s: {args.repo}")
+    for fmt in ("jsonl", "csv"):
+        out = os.path.join(tempfile.gettempdir(), f"history-bench.{fmt}")
+        stats = export_history(args.repo, out, fmt=fmt)
+        print(f"{fmt:5s} {stats['commits']:>9,} commits  {stats['bytes'] / 1e6:7.1f} MB  "
+              f"{stats['seconds']:6.2f}s  {stats['commits_per_sec']:>9,} commits/s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+# benchmarks/bench_normalizer.py
+"""Micro-benchmark: candidate_utils.normalize_candidates vs. the original cleaner.
+
+    python benchmarks/bench_normalizer.py [--outputs 20000]
+
+Asserts identical results on a generated corpus before timing anything.
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from candidate_utils import clean_candidate_line, normalize_candidates
+
+# --- Original implementation (debug_commit_ai before candidate_utils), kept for comparison ---
+def legacy_clean_candidate_line(line: str) -> str:
+    if not line:
+        return ""
+    s = line.strip()
+    if s.lower().startswith("exception") or "return None" in s or "print(" in s or "traceback" in s.lower() or s.startswith("#"):
+        return ""
+    s = re.sub(r'^[\s\-\)\(\[\]]*\d+[\.\)]\s*', '', s)
+    s = re.sub(r'^[\s\-\*]+', '', s)
+    s = re.split(r'(?<=\w)\.\s', s)[0].strip()
+    s = re.sub(r'^(feat|FEAT)\s*:', 'feat:', s)
+    s = re.sub(r'^(fix|FIX)\s*:', 'fix:', s)
+    s = re.sub(r'^(chore|CHORE)\s*:', 'chore:', s)
+    s = re.sub(r'^(docs|DOCS)\s*:', 'docs:', s)
+    s = re.sub(r'^(refactor|REFACTOR)\s*:', 'refactor:', s)
+    if s.lower().startswith("changed files"):
+        return ""
+    if ":" not in s:
+        if re.search(r'\bfix|bug|error|typo\b', s, flags=re.I):
+            s = "fix: " + s
+        else:
+            s = "feat: " + s
+    s_words = s.split()
+    if len(s_words) > 12:
+        s = " ".join(s_words[:12])
+    return s.strip()
+
+def legacy_normalize(raw_outputs):
+    candidates = []
+    for out in raw_outputs:
+        if not out:
+            continue
+        for l in out.splitlines():
+            cleaned = legacy_clean_candidate_line(l)
+            if cleaned:
+                candidates.append(cleaned)
+    seen = set()
+    deduped = []
+    for c in candidates:
+        key = c.lower()
+        if key and key not in seen and ":" in c and len(c.split()) <= 12:
+            seen.add(key)
+            deduped.append(c)
+    return deduped
+
+PIECES = [
+    "feat: add parser", "FIX : handle None", "1. docs: update readme", "- chore: bump deps",
+    "2) refactor(core): split module. Also more", "Exception in thread", "print(x)", "# comment",
+    "fixes typo in header", "update the thing", "Changed files: a.py", "REFACTOR: tidy",
+    "a b c d e f g h i j k l m: too long line here", "   * style: format", "CHORE:release 1.2",
+    "feat(ui): show status light next to the repo button and refresh it often enough",
+    "Traceback (most recent call last):", "return None", "[3] perf: cache prefix",
+]
+
+def make_corpus(n, seed=0):
+    rng = random.Random(seed)
+    return ["\n".join(rng.choice(PIECES) + rng.choice(["", " x", " Fix", "."]) for _ in range(rng.randint(0, 6)))
+            for _ in range(n)]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--outputs", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    corpus = make_corpus(args.outputs)
+    assert normalize_candidates(corpus) == legacy_normalize(corpus), "normalizer diverged from legacy output"
+    for line in (l for out in corpus for l in out.splitlines()):
+        assert clean_candidate_line(line) == legacy_clean_candidate_line(line), line
+    legacy = min(timeit.repeat(lambda: legacy_normalize(corpus), number=1, repeat=args.repeat))
+    new = min(timeit.repeat(lambda: normalize_candidates(corpus), number=1, repeat=args.repeat))
+    lines = sum(len(o.splitlines()) for o in corpus)
+    print(f"{lines} lines from {len(corpus)} outputs")
+    print(f"legacy:  {legacy * 1000:8.1f} ms  ({lines / legacy:,.0f} lines/s)")
+    print(f"compiled:{new * 1000:8.1f} ms  ({lines / new:,.0f} lines/s)")
+    print(f"speedup: {legacy / new:.2f}x")
+
+if __name__ == "__main__":
+    main()
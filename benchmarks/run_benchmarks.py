@@ -0,0 +1,208 @@
+# benchmarks/run_benchmarks.py
+"""Benchmark suite for the refresh, diff, prompt, cleanup, history and export paths.
+
+    python benchmarks/run_benchmarks.py [--files 500] [--commits 200] [--diff-lines 40] [--out results.json]
+
+Runs offline against a synthetic repo (benchmarks/synthetic_repo.py) with the
+model server's StubModel in place of a real generator. Benchmarks that need a
+display or reportlab are recorded as skipped when those are unavailable.
+Results go to benchmarks/results/<timestamp>.json unless --out is given.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+import debug_commit_ai
+import git_utils
+from candidate_utils import clean_candidate_line, normalize_candidates
+from export_utils import export_history
+from change_detector import resolve_git_dir
+from history_index import INDEX_NAME, HistoryIndex, similar_subjects
+from model_server import StubModel
+from synthetic_repo import build_synthetic_repo
+
+class Skip(Exception):
+    pass
+
+class _Label:
+    # Minimal stand-ins for the status label/canvas that check_changes writes to
+    def config(self, **kw):
+        self.kw = kw
+
+    def itemconfig(self, item, **kw):
+        self.kw = kw
+
+def timed(fn, repeat):
+    runs = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        runs.append(time.perf_counter() - start)
+    return {"min_ms": round(min(runs) * 1000, 3),
+            "median_ms": round(statistics.median(runs) * 1000, 3),
+            "runs": repeat}
+
+def bench_check_changes(repo, repeat):
+    git_utils.repo_path = repo
+    label = _Label()
+    return timed(lambda: git_utils.check_changes(label, label, None), repeat)
+
+def bench_load_files(repo, repeat):
+    import tkinter
+    try:
+        root = tkinter.Tk()
+    except tkinter.TclError as e:
+        raise Skip(f"no display: {e}")
+    try:
+        frame = tkinter.Frame(root)
+        git_utils.repo_path = repo
+
+        def cold():
+            git_utils._clear_files()
+            git_utils.load_files(frame)
+            root.update_idletasks()
+        result = timed(cold, repeat)
+        result["warm"] = timed(lambda: git_utils.load_files(frame), repeat)
+        return result
+    finally:
+        root.destroy()
+
+def bench_staged_diff(repo, repeat):
+    return timed(lambda: debug_commit_ai.get_staged_diff(), repeat)
+
+def bench_build_prompt(repo, repeat):
+    seeds = debug_commit_ai.run(["git", "log", "-n", "8", "--pretty=format:%s"]).splitlines()
+    diff = debug_commit_ai.get_staged_diff()
+    summary = debug_commit_ai.summarize_filenames(debug_commit_ai.get_changed_files())
+    return timed(lambda: debug_commit_ai.build_prompt(seeds, summary, diff), repeat)
+
+def bench_stub_generate(repo, repeat):
+    model = StubModel()
+    prompt = debug_commit_ai.build_prompt([], "", debug_commit_ai.get_staged_diff())
+    return timed(lambda: normalize_candidates(model.generate_batch([prompt] * 8, 3)[0]), repeat)
+
+def bench_clean_candidate_line(repo, repeat):
+    lines = ["1. feat: add parser cache for faster lookups. More text here",
+             "- FIX : handle empty config", "Traceback (most recent call last):",
+             "update the render loop to skip hidden rows", "# comment", "refactor: split worker"] * 2000
+    result = timed(lambda: [clean_candidate_line(l) for l in lines], repeat)
+    result["lines"] = len(lines)
+    return result
+
+def bench_history(repo, repeat):
+    paths = [path for _, path, _ in git_utils.read_snapshot(repo).entries][:20]
+    result = timed(lambda: git_utils.read_history(repo), repeat)
+
+    def cold_index():
+        if os.path.exists(index_path):
+            os.remove(index_path)
+        index = HistoryIndex(repo)
+        try:
+            index.update()
+        finally:
+            index.close()
+    index_path = os.path.join(resolve_git_dir(repo), INDEX_NAME)
+    result["index_cold"] = timed(cold_index, repeat)
+    result["similar_subjects"] = timed(lambda: similar_subjects(repo, paths, k=8), repeat)
+    return result
+
+def bench_export_history(repo, repeat):
+    with tempfile.TemporaryDirectory() as tmp:
+        out = os.path.join(tmp, "history.jsonl")
+        return timed(lambda: export_history(repo, out), repeat)
+
+def bench_export_pdf(repo, repeat):
+    try:
+        import reportlab  # noqa: F401
+        import PIL  # noqa: F401
+    except ImportError:
+        raise Skip("reportlab or Pillow not installed")
+    from export_utils import write_summary
+
+    # The same call the GUI makes; it writes into the working directory
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        try:
+            return timed(lambda: write_summary(repo, png=True), repeat)
+        finally:
+            os.chdir(cwd)
+
+BENCHMARKS = [
+    ("check_changes", bench_check_changes),
+    ("load_files", bench_load_files),
+    ("get_staged_diff", bench_staged_diff),
+    ("build_prompt", bench_build_prompt),
+    ("stub_generate", bench_stub_generate),
+    ("clean_candidate_line", bench_clean_candidate_line),
+    ("history", bench_history),
+    ("export_history", bench_export_history),
+    ("export_summary_pdf", bench_export_pdf),
+]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--files", type=int, default=500)
+    parser.add_argument("--commits", type=int, default=200)
+    parser.add_argument("--diff-lines", type=int, default=40)
+    parser.add_argument("--changed-files", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--only", nargs="*", help="names of benchmarks to run")
+    parser.add_argument("--out", help="JSON results path")
+    parser.add_argument("--keep-repo", action="store_true", help="leave the synthetic repo on disk")
+    args = parser.parse_args()
+
+    params = {k: getattr(args, k) for k in ("files", "commits", "diff_lines", "changed_files", "repeat")}
+    tmp = tempfile.mkdtemp(prefix="commit-ai-bench-")
+    repo = os.path.join(tmp, "repo")
+    cwd = os.getcwd()
+    results = {}
+    try:
+        start = time.perf_counter()
+        build_synthetic_repo(repo, args.files, args.commits, args.diff_lines, args.changed_files)
+        print(f"synthetic repo in {time.perf_counter() - start:.2f}s: {repo}")
+
+        # get_staged_diff and friends read the current directory's repo
+        os.chdir(repo)
+        for name, fn in BENCHMARKS:
+            if args.only and name not in args.only:
+                continue
+            try:
+                results[name] = fn(repo, args.repeat)
+                print(f"{name:22s} min {results[name]['min_ms']:9.2f} ms  median {results[name]['median_ms']:9.2f} ms")
+            except Skip as e:
+                results[name] = {"skipped": str(e)}
+                print(f"{name:22s} skipped: {e}")
+    finally:
+        os.chdir(cwd)
+        if not args.keep_repo:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+    git_version = subprocess.run(["git", "--version"], capture_output=True, text=True).stdout.strip()
+    report = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "git": git_version,
+        "params": params,
+        "results": results,
+    }
+    out = args.out or os.path.join(ROOT, "benchmarks", "results",
+                                   datetime.now().strftime("%Y%m%d-%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"results written to {out}")
+
+if __name__ == "__main__":
+    main()
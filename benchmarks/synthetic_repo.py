@@ -0,0 +1,145 @@
+# benchmarks/synthetic_repo.py
+"""Builds throwaway git repositories of a chosen shape for the benchmarks.
+
+    python benchmarks/synthetic_repo.py /tmp/synth --files 500 --commits 200 --diff-lines 40
+
+build_synthetic_repo writes real file history with git fast-import, then leaves
+staged, unstaged and untracked changes in the work tree. build_history_repo only
+writes commits (one tiny tree) and is meant for million-commit history benchmarks.
+"""
+import argparse
+import os
+import random
+import subprocess
+
+TYPES = ["feat", "fix", "docs", "refactor", "chore", "test", "perf", "Update"]
+SCOPES = ["api", "ui", "core", "", "build"]
+WORDS = ["parser", "cache", "config", "render", "token", "index", "buffer", "client",
+         "session", "export", "status", "commit", "branch", "worker", "queue", "layout"]
+
+def subject_for(i, rng=None):
+    ctype = TYPES[i % len(TYPES)]
+    scope = SCOPES[i % len(SCOPES)]
+    words = " ".join(rng.sample(WORDS, 2)) if rng else f"change {i}"
+    return f"{ctype}({scope}): {words}" if scope else f"{ctype}: {words}"
+
+def _git(path, *args, **kwargs):
+    return subprocess.run(["git", "-C", path, *args], check=True, capture_output=True, **kwargs)
+
+def _fast_import(path, stream):
+    proc = subprocess.Popen(["git", "-C", path, "fast-import", "--quiet", "--done"], stdin=subprocess.PIPE)
+    for chunk in stream:
+        proc.stdin.write(chunk)
+    proc.stdin.close()
+    if proc.wait():
+        raise RuntimeError("git fast-import failed")
+
+def _init(path):
+    if os.path.exists(os.path.join(path, ".git")):
+        raise FileExistsError(f"{path} is already a git repository")
+    os.makedirs(path, exist_ok=True)
+    subprocess.run(["git", "init", "-q", path], check=True)
+    _git(path, "symbolic-ref", "HEAD", "refs/heads/main")
+
+def _line(rng, n):
+    return f"    value_{n} = {rng.choice(WORDS)}_{rng.randrange(10_000)}({rng.choice(WORDS)})\n"
+
+def _commit_header(i, message):
+    data = message.encode()
+    stamp = 1_500_000_000 + i * 60
+    return (f"commit refs/heads/main\n"
+            f"author Bench <bench@example.com> {stamp} +0000\n"
+            f"committer Bench <bench@example.com> {stamp} +0000\n"
+            f"data {len(data)}\n").encode() + data + b"\n"
+
+def _file_stream(files, commits, lines_per_file, files_per_commit, rng):
+    contents = {}
+    for i in range(commits):
+        if i == 0:
+            paths = [f"pkg{n % 10}/module_{n}.py" for n in range(files)]
+        else:
+            paths = rng.sample(sorted(contents), min(files_per_commit, len(contents)))
+        out = [_commit_header(i, subject_for(i, rng) + "\n")]
+        for path in paths:
+            lines = contents.get(path) or [f"def {os.path.basename(path)[:-3]}():\n"] + \
+                [_line(rng, n) for n in range(lines_per_file)]
+            if i:
+                for _ in range(3):
+                    lines[rng.randrange(1, len(lines))] = _line(rng, rng.randrange(lines_per_file))
+            contents[path] = lines
+            blob = "".join(lines).encode()
+            out.append(f"M 100644 inline {path}\ndata {len(blob)}\n".encode() + blob + b"\n")
+        yield b"".join(out) + b"\n"
+    yield b"done\n"
+
+def build_synthetic_repo(path, files=500, commits=200, diff_lines=40, changed_files=50,
+                         lines_per_file=200, files_per_commit=5, untracked=10, seed=0):
+    """Create a repo with `commits` commits over `files` files, then stage `diff_lines`
+    edited lines in each of `changed_files` files and add a few unstaged/untracked files."""
+    rng = random.Random(seed)
+    _init(path)
+    _fast_import(path, _file_stream(files, max(commits, 1), lines_per_file, files_per_commit, rng))
+    _git(path, "checkout", "-q", "-f", "main")
+
+    tracked = _git(path, "ls-files", "-z", text=True).stdout.split("\0")
+    tracked = sorted(p for p in tracked if p)
+    targets = rng.sample(tracked, min(changed_files, len(tracked)))
+    for path_ in targets:
+        full = os.path.join(path, path_)
+        with open(full, encoding="utf-8") as f:
+            lines = f.readlines()
+        for _ in range(diff_lines):
+            lines.insert(rng.randrange(1, len(lines) + 1), _line(rng, rng.randrange(lines_per_file)))
+        with open(full, "w", encoding="utf-8") as f:
+            f.writelines(lines)
+    _git(path, "add", "-A")
+
+    # A couple of unstaged edits and untracked files so status has every kind of entry
+    for path_ in targets[:max(1, len(targets) // 10)]:
+        with open(os.path.join(path, path_), "a", encoding="utf-8") as f:
+            f.write(_line(rng, 0))
+    for n in range(untracked):
+        with open(os.path.join(path, f"scratch_{n}.txt"), "w", encoding="utf-8") as f:
+            f.write("notes\n")
+    return path
+
+def _history_stream(commits):
+    yield b"blob\nmark :1\ndata 6\nhello\n"
+    for i in range(commits):
+        subject = subject_for(i)
+        if i % 97 == 0:
+            subject = f"{TYPES[i % len(TYPES)]}!: drop legacy option {i}"
+        message = subject + ("\n\nBREAKING CHANGE: config moved\n" if i % 101 == 0 else "\n")
+        yield _commit_header(i, message) + (b"M 100644 :1 README\n\n" if i == 0 else b"\n")
+    yield b"done\n"
+
+def build_history_repo(path, commits=1_000_000):
+    """Commit-only history (every commit shares one tree); reuses `path` if it already matches."""
+    if os.path.isdir(os.path.join(path, ".git")):
+        have = subprocess.run(["git", "-C", path, "rev-list", "--count", "main"],
+                              capture_output=True, text=True)
+        if have.returncode == 0 and int(have.stdout) == commits:
+            return path
+        raise FileExistsError(f"{path} exists with a different history")
+    _init(path)
+    _fast_import(path, _history_stream(commits))
+    return path
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("path")
+    parser.add_argument("--files", type=int, default=500)
+    parser.add_argument("--commits", type=int, default=200)
+    parser.add_argument("--diff-lines", type=int, default=40)
+    parser.add_argument("--changed-files", type=int, default=50)
+    parser.add_argument("--history-only", action="store_true",
+                        help="commit-only history of --commits commits")
+    args = parser.parse_args()
+    if args.history_only:
+        build_history_repo(args.path, args.commits)
+    else:
+        build_synthetic_repo(args.path, args.files, args.commits, args.diff_lines, args.changed_files)
+    print(args.path)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+import hashlib
+import json
+import os
+import sqlite3
+import subprocess
+import threading
+import time
+from git_backend import get_backend
+
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "commit-message-generator")
+CACHE_PATH = os.path.join(CACHE_DIR, "suggestions.sqlite3")
+DEFAULT_MAX_BYTES = 16 * 1024 * 1024
+
+def staged_tree_id(repo_path=None):
+    # Tree object id of the index: identical staged content -> identical id
+    try:
+        result = get_backend().run(["write-tree"], repo_path, capture_output=True, text=True, check=True)
+    except (OSError, subprocess.CalledProcessError):
+        return None  # e.g. unmerged paths
+    return result.stdout.strip() or None
+
+def cache_key(tree_id, model_name, template_version, seed_examples, **options):
+    # options: anything else that changes the output (candidate count, diff budget, backend)
+    if isinstance(seed_examples, (list, tuple)):
+        seed_examples = "\n".join(seed_examples)
+    key = [tree_id, model_name, template_version, seed_examples or ""]
+    if options:
+        key.append(sorted(options.items()))
+    payload = json.dumps(key)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+class SuggestionCache:
+    # On-disk suggestion cache with least-recently-used eviction once max_bytes is exceeded
+    def __init__(self, path=CACHE_PATH, max_bytes=DEFAULT_MAX_BYTES):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, timeout=5, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS suggestions ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS suggestions_lru ON suggestions (last_used)")
+        self._db.commit()
+
+    def get(self, key):
+        with self._lock:
+            row = self._db.execute("SELECT value FROM suggestions WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            self._db.execute("UPDATE suggestions SET last_used = ? WHERE key = ?", (time.time(), key))
+            self._db.commit()
+        return json.loads(row[0])
+
+    def put(self, key, value):
+        data = json.dumps(value)
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO suggestions (key, value, size, last_used) VALUES (?, ?, ?, ?)",
+                (key, data, len(data) + len(key), time.time())
+            )
+            self._evict()
+            self._db.commit()
+
+    def _evict(self):
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM suggestions").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        doomed = []
+        for key, size in self._db.execute("SELECT key, size FROM suggestions ORDER BY last_used"):
+            if total <= self.max_bytes:
+                break
+            doomed.append((key,))
+            total -= size
+        self._db.executemany("DELETE FROM suggestions WHERE key = ?", doomed)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+_cache = None
+
+def get_cache():
+    # Shared instance; None if the cache database cannot be opened
+    global _cache
+    if _cache is None:
+        try:
+            _cache = SuggestionCache()
+        except (OSError, sqlite3.Error):
+            return None
+    return _cache
+
+def lookup(key):
+    cache = get_cache() if key else None
+    if cache is None:
+        return None
+    try:
+        return cache.get(key)
+    except sqlite3.Error:
+        return None
+
+def store(key, value):
+    cache = get_cache() if key else None
+    if cache is None:
+        return
+    try:
+        cache.put(key, value)
+    except sqlite3.Error:
+        pass
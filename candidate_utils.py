@@ -0,0 +1,69 @@
+# candidate_utils.py
+"""Precompiled, single-pass normalization of raw model outputs into commit candidates.
+
+Behaviour is bit-for-bit the same as the original clean_candidate_line + dedupe loop
+(see benchmarks/bench_normalizer.py, which checks that and times both).
+"""
+import re
+
+MAX_WORDS = 12
+
+_NUMBER_PREFIX = re.compile(r'^[\s\-\)\(\[\]]*\d+[\.\)]\s*')
+_BULLET_PREFIX = re.compile(r'^[\s\-\*]+')
+_SENTENCE_END = re.compile(r'(?<=\w)\.\s')
+# One alternation instead of a separate case-normalizing pass per commit type
+_TYPE_PREFIX = re.compile(r'^(feat|FEAT|fix|FIX|chore|CHORE|docs|DOCS|refactor|REFACTOR)\s*:')
+_FIX_HINT = re.compile(r'\bfix|bug|error|typo\b', re.I)
+_TRAILING_JUNK = re.compile(r'[_\-,\s]{3,}$')
+_NON_PRINTABLE = re.compile(r'[^\x09\x0A\x0D\x20-\x7E]')
+
+def post_process_continuation(out):
+    if not out:
+        return ""
+    out = _TRAILING_JUNK.sub("", out).strip()
+    out = _NON_PRINTABLE.sub("", out)
+    return out.strip()
+
+def clean_candidate_line(line):
+    if not line:
+        return ""
+    s = line.strip()
+    lower = s.lower()
+    # Drop junk echoes
+    if lower.startswith("exception") or "return None" in s or "print(" in s or "traceback" in lower or s.startswith("#"):
+        return ""
+    s = _NUMBER_PREFIX.sub('', s, count=1)
+    s = _BULLET_PREFIX.sub('', s, count=1)
+    s = _SENTENCE_END.split(s, 1)[0].strip()
+    m = _TYPE_PREFIX.match(s)
+    if m:
+        s = m.group(1).lower() + ":" + s[m.end():]
+    if s.lower().startswith("changed files"):
+        return ""
+    if ":" not in s:
+        s = ("fix: " if _FIX_HINT.search(s) else "feat: ") + s
+    words = s.split()
+    if len(words) > MAX_WORDS:
+        s = " ".join(words[:MAX_WORDS])
+    return s.strip()
+
+def normalize_candidates(outputs):
+    """Clean every line of every output and dedupe case-insensitively, in one pass.
+
+    Returns candidates in first-seen order. Lines that lose their ':' when cut to
+    MAX_WORDS are dropped, exactly like the original dedupe loop.
+    """
+    seen = set()
+    deduped = []
+    for out in outputs:
+        if not out:
+            continue
+        for line in out.splitlines():
+            c = clean_candidate_line(line)
+            if not c or ":" not in c:
+                continue
+            key = c.lower()
+            if key not in seen:
+                seen.add(key)
+                deduped.append(c)
+    return deduped
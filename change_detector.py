@@ -0,0 +1,126 @@
+import os
+import time
+
+def resolve_git_dir(path):
+    dot_git = os.path.join(path, ".git")
+    if os.path.isfile(dot_git):
+        # Worktrees and submodules point at the real git dir
+        with open(dot_git, "r", encoding="utf-8", errors="ignore") as f:
+            line = f.read().strip()
+        if line.startswith("gitdir:"):
+            return os.path.normpath(os.path.join(path, line[len("gitdir:"):].strip()))
+    return dot_git
+
+def _stat(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+# The tree walk is the expensive part: run it at most every WALK_INTERVAL seconds and
+# never spend more than 1/WALK_COST_FACTOR of the time walking
+WALK_INTERVAL = 3.0
+WALK_COST_FACTOR = 20
+
+class ChangeDetector:
+    # Cheap stat-only fingerprint of a repo so idle refreshes can skip git entirely.
+    # .git/index, .git/HEAD and the checked-out ref are checked on every call; the working
+    # tree walk (minus ignored directories) is throttled. Trees over max_entries are never
+    # walked again and fall back to a fixed-interval refresh.
+    def __init__(self, path, max_entries=100_000, fallback_interval=8.0, walk_interval=WALK_INTERVAL):
+        self.path = path
+        self.git_dir = resolve_git_dir(path)
+        self.max_entries = max_entries
+        self.fallback_interval = fallback_interval
+        self.walk_interval = walk_interval
+        self.fingerprint = None
+        self.last_change = 0.0
+        self.tree = None
+        self.too_large = False
+        self.next_walk = 0.0
+        self._ignored = set()
+        self._ignore_stamp = None
+
+    def _ref_files(self):
+        head = os.path.join(self.git_dir, "HEAD")
+        files = [head, os.path.join(self.git_dir, "index")]
+        try:
+            with open(head, "r", encoding="utf-8", errors="ignore") as f:
+                ref = f.read().strip()
+        except OSError:
+            return files
+        if ref.startswith("ref: "):
+            common = self.git_dir
+            commondir = os.path.join(self.git_dir, "commondir")
+            if os.path.isfile(commondir):
+                with open(commondir, "r", encoding="utf-8", errors="ignore") as f:
+                    common = os.path.normpath(os.path.join(self.git_dir, f.read().strip()))
+            files.append(os.path.join(common, ref[len("ref: "):]))
+            files.append(os.path.join(common, "packed-refs"))
+        return files
+
+    def _ignored_dirs(self):
+        # Ignored directories (node_modules/, build/, ...) from git; re-read when the
+        # top-level ignore files change
+        stamp = (_stat(os.path.join(self.path, ".gitignore")),
+                 _stat(os.path.join(self.git_dir, "info", "exclude")))
+        if stamp != self._ignore_stamp:
+            from git_backend import get_backend
+            self._ignore_stamp = stamp
+            result = get_backend().run(["ls-files", "-z", "--others", "--ignored", "--exclude-standard",
+                                        "--directory"], self.path, capture_output=True)
+            self._ignored = {os.path.normpath(os.path.join(self.path, os.fsdecode(p)))
+                             for p in result.stdout.split(b"\0") if p.endswith(b"/")}
+        return self._ignored
+
+    def _tree_fingerprint(self):
+        # (entries, total size, newest mtime); None when the tree is too big to walk cheaply
+        ignored = self._ignored_dirs()
+        count, size, newest = 0, 0, 0
+        stack = [self.path]
+        while stack:
+            try:
+                it = os.scandir(stack.pop())
+            except OSError:
+                continue
+            with it:
+                for entry in it:
+                    if entry.name == ".git":
+                        continue
+                    count += 1
+                    if count > self.max_entries:
+                        return None
+                    try:
+                        st = entry.stat(follow_symlinks=False)
+                    except OSError:
+                        continue
+                    newest = max(newest, st.st_mtime_ns)
+                    if entry.is_dir(follow_symlinks=False):
+                        if os.path.normpath(entry.path) not in ignored:
+                            stack.append(entry.path)
+                    else:
+                        size += st.st_size
+        return (count, size, newest)
+
+    def compute(self):
+        now = time.monotonic()
+        if not self.too_large and now >= self.next_walk:
+            started = time.perf_counter()
+            self.tree = self._tree_fingerprint()
+            self.too_large = self.tree is None
+            self.next_walk = now + max(self.walk_interval, WALK_COST_FACTOR * (time.perf_counter() - started))
+        return (tuple(_stat(p) for p in self._ref_files()), self.tree)
+
+    def changed(self):
+        fingerprint = self.compute()
+        now = time.monotonic()
+        if fingerprint != self.fingerprint:
+            self.fingerprint = fingerprint
+            self.last_change = now
+            return True
+        if self.too_large and now - self.last_change >= self.fallback_interval:
+            # Tree too large to fingerprint: fall back to the old fixed-interval refresh
+            self.last_change = now
+            return True
+        return False
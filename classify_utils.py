@@ -0,0 +1,135 @@
+# classify_utils.py
+"""Rule-based commit-type classifier for when no model is available.
+
+Walks the diff once, looking only at added/removed lines and file paths. Lines are
+split into words (camelCase and snake_case aware) and every word is looked up in one
+keyword table, an Aho-Corasick style multi-pattern match at word boundaries: `prefix`
+is not a fix, `fix_parser` and `fixParser` are, and context lines never count.
+Linear in the diff size; needs no transformers.
+"""
+import io
+import os
+import re
+import subprocess
+from collections import Counter
+
+from git_backend import get_backend
+import trace_utils
+
+# type -> (weight per keyword hit, keywords)
+TYPE_KEYWORDS = {
+    "fix": (3.0, ["fix", "fixes", "fixed", "bug", "bugs", "bugfix", "hotfix", "error", "errors",
+                  "crash", "regression", "typo"]),
+    "test": (2.0, ["test", "tests", "assert", "pytest", "unittest", "mock", "fixture", "fixtures"]),
+    "perf": (3.0, ["perf", "performance", "optimize", "optimise", "optimized", "optimised", "optimizes",
+                   "optimization", "optimisation", "optimizations", "optimizing", "faster", "speedup", "latency"]),
+    "docs": (2.0, ["doc", "docs", "readme", "docstring", "documentation"]),
+    "refactor": (2.5, ["refactor", "refactored", "cleanup", "rename", "renamed", "simplify", "restructure"]),
+    "style": (2.0, ["style", "lint", "linter", "format", "formatting", "whitespace", "prettier"]),
+    "chore": (2.0, ["dependency", "dependencies", "version", "bump", "upgrade", "release"]),
+}
+# Every spelling we look up -> commit type (lower, Capitalized and UPPER, so no per-word lowercasing)
+KEYWORD_TYPES = {
+    variant: t
+    for t, (_, words) in TYPE_KEYWORDS.items()
+    for w in words
+    for variant in (w, w.capitalize(), w.upper())
+}
+KEYWORD_SET = frozenset(KEYWORD_TYPES)
+WORD_RE = re.compile(r'[A-Z]?[a-z]+|[A-Z]+(?![a-z])')
+TEST_PATH_RE = re.compile(r'(^|/)(tests?|spec|__tests__)/|(^|/)test_[^/]*$|_test\.\w+$|\.(spec|test)\.\w+$')
+DOC_EXTS = (".md", ".rst", ".adoc")
+CHORE_FILES = {"requirements.txt", "package.json", "pyproject.toml", "setup.py", "setup.cfg",
+               "Cargo.toml", "go.mod", "Gemfile", "package-lock.json", "yarn.lock", "poetry.lock"}
+GENERIC_DIRS = {"src", "lib", "app", "pkg", "source", "internal"}
+DEFAULT_TYPE = "feat"
+
+class Classification:
+    def __init__(self, scores, scope, files):
+        self.scores = scores
+        self.scope = scope
+        self.files = files
+
+    @property
+    def type(self):
+        best = max(self.scores.items(), key=lambda kv: kv[1])
+        return best[0] if best[1] > 0 else DEFAULT_TYPE
+
+    def message(self, description="update based on staged diff"):
+        scope = f"({self.scope})" if self.scope else ""
+        return f"{self.type}{scope}: {description}"
+
+def path_scores(path, scores):
+    name = os.path.basename(path)
+    if TEST_PATH_RE.search(path):
+        scores["test"] += 4.0
+    elif path.endswith(DOC_EXTS) or path.startswith("docs/") or name.lower().startswith("readme"):
+        scores["docs"] += 4.0
+    elif name in CHORE_FILES:
+        scores["chore"] += 3.0
+
+def infer_scope(paths):
+    # Most common meaningful directory (or file stem for top-level files) if it covers most paths
+    if not paths:
+        return ""
+    counts = Counter()
+    for path in paths:
+        parts = [p for p in path.split("/")[:-1] if p not in GENERIC_DIRS]
+        counts[parts[0] if parts else os.path.splitext(os.path.basename(path))[0]] += 1
+    scope, hits = counts.most_common(1)[0]
+    return scope if hits * 5 >= len(paths) * 3 else ""
+
+def classify_lines(lines):
+    """Classify an iterable of diff lines (str). Returns a Classification."""
+    scores = {t: 0.0 for t in TYPE_KEYWORDS}
+    scores[DEFAULT_TYPE] = 0.0
+    weights = {t: w for t, (w, _) in TYPE_KEYWORDS.items()}
+    hits = Counter()
+    paths = []
+    for line in lines:
+        first = line[:1]
+        if first == "+" or first == "-":
+            if line.startswith("+++") or line.startswith("---"):
+                continue
+            words = WORD_RE.findall(line)
+            if KEYWORD_SET.isdisjoint(words):
+                continue
+            for word in words:
+                t = KEYWORD_TYPES.get(word)
+                if t:
+                    hits[t] += 1
+        elif first == "d" and line.startswith("diff --git "):
+            path = line.rsplit(" b/", 1)[-1].rstrip("\n")
+            paths.append(path)
+            path_scores(path, scores)
+        elif first == "n" and line.startswith("new file mode"):
+            scores[DEFAULT_TYPE] += 1.0
+    for t, n in hits.items():
+        # Diminishing returns so one noisy file cannot swamp everything else
+        scores[t] += weights[t] * (n ** 0.5)
+    return Classification(scores, infer_scope(paths), paths)
+
+def classify_text(diff_text):
+    return classify_lines(io.StringIO(diff_text))
+
+def _bounded(lines, max_bytes):
+    read = 0
+    for line in lines:
+        read += len(line)
+        if read > max_bytes:
+            return
+        yield line
+
+def classify_staged(repo_path=None, max_bytes=None):
+    # Streams the staged diff (or its first max_bytes) through the classifier; memory stays flat
+    with trace_utils.span("git diff"):
+        proc = get_backend().popen(["diff", "--staged", "--no-color", "--unified=0"], repo_path,
+                                   stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                                   text=True, encoding="utf-8", errors="ignore")
+        try:
+            return classify_lines(_bounded(proc.stdout, max_bytes) if max_bytes else proc.stdout)
+        finally:
+            if proc.poll() is None:
+                proc.kill()
+            proc.stdout.close()
+            proc.wait()
@@ -2,24 +2,23 @@
 import os
 import re
 import subprocess
+import trace_utils
 import tkinter as tk
 from tkinter import ttk
-from datetime import datetime
+from git_backend import get_backend
+from git_utils import read_snapshot
+from ai_utils import ModelLoader, generate_candidates
+from classify_utils import classify_text
+import cache_utils as suggestion_cache
+from cache_utils import staged_tree_id, cache_key
 
 # -----------------------------
 # AI setup (graceful fallback)
 # -----------------------------
-generator = None
-try:
-    from transformers import pipeline
-    # Load once at startup; you can swap model to "bigcode/starcoderbase"
-    generator = pipeline(
-        "text-generation",
-        model="bigcode/santacoder",
-        device=0  # set to -1 for CPU if no GPU
-    )
-except Exception:
-    generator = None  # Will fallback to rule-based suggestion
+# Loaded lazily on a background thread after the window is shown (see watch_model);
+# suggest_commit_message uses the rule-based fallback until it is ready.
+# You can swap model to "bigcode/starcoderbase".
+model_loader = ModelLoader("bigcode/santacoder")
 
 # -----------------------------
 # Repo helpers (git_utils)
@@ -50,9 +49,9 @@ class GitUtils:
     def _git_cmd(args):
         if not GitUtils.repo_path:
             return subprocess.CompletedProcess(args, 1, "", "No repo selected")
-        return subprocess.run(
-            args,
-            cwd=GitUtils.repo_path,
+        return get_backend().run(
+            args[1:] if args[:1] == ["git"] else args,
+            GitUtils.repo_path,
             capture_output=True,
             text=True,
             encoding="utf-8",
@@ -61,11 +60,19 @@ class GitUtils:
         )
 
     @staticmethod
-    def check_changes(status_label, canvas, light):
+    def snapshot():
+        if not GitUtils.repo_path:
+            return None
+        try:
+            return read_snapshot(GitUtils.repo_path)
+        except subprocess.CalledProcessError:
+            return None
+
+    @staticmethod
+    def check_changes(status_label, canvas, light, snapshot=None):
         # Show if there are staged/unstaged changes
-        diff_unstaged = GitUtils._git_cmd(["git", "diff"]).stdout.strip()
-        diff_staged = GitUtils._git_cmd(["git", "diff", "--staged"]).stdout.strip()
-        if diff_unstaged or diff_staged:
+        snapshot = snapshot or GitUtils.snapshot()
+        if snapshot is not None and not snapshot.is_clean:
             status_label.config(text="Repo status: changes detected")
             canvas.itemconfig(light, fill="orange")
         else:
@@ -73,53 +80,34 @@ class GitUtils:
             canvas.itemconfig(light, fill="green")
 
     @staticmethod
-    def load_files(files_frame):
+    def load_files(files_frame, snapshot=None):
         # Clear frame
         for w in files_frame.winfo_children():
             w.destroy()
         # List changed files
-        result = GitUtils._git_cmd(["git", "status", "--porcelain"])
-        lines = result.stdout.splitlines()
-        if not lines:
+        snapshot = snapshot or GitUtils.snapshot()
+        if snapshot is None or snapshot.is_clean:
             ttk.Label(files_frame, text="No changed files").pack(anchor="w")
             return
-        for line in lines:
-            ttk.Label(files_frame, text=line).pack(anchor="w")
+        for status, path, orig in snapshot.entries:
+            ttk.Label(files_frame, text=f"{status} {orig} -> {path}" if orig else f"{status} {path}").pack(anchor="w")
 
     @staticmethod
     def load_history(history_tree):
         # Clear existing
         for item in history_tree.get_children():
             history_tree.delete(item)
-        result = GitUtils._git_cmd(["git", "log", "--pretty=format:%h|%s", "-n", "20"])
-        for row in result.stdout.splitlines():
-            if "|" in row:
-                sha, msg = row.split("|", 1)
-                history_tree.insert("", "end", values=(sha, msg))
+        if not GitUtils.repo_path:
+            return
+        try:
+            rows = get_backend().log_subjects(GitUtils.repo_path, 20)
+        except subprocess.CalledProcessError:
+            return
+        for sha, msg in rows:
+            history_tree.insert("", "end", values=(sha, msg))
 
 git_utils = GitUtils  # alias for consistency
 
-# -----------------------------
-# Export helpers (export_utils)
-# -----------------------------
-def export_summary(repo_path):
-    if not repo_path:
-        return
-    result = subprocess.run(
-        ["git", "log", "--pretty=format:%h %an %ad %s", "--date=short", "-n", "100"],
-        cwd=repo_path,
-        capture_output=True,
-        text=True,
-        encoding="utf-8",
-        errors="ignore"
-    )
-    out = result.stdout
-    ts = datetime.now().strftime("%Y%m%d-%H%M%S")
-    fname = os.path.join(repo_path, f"commit-history-{ts}.txt")
-    with open(fname, "w", encoding="utf-8") as f:
-        f.write(out)
-    print(f"Exported history to {fname}")
-
 # -----------------------------
 # Commit helpers (commit_utils)
 # -----------------------------
@@ -151,8 +139,8 @@ def commit_now(repo_path, preview_widget, file_vars=None, on_status=None, on_fil
         msg = "chore: update project files"
 
     # Stage all and commit
-    subprocess.run(["git", "add", "-A"], cwd=repo_path)
-    subprocess.run(["git", "commit", "-m", msg], cwd=repo_path)
+    get_backend().run(["add", "-A"], repo_path)
+    get_backend().run(["commit", "-m", msg], repo_path)
 
     # Refresh UI
     if on_status: on_status()
@@ -163,61 +151,60 @@ def commit_now(repo_path, preview_widget, file_vars=None, on_status=None, on_fil
 # -----------------------------
 # AI suggestion (ai_utils)
 # -----------------------------
-def get_recent_commits(repo_path, n=10):
+def get_recent_commits(repo_path, n=10, paths=None):
     if not repo_path:
         return ""
-    result = subprocess.run(
-        ["git", "log", "--pretty=format:%s", "-n", str(n)],
-        cwd=repo_path,
-        capture_output=True,
-        text=True,
-        encoding="utf-8",
-        errors="ignore"
-    )
-    return result.stdout
+    # Prefer past commits that touched the same files; the refresh worker keeps the index current
+    similar = similar_subjects(repo_path, paths, k=n, update=False) if paths else []
+    if similar:
+        return "\n".join(similar)
+    try:
+        return "\n".join(subject for _, subject in get_backend().log_subjects(repo_path, n))
+    except subprocess.CalledProcessError:
+        return ""
 
-def suggest_commit_message(diff_text: str, style_examples: str = "") -> str:
-    # If no generator, fallback to rule-based guess
+# Bump when the prompt below changes so cached suggestions are not reused
+SUGGEST_TEMPLATE_VERSION = "1"
+
+def suggest_commit_message(diff_text: str, style_examples: str = "", repo_path: str = "") -> str:
+    # If the model is not ready (still loading or failed), fallback to rule-based guess
+    generator = model_loader.generator
     if generator is None:
-        # Simple heuristic
-        lower = diff_text.lower()
-        if "fix" in lower or "bug" in lower or "error" in lower:
-            base = "fix"
-        elif "test" in lower or "assert" in lower:
-            base = "test"
-        elif "perf" in lower or "optimiz" in lower:
-            base = "perf"
-        elif "doc" in lower or "readme" in lower:
-            base = "docs"
-        elif "refactor" in lower or "cleanup" in lower:
-            base = "refactor"
-        elif "style" in lower or "lint" in lower or "format" in lower:
-            base = "style"
-        elif "dependenc" in lower or "version" in lower:
-            base = "chore"
-        else:
-            base = "feat"
-        return f"{base}: update based on staged diff"
+        # Single-pass weighted classifier over +/- lines and paths
+        return classify_text(diff_text).message()
 
-    # Strong prompt with examples
-    prompt = (
+    # Strong prompt with examples; the header only changes with the examples
+    header = (
         (f"Here are recent commit messages to match style:\n{style_examples}\n\n" if style_examples else "")
         + "Write a Conventional Commit message (feat, fix, docs, style, refactor, test, chore, perf) "
           "summarizing the following diff:\n"
-        + diff_text
-        + "\nMessage:"
     )
+    prompt = header + diff_text + "\nMessage:"
+
+    # Same staged tree + model + prompt template + examples -> reuse the earlier suggestion
+    key = None
+    if repo_path:
+        tree_id = staged_tree_id(repo_path)
+        if tree_id:
+            key = cache_key(tree_id, model_loader.model_name, SUGGEST_TEMPLATE_VERSION, style_examples,
+                            diff_bytes=PREVIEW_DIFF_BYTES)
+            cached = suggestion_cache.lookup(key)
+            if cached:
+                return cached
 
     try:
-        result = generator(
+        suggestion = generate_candidates(
+            generator,
             prompt,
+            n=1,
+            prefix=header,
             max_new_tokens=50,
             truncation=True,
             do_sample=True,
             temperature=0.6,
-            top_p=0.9
-        )
-        suggestion = result[0]["generated_text"]
+            top_p=0.9,
+            stop_lines=1  # only the first line after "Message:" is used
+        )[0]
         if "Message:" in suggestion:
             suggestion = suggestion.split("Message:")[-1].strip()
         # Allow typical commit punctuation
@@ -225,6 +212,8 @@ def suggest_commit_message(diff_text: str, style_examples: str = "") -> str:
         # Sanity: ensure it starts with a type; if not, prepend feat:
         if not re.match(r'^(feat|fix|docs|style|refactor|test|chore|perf)\s*:?', suggestion):
             suggestion = f"feat: {suggestion}" if suggestion else "chore: update project files"
+        if suggestion:
+            suggestion_cache.store(key, suggestion)
         return suggestion or "chore: update project files"
     except Exception:
         return "chore: update project files"
@@ -261,12 +250,7 @@ repo_frame.grid(row=0, column=0, columnspan=3, padx=10, pady=10, sticky="ew")
 
 ttk.Button(
     repo_frame, text="Choose Repo",
-    command=lambda: git_utils.choose_repo(
-        repo_label,
-        lambda: git_utils.check_changes(status_label, canvas, light),
-        lambda: git_utils.load_files(files_frame),
-        lambda: git_utils.load_history(history_tree)
-    )
+    command=lambda: git_utils.choose_repo(repo_label, lambda: refresh_worker.request())
 ).grid(row=0, column=0, padx=5, pady=5)
 
 repo_label = ttk.Label(repo_frame, text="Repo:")
@@ -276,7 +260,9 @@ repo_status_label = ttk.Label(repo_frame, text="⚠️ No repository selected",
 repo_status_label.grid(row=0, column=2, padx=5, pady=5, sticky="w")
 
 ttk.Button(repo_frame, text="Export History",
-           command=lambda: export_summary(git_utils.repo_path)).grid(row=0, column=3, padx=5, pady=5)
+           command=lambda: export_summary(git_utils.repo_path, widget=repo_frame)).grid(row=0, column=3, padx=5, pady=5)
+ttk.Button(repo_frame, text="Export CSV",
+           command=lambda: export_history_file(git_utils.repo_path, widget=repo_frame)).grid(row=0, column=4, padx=5, pady=5)
 
 # Commit details
 import tkinter as tk
@@ -284,11 +270,17 @@ from tkinter import ttk
 
 # Import helper modules
 import git_utils
-from commit_utils import generate_commit, commit_now
-from export_utils import export_summary
+from commit_utils import generate_commit, commit_now, cancel_commit
+from export_utils import export_history_file, export_summary
+from refresh_worker import RefreshWorker
+from diff_utils import changed_paths, read_staged_diff
+from history_index import similar_subjects
 
 commit_types = ["feat", "fix", "docs", "style", "refactor", "test", "chore", "perf"]
 
+# Spans and errors go to the same rotating log as debug_commit_ai.py
+trace_utils.setup_logging()
+
 # --- Main window setup ---
 root = tk.Tk()
 root.title("Commit Message Generator")
@@ -310,11 +302,7 @@ repo_frame.grid(row=0, column=0, columnspan=3, padx=10, pady=10, sticky="ew")
 
 # Choose Repo button
 ttk.Button(repo_frame, text="Choose Repo",
-           command=lambda: git_utils.choose_repo(
-               repo_label,
-               lambda: git_utils.check_changes(status_label, canvas, light),
-               lambda: git_utils.load_files(files_frame),
-               lambda: git_utils.load_history(history_tree))
+           command=lambda: git_utils.choose_repo(repo_label, lambda: refresh_worker.request())
            ).grid(row=0, column=0, padx=5, pady=5)
 
 # Repo label
@@ -327,7 +315,9 @@ repo_status_label.grid(row=0, column=2, padx=5, pady=5, sticky="w")
 
 # Export History button
 ttk.Button(repo_frame, text="Export History",
-           command=lambda: export_summary(git_utils.repo_path)).grid(row=0, column=3, padx=5, pady=5)
+           command=lambda: export_summary(git_utils.repo_path, widget=repo_frame)).grid(row=0, column=3, padx=5, pady=5)
+ttk.Button(repo_frame, text="Export CSV",
+           command=lambda: export_history_file(git_utils.repo_path, widget=repo_frame)).grid(row=0, column=4, padx=5, pady=5)
 
 # --- Commit details ---
 commit_frame = ttk.LabelFrame(root, text="Commit Details", padding=10)
@@ -354,11 +344,9 @@ ttk.Button(commit_frame, text="Generate",
 
 ttk.Button(commit_frame, text="Commit Now",
            command=lambda: commit_now(
-               git_utils.repo_path, preview_text, None,
-               lambda: git_utils.check_changes(status_label, canvas, light),
-               lambda: git_utils.load_files(files_frame),
-               lambda: git_utils.load_history(history_tree),
-               repo_status_label
+               git_utils.repo_path, preview_text, git_utils.file_vars,
+               lambda: refresh_worker.request(),
+               repo_status_label, git_utils.last_snapshot
            )
            ).grid(row=4, column=1, padx=5, pady=10)
 
@@ -401,40 +389,78 @@ status_label.pack(side="left", padx=5)
 canvas = tk.Canvas(status_frame, width=20, height=20, bg="#2b2b2b", highlightthickness=0)
 canvas.pack(side="right", padx=5)
 light = canvas.create_oval(2, 2, 18, 18, fill="grey")
+ai_status_label = ttk.Label(status_frame, text=model_loader.describe(), foreground="orange")
+ai_status_label.pack(side="right", padx=15)
+
+# Latency: p50/p95 of the slowest recent spans (git, model load, prompt, generation, export)
+LATENCY_POLL_MS = 2000
+LATENCY_SPANS = 6
+
+def export_trace():
+    from tkinter import filedialog
+    path = filedialog.asksaveasfilename(defaultextension=".json", initialfile="commit-ai-trace.json")
+    if path:
+        trace_utils.tracer.export_chrome(path)
+
+latency_frame = ttk.LabelFrame(root, text="Latency (p50 / p95)", padding=10)
+latency_frame.grid(row=5, column=0, columnspan=3, padx=10, pady=(0, 10), sticky="ew")
+latency_label = ttk.Label(latency_frame, text="No timings yet", font=("Consolas", 9), wraplength=720)
+latency_label.pack(side="left", padx=5)
+ttk.Button(latency_frame, text="Export Trace", command=export_trace).pack(side="right", padx=5)
+
+def refresh_latency():
+    stats = sorted(trace_utils.tracer.summary().items(), key=lambda kv: kv[1]["p95_ms"], reverse=True)
+    parts = [f"{name} {s['p50_ms']:.0f}/{s['p95_ms']:.0f} ms" for name, s in stats[:LATENCY_SPANS]]
+    latency_label.config(text="   ".join(parts) or "No timings yet")
+    root.after(LATENCY_POLL_MS, refresh_latency)
+
+refresh_latency()
+
+# Model warm-up: starts once the main loop is running, status label follows the loader state
+def watch_model():
+    colors = {ModelLoader.READY: "green", ModelLoader.FAILED: "red"}
+    ai_status_label.config(text=model_loader.describe(), foreground=colors.get(model_loader.state, "orange"))
+    if model_loader.state in (ModelLoader.IDLE, ModelLoader.LOADING):
+        root.after(500, watch_model)
+
+root.after(200, lambda: [model_loader.start(), watch_model()])
+
+# Auto refresh: git runs on a worker thread, widgets are updated back on the Tk thread
+# Polling only stats files; git runs when the repo fingerprint changes (or on Ctrl+R / Choose Repo)
+REFRESH_POLL_MS = 1000
+
+refresh_worker = RefreshWorker(
+    root,
+    lambda force: git_utils.collect_state(git_utils.repo_path, force),
+    lambda state: git_utils.apply_state(state, status_label, canvas, light, files_frame, history_tree)
+)
 
-# Auto refresh
 def auto_refresh():
     if git_utils.repo_path:
-        git_utils.check_changes(status_label, canvas, light)
-        git_utils.load_files(files_frame)
-        git_utils.load_history(history_tree)
+        refresh_worker.request(force=False)
         repo_status_label.config(text="✅ Repository ready", foreground="green")
     else:
         repo_status_label.config(text="⚠️ No repository selected", foreground="orange")
-    root.after(8000, auto_refresh)
+    root.after(REFRESH_POLL_MS, auto_refresh)
 
 auto_refresh()
 
 # AI preview helper
+PREVIEW_DIFF_BYTES = 8000
+
 def preview_ai_suggestion(preview_widget):
     if not git_utils.repo_path:
         suggestion = "⚠️ No repository selected."
     else:
-        subprocess.run(["git", "add", "-A"], cwd=git_utils.repo_path)
-        result = subprocess.run(
-            ["git", "diff", "--staged"],
-            cwd=git_utils.repo_path,
-            capture_output=True,
-            text=True,
-            encoding="utf-8",
-            errors="ignore"
-        )
-        diff_text = result.stdout
+        get_backend().run(["add", "-A"], git_utils.repo_path)
+        diff_text = read_staged_diff(git_utils.repo_path, max_bytes=PREVIEW_DIFF_BYTES, unified=3)
         if not diff_text.strip():
             suggestion = "⚠️ No changes found in repo."
         else:
-            history_examples = get_recent_commits(git_utils.repo_path, n=10)
-            suggestion = suggest_commit_message(diff_text, style_examples=history_examples)
+            staged_paths = changed_paths(["diff", "--staged"], git_utils.repo_path)
+            history_examples = get_recent_commits(git_utils.repo_path, n=10, paths=staged_paths)
+            suggestion = suggest_commit_message(diff_text, style_examples=history_examples,
+                                                repo_path=git_utils.repo_path)
 
     preview_widget.config(state="normal")
     preview_widget.delete("1.0", "end")
@@ -443,24 +469,14 @@ def preview_ai_suggestion(preview_widget):
 
 # Hotkeys
 root.bind("<Control-Return>", lambda e: commit_now(
-    git_utils.repo_path, preview_text, None,
-    lambda: git_utils.check_changes(status_label, canvas, light),
-    lambda: git_utils.load_files(files_frame),
-    lambda: git_utils.load_history(history_tree),
-    repo_status_label
+    git_utils.repo_path, preview_text, git_utils.file_vars,
+    lambda: refresh_worker.request(),
+    repo_status_label, git_utils.last_snapshot
 ))
+root.bind("<Escape>", lambda e: cancel_commit())
 root.bind("<Control-g>", lambda e: generate_commit(type_var, scope_entry, desc_entry, breaking_var, preview_text))
-root.bind("<Control-r>", lambda e: [
-    git_utils.check_changes(status_label, canvas, light),
-    git_utils.load_files(files_frame),
-    git_utils.load_history(history_tree)
-])
-root.bind("<Control-o>", lambda e: git_utils.choose_repo(
-    repo_label,
-    lambda: git_utils.check_changes(status_label, canvas, light),
-    lambda: git_utils.load_files(files_frame),
-    lambda: git_utils.load_history(history_tree)
-))
+root.bind("<Control-r>", lambda e: refresh_worker.request())
+root.bind("<Control-o>", lambda e: git_utils.choose_repo(repo_label, refresh_worker.request))
 
 root.mainloop()
 print("App reached the end of the script.")
@@ -1,6 +1,9 @@
-import subprocess
+from staging_utils import StagingJob, skip_staged_deletions
 from tkinter import messagebox, END
 
+# Staging/commit job currently running, if any
+_active = None
+
 def generate_commit(type_var, scope_entry, desc_entry, breaking_var, preview_text):
     ctype = type_var.get()
     scope = scope_entry.get().strip()
@@ -20,7 +23,9 @@ def generate_commit(type_var, scope_entry, desc_entry, breaking_var, preview_tex
     preview_text.insert(END, commit_msg)
     preview_text.config(state="disabled")
 
-def commit_now(repo_path, preview_text, file_vars, check_changes, load_files, load_history, preview_status=None):
+def commit_now(repo_path, preview_text, file_vars, refresh, preview_status=None, snapshot=None):
+    # refresh() schedules the background status/files/history refresh; snapshot is the latest RepoSnapshot
+    global _active
     commit_msg = preview_text.get("1.0", "end").strip()
     if not commit_msg:
         if preview_status:
@@ -33,18 +38,41 @@ def commit_now(repo_path, preview_text, file_vars, check_changes, load_files, lo
         messagebox.showerror("Error", "No repository selected")
         return
 
-    try:
-        selected_files = [f for f, var in file_vars.items() if var.get()]
-        if not selected_files:
-            subprocess.run(["git", "-C", repo_path, "add", "."], check=True)
+    if _active is not None and not _active.finished:
+        if preview_status:
+            preview_status.config(text="⏳ Commit already in progress (Esc to cancel)")
+        return
+
+    # Checked files are staged in chunks on a worker thread; none checked means "stage all"
+    selected_files = [f for f, var in (file_vars or {}).items() if var.get()]
+    paths = None
+    if selected_files:
+        paths = skip_staged_deletions(repo_path, selected_files, snapshot.entries if snapshot else ())
+
+    def progress(done, total):
+        if preview_status:
+            label = f"{done}/{total} files" if paths is not None else "all changes"
+            preview_status.config(text=f"⏳ Staging {label}… (Esc to cancel)", foreground="orange")
+
+    def finished(error):
+        global _active
+        _active = None
+        if error == "cancelled":
+            if preview_status:
+                preview_status.config(text="⚠️ Commit cancelled", foreground="orange")
+        elif error:
+            if preview_status:
+                preview_status.config(text="⚠️ Commit failed", foreground="red")
+            messagebox.showerror("Git Error", f"Failed to commit: {error}")
         else:
-            for f in selected_files:
-                subprocess.run(["git", "-C", repo_path, "add", f], check=True)
-
-        subprocess.run(["git", "-C", repo_path, "commit", "-m", commit_msg], check=True)
-        messagebox.showinfo("Success", f"Commit created successfully in {repo_path}!")
-        check_changes()
-        load_files()
-        load_history()
-    except subprocess.CalledProcessError as e:
-        messagebox.showerror("Git Error", f"Failed to commit: {e}")
\ No newline at end of file
+            if preview_status:
+                preview_status.config(text="✅ Commit completed", foreground="green")
+            messagebox.showinfo("Success", f"Commit created successfully in {repo_path}!")
+        refresh()
+
+    _active = StagingJob(preview_text, repo_path, commit_msg, paths, progress, finished).start()
+
+def cancel_commit():
+    # Stops staging before the next chunk; the commit is skipped
+    if _active is not None:
+        _active.cancel()
@@ -1,32 +1,34 @@
 # debug_commit_ai.py
 import logging
 import os
-import subprocess
-import re
-from logging.handlers import RotatingFileHandler
-
-LOG_PATH = os.path.expanduser(r"~\\commit_ai_debug.log")
-
-logger = logging.getLogger("commit_ai_debug")
-logger.setLevel(logging.DEBUG)
-file_handler = RotatingFileHandler(LOG_PATH, maxBytes=5_000_000, backupCount=3)
-file_handler.setLevel(logging.DEBUG)
-file_formatter = logging.Formatter("%(asctime)s %(levelname)s %(message)s")
-file_handler.setFormatter(file_formatter)
-logger.addHandler(file_handler)
-
-console_handler = logging.StreamHandler()
-console_handler.setLevel(logging.INFO)
-console_handler.setFormatter(file_formatter)
-logger.addHandler(console_handler)
-
-logger.debug("Logging initialized to %s", LOG_PATH)
+import cache_utils as suggestion_cache
+from cache_utils import staged_tree_id, cache_key
+from candidate_utils import normalize_candidates, post_process_continuation
+from classify_utils import classify_staged
+from diff_utils import compact_staged_diff, estimate_tokens
+from git_backend import get_backend
+from history_index import similar_subjects
+from inference_backends import BACKENDS, DEFAULT_BACKEND, load_backend
+from model_server import ModelClient
+from prompt_utils import get_assembler, prompt_prefix, prompt_suffix
+import trace_utils
+from trace_utils import LOG_PATH, setup_logging, span, traced
+
+logger = setup_logging(console=True)
 
 MODEL_NAME = "gpt2-large"
+DEFAULT_CANDIDATES = 3
+# Staged diff budget of the prompt, in characters
+DIFF_CHARS = 1500
+# Bump when build_prompt changes so cached suggestions are not reused
+PROMPT_TEMPLATE_VERSION = "1"
 
 def run(cmd):
+    # `git ...` command lines go through the configured git backend
     try:
-        return subprocess.check_output(cmd, text=True, encoding="utf-8", errors="ignore").strip()
+        args = cmd[1:] if cmd and cmd[0] == "git" else cmd
+        return get_backend().run(args, capture_output=True, text=True, encoding="utf-8", errors="ignore",
+                                 check=True).stdout.strip()
     except Exception as e:
         logger.exception("Command failed: %s", cmd)
         return ""
@@ -34,12 +36,13 @@ def run(cmd):
 def get_changed_files():
     return run(["git", "diff", "--staged", "--name-only"])
 
-def get_staged_diff(max_chars=1500):
-    diff = run(["git", "diff", "--staged", "--unified=1", "--no-color"])
-    if not diff:
+def get_staged_diff(max_chars=1500, max_tokens=None):
+    # Streams a bounded slice of the diff, then shares the token budget fairly across files
+    try:
+        return compact_staged_diff(max_tokens=max_tokens or estimate_tokens("x" * max_chars))
+    except Exception:
+        logger.exception("Reading staged diff failed")
         return ""
-    diff = re.sub(r'^\+\+\+.*|^---.*', '', diff, flags=re.MULTILINE)
-    return diff[:max_chars]
 
 def summarize_filenames(files_text: str) -> str:
     files = [f.strip() for f in files_text.splitlines() if f.strip()]
@@ -60,8 +63,19 @@ def load_seed_examples():
         except Exception as e:
             logger.warning("Failed to read %s: %s", path, e)
 
-    history_raw = run(["git", "log", "--pretty=format:%s", "-n", "8"])
-    lines = history_raw.splitlines() if history_raw else []
+    # Past commits that touched the same paths make better style examples than the latest ones
+    staged = [p for p in get_changed_files().splitlines() if p]
+    examples = [l for l in similar_subjects(".", staged, k=8) if ":" in l][:5]
+    if examples:
+        logger.info("Using %d similar seed examples from the history index", len(examples))
+        print("\nUSING SIMILAR SEED EXAMPLES FROM HISTORY:\n", "\n".join(examples))
+        return examples
+
+    try:
+        lines = [subject for _, subject in get_backend().log_subjects(".", 8)]
+    except Exception:
+        logger.exception("Reading git history failed")
+        lines = []
     examples = [l for l in lines if ":" in l][:5]
     if examples:
         logger.info("Using %d seed examples from git history", len(examples))
@@ -69,150 +83,134 @@ def load_seed_examples():
         return examples
     return ["chore: update project files"]
 
+@traced("build_prompt")
+def build_prompt_parts(seed_examples, diff_summary, diff_text, candidates=3):
+    # (static header, per-diff tail): the header only changes with the seed examples,
+    # so its past key/values can be reused across generations
+    return prompt_prefix(seed_examples), prompt_suffix(diff_summary, diff_text, candidates)
+
+@traced("build_prompt")
+def build_prompt_ids(seed_examples, diff_summary, diff_text, candidates=3, tok=None, max_tokens=800):
+    # Token ids under max_tokens; only the diff section is ever truncated
+    prefix, suffix = get_assembler(tok, max_tokens).assemble(seed_examples, diff_summary, diff_text, candidates)
+    print(f"\nPROMPT TOKEN LENGTH: {len(prefix) + len(suffix)}")
+    return prefix, suffix
+
 def build_prompt(seed_examples, diff_summary, diff_text, candidates=3, tok=None, max_tokens=800):
-    examples_block = "\n".join(seed_examples)
-    prompt = (
-        "Example commits:\n"
-        f"{examples_block}\n\n"
-        "Rules:\n"
-        "- Write Conventional Commit messages.\n"
-        "- Format: type: description\n"
-        "- Imperative mood, under 12 words.\n"
-        "- Summarize actual changes from DIFF.\n"
-        "- Do not copy code. Write only commit messages.\n"
-        "- Only output commit messages. Do not include code, comments, or stack traces.\n\n"
-        f"{diff_summary}\n\n"
-        "DIFF:\n"
-        f"{diff_text}\n\n"
-        f"Write {candidates} messages:\n"
-        "1. "
-    )
     if tok is not None:
-        ids = tok.encode(prompt)
-        print(f"\nPROMPT TOKEN LENGTH: {len(ids)}")
-        if len(ids) > max_tokens:
-            ids = ids[:max_tokens]
-            prompt = tok.decode(ids)
-            print(f"Truncated prompt to {max_tokens} tokens.")
-    return prompt
-
-def safe_init_model(model_name=MODEL_NAME):
-    try:
-        from transformers import pipeline, AutoTokenizer
-    except Exception as e:
-        logger.exception("transformers import failed: %s", e)
-        return None, None
+        prefix, suffix = build_prompt_ids(seed_examples, diff_summary, diff_text, candidates, tok, max_tokens)
+        return tok.decode(prefix + suffix)
+    return "".join(build_prompt_parts(seed_examples, diff_summary, diff_text, candidates))
+
+@traced("safe_init_model")
+def safe_init_model(model_name=MODEL_NAME, backend=None):
+    # Returns (inference backend, tokenizer); backend name from --backend / COMMIT_AI_BACKEND
     try:
-        gen = pipeline("text-generation", model=model_name, device=-1)
-        tok = AutoTokenizer.from_pretrained(model_name, use_fast=True)
-        try:
-            gen.model.config.pad_token_id = gen.model.config.eos_token_id
-        except Exception:
-            pass
-        logger.debug("Initialized model pipeline for %s", model_name)
-        return gen, tok
+        engine = load_backend(backend, model_name)
+        logger.debug("Initialized %s backend for %s", engine.name, model_name)
+        return engine, engine.tok
     except Exception as e:
         logger.exception("Model init failed: %s", e)
         return None, None
 
-def post_process_continuation(out: str) -> str:
-    if not out:
-        return ""
-    out = re.sub(r'[_\-,\s]{3,}$', "", out).strip()
-    out = re.sub(r'[^\x09\x0A\x0D\x20-\x7E]', "", out)
-    return out.strip()
-
-def clean_candidate_line(line: str) -> str:
-    if not line:
-        return ""
-    s = line.strip()
-    # Drop junk echoes
-    if s.lower().startswith("exception") or "return None" in s or "print(" in s or "traceback" in s.lower() or s.startswith("#"):
-        return ""
-    s = re.sub(r'^[\s\-\)\(\[\]]*\d+[\.\)]\s*', '', s)
-    s = re.sub(r'^[\s\-\*]+', '', s)
-    s = re.split(r'(?<=\w)\.\s', s)[0].strip()
-    s = re.sub(r'^(feat|FEAT)\s*:', 'feat:', s)
-    s = re.sub(r'^(fix|FIX)\s*:', 'fix:', s)
-    s = re.sub(r'^(chore|CHORE)\s*:', 'chore:', s)
-    s = re.sub(r'^(docs|DOCS)\s*:', 'docs:', s)
-    s = re.sub(r'^(refactor|REFACTOR)\s*:', 'refactor:', s)
-    if s.lower().startswith("changed files"):
-        return ""
-    if ":" not in s:
-        if re.search(r'\bfix|bug|error|typo\b', s, flags=re.I):
-            s = "fix: " + s
-        else:
-            s = "feat: " + s
-    s_words = s.split()
-    if len(s_words) > 12:
-        s = " ".join(s_words[:12])
-    return s.strip()
-
-def main():
+def main(num_candidates=DEFAULT_CANDIDATES, use_server=True, backend=None):
     files = get_changed_files()
     diff_summary = summarize_filenames(files) if files else ""
     if not diff_summary:
         print("No staged files. Stage one small change and re-run.")
         return
 
-    diff_text = get_staged_diff(max_chars=1500)
+    diff_text = get_staged_diff(max_chars=DIFF_CHARS)
     seed_examples = load_seed_examples()
 
-    gen, tok = safe_init_model()
-    if gen is None:
-        print("Model init failed; check commit_ai_debug.log for details.")
+    # A running model_server daemon already has the model loaded
+    client = ModelClient() if use_server else None
+    if client is not None and not client.available():
+        client = None
+    model_name = client.model_name if client is not None else MODEL_NAME
+
+    # Repeat runs on the same staged content skip the model entirely
+    tree_id = staged_tree_id()
+    engine_name = "server" if client is not None else (backend or DEFAULT_BACKEND)
+    cache_id = cache_key(tree_id, model_name, PROMPT_TEMPLATE_VERSION, seed_examples,
+                         candidates=num_candidates, diff_chars=DIFF_CHARS, backend=engine_name) if tree_id else None
+    cached = suggestion_cache.lookup(cache_id)
+    if cached:
+        print("\nCACHED_CANDIDATES:", cached)
+        print("\nSELECTED:", cached[0])
         return
 
-    prompt = build_prompt(seed_examples, diff_summary, diff_text, candidates=3, tok=tok)
+    prefix, suffix = build_prompt_parts(seed_examples, diff_summary, diff_text, candidates=num_candidates)
+    prompt = prefix + suffix
     logger.debug("PROMPT:\n%s", prompt)
     print("\nPROMPT FED TO MODEL:\n", prompt[:500], "...")
 
-    raw_outputs = []
-    for i in range(3):
+    sample_kwargs = {
+        "max_new_tokens": 60,
+        "do_sample": True,
+        "top_p": 0.92,
+        # Stop each sequence once it has num_candidates complete lines (or runs long / turns into code)
+        "stop_lines": num_candidates,
+    }
+    if client is not None:
+        logger.info("Using model server (%s)", model_name)
+        try:
+            with span("generate", n=num_candidates, server=True):
+                outs = client.generate(prompt, n=num_candidates, prefix=prefix, **sample_kwargs)
+        except Exception as e:
+            logger.exception("Model server generation failed: %s", e)
+            outs = []
+    else:
+        engine, tok = safe_init_model(backend=backend)
+        if engine is None:
+            print("Model init failed; check commit_ai_debug.log for details.")
+            return
         try:
-            gen_kwargs = {
-                "max_new_tokens": 60,
-                "do_sample": True,
-                "top_p": 0.92,
-                "return_full_text": False,
-            }
-            out = gen(prompt, **gen_kwargs)[0].get("generated_text", "")
+            # Only the diff tail is prefilled; the examples + rules header comes from the prefix cache
+            prefix_ids, suffix_ids = build_prompt_ids(seed_examples, diff_summary, diff_text,
+                                                      candidates=num_candidates, tok=tok)
+            with span("generate", n=num_candidates, backend=engine.name):
+                outs = engine.generate_ids(prefix_ids, suffix_ids, n=num_candidates, **sample_kwargs)
         except Exception as e:
             logger.exception("Generation failed: %s", e)
-            out = ""
-        out_clean = post_process_continuation(out)
-        raw_outputs.append(out_clean)
-        print(f"\nRAW_OUTPUT_{i} (first 400 chars):\n", out_clean[:400])
+            outs = []
+        logger.info("%s backend: %.1f tokens/sec", engine.name, engine.tokens_per_sec)
 
-    candidates = []
-    for out in raw_outputs:
-        if not out:
-            continue
-        for l in out.splitlines():
-            cleaned = clean_candidate_line(l)
-            if cleaned:
-                candidates.append(cleaned)
-
-    seen = set()
-    deduped = []
-    for c in candidates:
-        key = c.lower()
-        if key and key not in seen and ":" in c and len(c.split()) <= 12:
-            seen.add(key)
-            deduped.append(c)
+    with span("clean"):
+        raw_outputs = [post_process_continuation(out) for out in outs]
+        deduped = normalize_candidates(raw_outputs)
+    for i, out_clean in enumerate(raw_outputs):
+        print(f"\nRAW_OUTPUT_{i} (first 400 chars):\n", out_clean[:400])
 
     print("\nCLEANED_CANDIDATES:", deduped)
 
     if not deduped:
         names = [n.split("/")[-1] for n in files.splitlines() if n]
-        fallback = f"chore: update {', '.join(names[:3])}" if names else "chore: update project files"
+        base = classify_staged().type if names else "chore"
+        fallback = f"{base}: update {', '.join(names[:3])}" if names else "chore: update project files"
         print("\nFALLBACK:", fallback)
         return
 
+    suggestion_cache.store(cache_id, deduped)
     selected = deduped[0]
     print("\nSELECTED:", selected)
     print("\nWrote logs to:", LOG_PATH)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    import argparse
+    parser = argparse.ArgumentParser(description="Suggest Conventional Commit messages for the staged diff")
+    parser.add_argument("--candidates", type=int, default=DEFAULT_CANDIDATES,
+                        help="number of candidates sampled in one batched generation call")
+    parser.add_argument("--no-server", action="store_true",
+                        help="load the model in-process even if model_server.py is running")
+    parser.add_argument("--backend", choices=sorted(BACKENDS), default=None,
+                        help="inference backend (default: $COMMIT_AI_BACKEND or torch)")
+    parser.add_argument("--trace", metavar="PATH",
+                        help="write a Chrome trace-event JSON of this run (chrome://tracing, Perfetto)")
+    args = parser.parse_args()
+    try:
+        main(num_candidates=args.candidates, use_server=not args.no_server, backend=args.backend)
+    finally:
+        trace_utils.tracer.log_summary(logging.DEBUG)
+        if args.trace:
+            print("Wrote trace to:", trace_utils.tracer.export_chrome(args.trace))
\ No newline at end of file
@@ -0,0 +1,382 @@
+import os
+import re
+import subprocess
+import time
+from git_backend import get_backend
+import trace_utils
+
+# Paths that never help a commit message: lockfiles and generated artifacts
+LOCKFILES = {
+    "package-lock.json", "yarn.lock", "pnpm-lock.yaml", "poetry.lock", "Pipfile.lock",
+    "Cargo.lock", "Gemfile.lock", "composer.lock", "go.sum", "uv.lock", "mix.lock",
+}
+GENERATED_SUFFIXES = (".min.js", ".min.css", ".map", ".pb.go", "_pb2.py", ".snap", ".svg")
+GENERATED_DIRS = ("dist/", "build/", "node_modules/", "vendor/", "__generated__/")
+
+DEFAULT_MAX_BYTES = 64_000
+# Smallest per-file read cap in compact_staged_diff
+MIN_FILE_BYTES = 2_000
+LINE_LIMIT = 4096  # longest single diff line we keep; the rest of the line is discarded unread
+
+def estimate_tokens(text):
+    # ~4 characters per BPE token for code and English
+    return (len(text) + 3) // 4
+
+def is_generated_path(path):
+    name = os.path.basename(path)
+    if name in LOCKFILES or name.endswith(GENERATED_SUFFIXES):
+        return True
+    return any(path.startswith(d) or f"/{d}" in path for d in GENERATED_DIRS)
+
+def attribute_skips(paths, repo_path=None):
+    # Paths marked `-diff` or `linguist-generated` in .gitattributes
+    if not paths:
+        return set()
+    try:
+        result = get_backend().run(
+            ["check-attr", "-z", "--stdin", "diff", "linguist-generated"],
+            repo_path, input="\0".join(paths) + "\0",
+            capture_output=True, text=True, encoding="utf-8", errors="surrogateescape"
+        )
+    except OSError:
+        return set()
+    fields = result.stdout.split("\0")
+    skipped = set()
+    for i in range(0, len(fields) - 2, 3):
+        path, attr, value = fields[i:i + 3]
+        if (attr == "diff" and value in ("unset", "false")) or \
+           (attr == "linguist-generated" and value in ("set", "true")):
+            skipped.add(path)
+    return skipped
+
+def changed_paths(diff_args, repo_path=None):
+    result = get_backend().run(
+        diff_args + ["--name-only", "-z"],
+        repo_path, capture_output=True, text=True, encoding="utf-8", errors="surrogateescape"
+    )
+    return [p for p in result.stdout.split("\0") if p]
+
+class DiffFile:
+    def __init__(self, path):
+        self.path = path
+        self.lines = []
+        self.binary = False
+        self.added = 0
+        self.removed = 0
+
+    def text(self):
+        return "\n".join(self.lines)
+
+def _header_path(line):
+    # "diff --git a/X b/X" -> X; renames and quoted paths are corrected by the "+++ " line
+    rest = line[len("diff --git "):]
+    if rest.startswith("a/") and len(rest) % 2 == 1:
+        half = (len(rest) - 1) // 2
+        if rest[half + 1:].startswith("b/") and rest[2:half] == rest[half + 3:]:
+            return rest[2:half]
+    return rest.rsplit(" b/", 1)[-1]
+
+def _read_lines(stream, limit=LINE_LIMIT):
+    # readline(limit) keeps memory flat even for multi-GB single-line files
+    while True:
+        chunk = stream.readline(limit)
+        if not chunk:
+            return
+        if not chunk.endswith(b"\n"):
+            while True:
+                rest = stream.readline(limit)
+                if not rest or rest.endswith(b"\n"):
+                    break
+        yield chunk
+
+def stream_diff(diff_args, repo_path=None, max_bytes=DEFAULT_MAX_BYTES, max_tokens=None,
+                count_tokens=estimate_tokens, skip_generated=True, max_file_bytes=None):
+    """Yield DiffFile objects from `git <diff_args>` until the byte/token budget is spent.
+
+    The git process is read incrementally and killed as soon as the budget runs out,
+    so memory stays flat however large the diff is. Binary, lockfile, generated and
+    `-diff`/`linguist-generated` paths are skipped without counting against the budget.
+    """
+    skipped = set()
+    if skip_generated:
+        paths = changed_paths(diff_args, repo_path)
+        skipped = {p for p in paths if is_generated_path(p)}
+        skipped |= attribute_skips([p for p in paths if p not in skipped], repo_path)
+
+    started = time.perf_counter()
+    proc = get_backend().popen(diff_args + ["--no-color"], repo_path,
+                               stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    usage = {"bytes": 0, "tokens": 0}
+    try:
+        yield from parse_diff(_read_lines(proc.stdout), max_bytes, max_tokens, count_tokens,
+                              skip=skipped.__contains__, usage=usage, max_file_bytes=max_file_bytes)
+    finally:
+        if proc.poll() is None:
+            proc.kill()
+        proc.stdout.close()
+        proc.wait()
+        # A generator cannot hold a span open across yields, so the span is recorded at the end
+        trace_utils.tracer.record(trace_utils.git_label(["git"] + diff_args), started, time.perf_counter(),
+                                  {"bytes": usage["bytes"]})
+        trace_utils.count("git.bytes_read", usage["bytes"])
+
+def parse_diff(lines, max_bytes=DEFAULT_MAX_BYTES, max_tokens=None, count_tokens=estimate_tokens,
+               skip=None, usage=None, max_file_bytes=None):
+    """Yield DiffFile objects from raw unified-diff lines (bytes) until the budget is spent.
+
+    Stops consuming `lines` at the budget; `skip(path)` drops a file without charging it.
+    With max_file_bytes, the rest of a file past that many bytes is read but not kept.
+    """
+    usage = usage if usage is not None else {"bytes": 0, "tokens": 0}
+    current = None
+    keep = False
+    file_bytes = 0
+    for raw in lines:
+        line = raw.decode("utf-8", errors="ignore").rstrip("\n")
+        if line.startswith("diff --git "):
+            if current is not None and keep and current.lines:
+                yield current
+            current = DiffFile(_header_path(line))
+            keep = not (skip and skip(current.path))
+            header = line
+            file_bytes = 0
+            continue
+        if current is None:
+            continue
+        if line.startswith("+++ ") or line.startswith("--- "):
+            if line.startswith("+++ b/"):
+                current.path = line[len("+++ b/"):]
+                keep = keep and not (skip and skip(current.path))
+            continue
+        if line.startswith("Binary files ") or line.startswith("GIT binary patch"):
+            current.binary = True
+            keep = False
+            continue
+        if not keep or line.startswith("index "):
+            continue
+        if line.startswith("+"):
+            current.added += 1
+        elif line.startswith("-"):
+            current.removed += 1
+        pending = [header, line] if not current.lines else [line]
+        cost = sum(len(p.encode("utf-8")) + 1 for p in pending)
+        if max_file_bytes and file_bytes + cost > max_file_bytes:
+            file_bytes = max_file_bytes  # this file is full; later, shorter lines must not sneak in
+            continue
+        tokens = sum(count_tokens(p) for p in pending) if max_tokens else 0
+        if usage["bytes"] + cost > max_bytes or (max_tokens and usage["tokens"] + tokens > max_tokens):
+            break
+        usage["bytes"] += cost
+        usage["tokens"] += tokens
+        file_bytes += cost
+        current.lines.extend(pending)
+    if current is not None and keep and current.lines:
+        yield current
+
+class DiffTally:
+    # Passes raw diff lines through unchanged while counting +/- lines per file, so the
+    # numstat summary covers files that parse_diff never reached
+    def __init__(self, lines):
+        self.lines = iter(lines)
+        self.counts = {}
+        self.current = None
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        raw = next(self.lines)
+        if raw.startswith(b"diff --git "):
+            self.current = _header_path(raw.decode("utf-8", errors="ignore").rstrip("\n"))
+            self.counts[self.current] = [0, 0]
+        elif self.current is None or raw.startswith(b"+++ ") or raw.startswith(b"--- "):
+            pass
+        elif raw.startswith(b"+"):
+            self.counts[self.current][0] += 1
+        elif raw.startswith(b"-"):
+            self.counts[self.current][1] += 1
+        elif raw.startswith(b"Binary files ") or raw.startswith(b"GIT binary patch"):
+            self.counts[self.current] = ["-", "-"]
+        return raw
+
+    def drain(self):
+        for _ in self:
+            pass
+
+    @property
+    def numstat(self):
+        return {path: (str(a), str(d)) for path, (a, d) in self.counts.items()}
+
+def read_diff(diff_args, repo_path=None, max_bytes=DEFAULT_MAX_BYTES, max_tokens=None, **kwargs):
+    return "\n".join(f.text() for f in stream_diff(diff_args, repo_path, max_bytes, max_tokens, **kwargs))
+
+def read_staged_diff(repo_path=None, max_bytes=DEFAULT_MAX_BYTES, max_tokens=None, unified=1, **kwargs):
+    return read_diff(["diff", "--staged", f"--unified={unified}"], repo_path, max_bytes, max_tokens, **kwargs)
+
+# -----------------------------
+# Hunk prioritization
+# -----------------------------
+SOURCE_EXTS = {
+    ".py", ".js", ".jsx", ".ts", ".tsx", ".go", ".rs", ".java", ".kt", ".c", ".h", ".cc", ".cpp",
+    ".hpp", ".cs", ".rb", ".php", ".swift", ".scala", ".m", ".sh", ".sql", ".vue",
+}
+CONFIG_EXTS = {".json", ".yml", ".yaml", ".toml", ".ini", ".cfg", ".xml", ".lock", ".env"}
+DOC_EXTS = {".md", ".rst", ".txt", ".adoc"}
+IDENT_RE = re.compile(
+    r'^\+\s*(?:export\s+)?(?:async\s+)?(?:def|class|function|func|fn|interface|struct|enum|type|const|let|var)\s+([A-Za-z_]\w*)'
+)
+TEST_PATH_RE = re.compile(r'(^|/)(tests?|spec|__tests__)/|(^|/)test_[^/]*$|_test\.\w+$|\.(spec|test)\.\w+$')
+
+def file_weight(path):
+    ext = os.path.splitext(path)[1].lower()
+    if TEST_PATH_RE.search(path):
+        return 1.0
+    if ext in SOURCE_EXTS:
+        return 3.0
+    if ext in CONFIG_EXTS:
+        return 0.7
+    if ext in DOC_EXTS:
+        return 1.0
+    return 1.5
+
+def split_hunks(diff_file):
+    header, hunks = [], []
+    for line in diff_file.lines:
+        if line.startswith("@@"):
+            hunks.append([line])
+        elif hunks:
+            hunks[-1].append(line)
+        else:
+            header.append(line)
+    return header, hunks
+
+def score_hunk(path, hunk):
+    changed = sum(1 for l in hunk if l[:1] in "+-")
+    idents = sum(1 for l in hunk if IDENT_RE.match(l))
+    # Definitions and dense edits beat long runs of context; huge hunks are discounted
+    return file_weight(path) * (1 + idents) * (1 + changed) / (1 + len(hunk)) ** 0.5
+
+def read_numstat(diff_args, repo_path=None):
+    result = get_backend().run(
+        diff_args + ["--numstat", "-z"],
+        repo_path, capture_output=True, text=True, encoding="utf-8", errors="surrogateescape"
+    )
+    stats = {}
+    fields = result.stdout.split("\0")
+    i = 0
+    while i < len(fields):
+        parts = fields[i].split("\t")
+        i += 1
+        if len(parts) != 3:
+            continue
+        added, removed, path = parts
+        if not path:  # rename: "<a>\t<d>\t\0<old>\0<new>\0"
+            path = fields[i + 1] if i + 1 < len(fields) else ""
+            i += 2
+        stats[path] = (added, removed)
+    return stats
+
+def compact_diff(files, max_tokens, numstat=None, count_tokens=estimate_tokens):
+    """Fit parsed diff files into max_tokens, sharing the budget fairly across files.
+
+    Every file first gets an equal share filled with its best-scoring hunks, leftover
+    budget then goes to the best remaining hunks overall. Files that get nothing are
+    listed in a numstat-style summary so the model still knows they changed.
+    """
+    numstat = numstat or {}
+    reserve = max_tokens // 10 if len(numstat) > len(files) or len(files) > 1 else 0
+    budget = max_tokens - reserve
+    parsed = []
+    for f in files:
+        header, hunks = split_hunks(f)
+        head = header[:1]
+        ranked = sorted(
+            ((score_hunk(f.path, h), i, h, count_tokens("\n".join(h)) + 1) for i, h in enumerate(hunks)),
+            key=lambda x: -x[0]
+        )
+        parsed.append({"file": f, "head": head, "head_cost": count_tokens("\n".join(head)) + 1,
+                       "ranked": ranked, "chosen": {}})
+
+    used = 0
+
+    def take(entry, index, hunk, cost):
+        nonlocal used
+        if not entry["chosen"]:
+            cost += entry["head_cost"]
+        entry["chosen"][index] = hunk
+        used += cost
+
+    def fits(entry, cost, limit):
+        return used + cost + (0 if entry["chosen"] else entry["head_cost"]) <= limit
+
+    # Pass 1: an equal share per file, best hunks first
+    share = budget // max(len(parsed), 1)
+    parsed.sort(key=lambda e: -(e["ranked"][0][0] if e["ranked"] else 0))
+    for entry in parsed:
+        limit = used + share
+        for score, index, hunk, cost in entry["ranked"]:
+            if fits(entry, cost, limit):
+                take(entry, index, hunk, cost)
+        if not entry["chosen"] and entry["ranked"]:
+            # Even the best hunk is larger than the share: keep its opening lines
+            score, index, hunk, cost = entry["ranked"][0]
+            room = share - entry["head_cost"]
+            lines, spent = [], 0
+            for line in hunk:
+                c = count_tokens(line) + 1
+                if spent + c > room:
+                    break
+                lines.append(line)
+                spent += c
+            # Only worth it if the cut still shows a change, not just the @@ line and context
+            if any(l[:1] in "+-" for l in lines[1:]):
+                take(entry, index, lines, spent)
+
+    # Pass 2: leftover budget to the best remaining hunks anywhere
+    leftovers = sorted(
+        ((score, entry, index, hunk, cost) for entry in parsed
+         for score, index, hunk, cost in entry["ranked"] if index not in entry["chosen"]),
+        key=lambda x: -x[0]
+    )
+    for score, entry, index, hunk, cost in leftovers:
+        if fits(entry, cost, budget):
+            take(entry, index, hunk, cost)
+
+    order = {id(f): i for i, f in enumerate(files)}
+    parsed.sort(key=lambda e: order[id(e["file"])])
+    out = []
+    shown = set()
+    for entry in parsed:
+        if not entry["chosen"]:
+            continue
+        shown.add(entry["file"].path)
+        out.extend(entry["head"])
+        for index in sorted(entry["chosen"]):
+            out.extend(entry["chosen"][index])
+
+    dropped = [(f.path, str(f.added), str(f.removed)) for f in files if f.path not in shown and f.path not in numstat]
+    dropped += [(p, a, d) for p, (a, d) in numstat.items() if p not in shown]
+    if dropped:
+        room = max_tokens - used
+        summary = ["Other changed files (+added -removed):"]
+        room -= count_tokens(summary[0]) + 1
+        for path, added, removed in dropped:
+            line = f"{path} +{added} -{removed}" if added != "-" else f"{path} (binary)"
+            c = count_tokens(line) + 1
+            if c > room:
+                summary.append(f"... and {len(dropped) - len(summary) + 1} more")
+                break
+            summary.append(line)
+            room -= c
+        if len(summary) > 1:
+            out.extend(summary)
+    return "\n".join(out)
+
+def compact_staged_diff(repo_path=None, max_tokens=400, read_bytes=DEFAULT_MAX_BYTES,
+                        count_tokens=estimate_tokens, unified=1):
+    diff_args = ["diff", "--staged", f"--unified={unified}"]
+    numstat = read_numstat(["diff", "--staged"], repo_path)
+    # Split the read budget too, so one huge early file cannot use it all before compaction
+    per_file = max(read_bytes // max(len(numstat), 1), MIN_FILE_BYTES)
+    files = list(stream_diff(diff_args, repo_path, max_bytes=read_bytes, max_file_bytes=per_file))
+    return compact_diff(files, max_tokens, numstat, count_tokens)
@@ -1,10 +1,15 @@
-from PIL import Image, ImageDraw, ImageFont
-from reportlab.pdfgen import canvas as pdf_canvas
-from reportlab.lib.pagesizes import A4
 from datetime import datetime
 from tkinter import messagebox
 import subprocess
+import json
+import time
+import csv
 import os
+import queue
+import re
+import threading
+from git_backend import get_backend
+import trace_utils
 
 # Badge mapping for commit types
 BADGES = {
@@ -19,64 +24,316 @@ BADGES = {
     "default": "📦 Commit"
 }
 
-def export_summary(repo_path):
-    if not repo_path:
-        messagebox.showerror("Error", "No repository selected")
-        return
+PDF_ROW_HEIGHT = 14
+PNG_TILE_ROWS = 40
+# Newest commits in the GUI summary export; pass max_count=None for the whole range
+SUMMARY_MAX_COUNT = 1000
+# Unicode TrueType fonts for the PDF; the built-in Helvetica only covers Latin-1
+PDF_FONTS = [
+    "DejaVuSans.ttf",
+    "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",
+    "/usr/share/fonts/dejavu/DejaVuSans.ttf",
+    "C:\\Windows\\Fonts\\segoeui.ttf",
+    "C:\\Windows\\Fonts\\arial.ttf",
+    "/Library/Fonts/Arial Unicode.ttf",
+    "/System/Library/Fonts/Supplemental/Arial Unicode.ttf",
+]
 
+def iter_log(repo_path, fields="%h%x1f%s%x1f%cI", rev_range="HEAD", max_count=None, extra_args=()):
+    # Streams `git log -z` records as lists of fields; memory stays flat for any history size
+    args = ["log", "-z", f"--pretty=format:{fields}"] + list(extra_args)
+    if max_count:
+        args += ["-n", str(max_count)]
+    args += [rev_range, "--"]
+    started = time.perf_counter()
+    proc = get_backend().popen(args, repo_path, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    buf = b""
+    read = 0
+    done = False
     try:
-        result = subprocess.run(
-            ["git", "-C", repo_path, "log", "--pretty=format:%h|%s|%cI", "-n", "20"],
-            capture_output=True, text=True, check=True
-        )
-        commits = result.stdout.strip().splitlines()
+        while True:
+            chunk = proc.stdout.read(1 << 16)
+            if not chunk:
+                break
+            read += len(chunk)
+            buf += chunk
+            *records, buf = buf.split(b"\0")
+            for record in records:
+                yield record.decode("utf-8", errors="replace").split("\x1f")
+        if buf:
+            yield buf.decode("utf-8", errors="replace").split("\x1f")
+        done = True
+    finally:
+        if not done:
+            # Consumer stopped early
+            proc.kill()
+        proc.stdout.close()
+        err = proc.stderr.read().decode("utf-8", errors="replace")
+        proc.stderr.close()
+        code = proc.wait()
+        trace_utils.tracer.record("git log", started, time.perf_counter(), {"bytes": read})
+        trace_utils.count("git.bytes_read", read)
+    # An unborn branch has no history to export, which is not an error
+    if code and not _is_unborn(repo_path, rev_range):
+        raise RuntimeError(err.strip() or "git log failed")
 
-        width, height = 1200, 60 + len(commits) * 60
-        img = Image.new("RGB", (width, height), "#2b2b2b")
-        draw = ImageDraw.Draw(img)
+def _is_unborn(repo_path, rev_range):
+    if rev_range != "HEAD":
+        return False
+    probe = get_backend().run(["rev-parse", "-q", "--verify", "HEAD"], repo_path, capture_output=True)
+    return probe.returncode == 1
 
-        # Try to load a font that supports emoji/unicode
+# Conventional commit header: type(scope)!: description
+CONVENTIONAL_RE = re.compile(r"^(?P<type>[A-Za-z]+)(?:\((?P<scope>[^)]*)\))?(?P<bang>!)?:\s")
+BREAKING_RE = re.compile(r"^BREAKING[ -]CHANGE:", re.M)
+HISTORY_FIELDS = ("sha", "author", "email", "date", "type", "scope", "breaking", "subject")
+
+def parse_conventional(subject, body=""):
+    m = CONVENTIONAL_RE.match(subject)
+    if not m:
+        return "", "", bool(BREAKING_RE.search(body))
+    breaking = bool(m.group("bang")) or bool(BREAKING_RE.search(body))
+    return m.group("type").lower(), m.group("scope") or "", breaking
+
+@trace_utils.traced("export_history")
+def export_history(repo_path, out_path, fmt="jsonl", rev_range="HEAD", max_count=None):
+    """Write the full history as CSV or JSONL one commit at a time; returns throughput stats."""
+    if fmt not in ("csv", "jsonl"):
+        raise ValueError(f"Unknown export format: {fmt}")
+    start = time.perf_counter()
+    count = 0
+    with open(out_path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f) if fmt == "csv" else None
+        if writer:
+            writer.writerow(HISTORY_FIELDS)
+        for fields in iter_log(repo_path, "%H%x1f%an%x1f%ae%x1f%aI%x1f%s%x1f%b",
+                               rev_range=rev_range, max_count=max_count):
+            if len(fields) < 6:
+                continue
+            sha, author, email, date, subject, body = fields[:6]
+            ctype, scope, breaking = parse_conventional(subject, body)
+            row = (sha, author, email, date, ctype, scope, breaking, subject)
+            if writer:
+                writer.writerow(row)
+            else:
+                f.write(json.dumps(dict(zip(HISTORY_FIELDS, row)), ensure_ascii=False) + "\n")
+            count += 1
+        size = f.tell()
+    elapsed = time.perf_counter() - start
+    return {
+        "commits": count,
+        "bytes": size,
+        "seconds": round(elapsed, 3),
+        "commits_per_sec": round(count / elapsed) if elapsed else 0,
+    }
+
+def badge_for(msg):
+    for key in BADGES.keys():
+        if msg.startswith(key):
+            return BADGES[key]
+    return BADGES["default"]
+
+def _load_font(size=18):
+    from PIL import ImageFont
+    # Try to load a font that supports emoji/unicode
+    try:
+        # Windows: Segoe UI Emoji
+        return ImageFont.truetype("seguiemj.ttf", size)
+    except OSError:
         try:
-            # Windows: Segoe UI Emoji
-            font = ImageFont.truetype("seguiemj.ttf", 18)
+            # Linux/macOS: DejaVu Sans
+            return ImageFont.truetype("DejaVuSans.ttf", size)
         except OSError:
-            try:
-                # Linux/macOS: DejaVu Sans
-                font = ImageFont.truetype("DejaVuSans.ttf", 18)
-            except OSError:
-                font = ImageFont.load_default()  # fallback
+            return ImageFont.load_default()  # fallback
 
-        draw.text((20, 20), f"Commit Summary - {datetime.now().strftime('%Y-%m-%d %H:%M')}",
-                  fill="white", font=font)
+class PngTiles:
+    # Writes the summary as fixed-size PNG tiles (commit_summary_001.png, ...) instead of one huge image
+    def __init__(self, prefix="commit_summary", rows=PNG_TILE_ROWS):
+        self.prefix = prefix
+        self.rows = rows
+        self.font = _load_font()
+        self.paths = []
+        self.pending = []
 
-        y = 60
-        for line in commits:
-            sha, msg, date = line.split("|", 2)
-
-            # Pick badge based on commit type
-            badge = BADGES["default"]
-            for key in BADGES.keys():
-                if msg.startswith(key):
-                    badge = BADGES[key]
-                    break
+    def add(self, sha, msg, date):
+        self.pending.append((sha, msg, date))
+        if len(self.pending) == self.rows:
+            self.flush()
 
+    def flush(self):
+        if not self.pending:
+            return
+        from PIL import Image, ImageDraw
+        width, height = 1200, 60 + len(self.pending) * 40
+        img = Image.new("RGB", (width, height), "#2b2b2b")
+        draw = ImageDraw.Draw(img)
+        draw.text((20, 20), f"Commit Summary - {datetime.now().strftime('%Y-%m-%d %H:%M')}"
+                  f" ({len(self.paths) + 1})", fill="white", font=self.font)
+        y = 60
+        for sha, msg, date in self.pending:
             # Color coding
             color = "#6DD16A" if msg.startswith("feat") else "#FF6B6B" if msg.startswith("fix") else "white"
-
             # Draw commit info + badge inline so it's always visible
-            draw.text((40, y), f"{sha}", fill=color, font=font)
-            draw.text((120, y), f"{msg}", fill="white", font=font)
-            draw.text((700, y), f"{date}", fill="#aaaaaa", font=font)
-            draw.text((950, y), badge, fill="#FFD700", font=font)  # gold for visibility
-
+            draw.text((40, y), f"{sha}", fill=color, font=self.font)
+            draw.text((120, y), f"{msg}", fill="white", font=self.font)
+            draw.text((700, y), f"{date}", fill="#aaaaaa", font=self.font)
+            draw.text((950, y), badge_for(msg), fill="#FFD700", font=self.font)  # gold for visibility
             y += 40
+        path = f"{self.prefix}_{len(self.paths) + 1:03d}.png"
+        img.save(path)
+        self.paths.append(path)
+        self.pending = []
+
+def _pdf_font():
+    # Name of a registered Unicode TTF, or None to fall back to Helvetica
+    from reportlab.pdfbase import pdfmetrics
+    from reportlab.pdfbase.ttfonts import TTFont
+    if "CommitSans" in pdfmetrics.getRegisteredFontNames():
+        return "CommitSans"
+    for path in PDF_FONTS:
+        try:
+            pdfmetrics.registerFont(TTFont("CommitSans", path))
+            return "CommitSans"
+        except Exception:  # reportlab raises TTFError or plain IOError depending on version
+            continue
+    return None
+
+class PdfSummary:
+    # Native reportlab text, one row per commit, new page whenever the current one fills up
+    def __init__(self, path="commit_summary.pdf"):
+        from reportlab.pdfgen import canvas as pdf_canvas
+        from reportlab.lib.pagesizes import A4
+        self.font = _pdf_font()
+        self.pdf = pdf_canvas.Canvas(path, pagesize=A4)
+        self.width, self.height = A4
+        self.path = path
+        self.pages = 0
+        self.y = 0
+        self.title = f"Commit Summary - {datetime.now().strftime('%Y-%m-%d %H:%M')}"
+        self._new_page()
+
+    def _new_page(self):
+        if self.pages:
+            self.pdf.showPage()
+        self.pages += 1
+        self.pdf.setFont("Helvetica-Bold", 12)
+        self.pdf.drawString(40, self.height - 40, self.title)
+        self.pdf.setFont("Helvetica", 8)
+        self.pdf.drawRightString(self.width - 40, 25, f"Page {self.pages}")
+        self.y = self.height - 65
+
+    def _fit(self, text, width, font="Helvetica", size=9):
+        from reportlab.pdfbase.pdfmetrics import stringWidth
+        if stringWidth(text, font, size) <= width:
+            return text
+        while text and stringWidth(text + "...", font, size) > width:
+            text = text[:-1]
+        return text + "..."
+
+    def add(self, sha, msg, date):
+        if self.y < 45:
+            self._new_page()
+        color = (0.2, 0.6, 0.2) if msg.startswith("feat") else (0.8, 0.2, 0.2) if msg.startswith("fix") else (0, 0, 0)
+        self.pdf.setFont("Courier", 9)
+        self.pdf.setFillColorRGB(*color)
+        self.pdf.drawString(40, self.y, sha)
+        self.pdf.setFont(self.font or "Helvetica", 9)
+        self.pdf.setFillColorRGB(0, 0, 0)
+        # Text fonts have no emoji, so the badge is drawn as its label
+        if self.font is None:
+            msg = msg.encode("latin-1", errors="replace").decode("latin-1")
+        self.pdf.drawString(95, self.y, self._fit(msg, 300, self.font or "Helvetica"))
+        self.pdf.setFillColorRGB(0.4, 0.4, 0.4)
+        self.pdf.drawString(400, self.y, date[:10])
+        self.pdf.setFillColorRGB(0.6, 0.45, 0)
+        self.pdf.drawString(470, self.y, badge_for(msg).split(" ", 1)[-1])
+        self.y -= PDF_ROW_HEIGHT
+
+    def save(self):
+        self.pdf.save()
+
+@trace_utils.traced("export_summary")
+def write_summary(repo_path, rev_range="HEAD", max_count=SUMMARY_MAX_COUNT, png=False):
+    """Writes commit_summary.pdf (and PNG tiles); returns a one-line description of what was saved."""
+    pdf = PdfSummary("commit_summary.pdf")
+    tiles = PngTiles() if png else None
+    count = 0
+    for fields in iter_log(repo_path, rev_range=rev_range, max_count=max_count):
+        if len(fields) < 3:
+            continue
+        sha, msg, date = fields[:3]
+        pdf.add(sha, msg, date)
+        if tiles:
+            tiles.add(sha, msg, date)
+        count += 1
+    pdf.save()
+    saved = f"commit_summary.pdf ({count} commits, {pdf.pages} pages)"
+    if tiles:
+        tiles.flush()
+        saved += f" and {len(tiles.paths)} PNG tile(s)"
+    return saved
+
+def _run_export(job, widget=None):
+    # job() returns a description of what was saved; with a widget it runs on a worker thread
+    # and the result is shown via widget.after
+    def run():
+        try:
+            return True, job()
+        except Exception as e:
+            return False, str(e)
+
+    def report(ok, text):
+        if ok:
+            messagebox.showinfo("Export Complete", f"Saved {text}")
+        else:
+            messagebox.showerror("Export Error", text)
+
+    if widget is None:
+        report(*run())
+        return
+    results = queue.Queue()
+    threading.Thread(target=lambda: results.put(run()), daemon=True).start()
+
+    def poll():
+        try:
+            ok, text = results.get_nowait()
+        except queue.Empty:
+            widget.after(100, poll)
+            return
+        report(ok, text)
+    widget.after(100, poll)
+
+def export_summary(repo_path, rev_range="HEAD", max_count=SUMMARY_MAX_COUNT, png=False, widget=None):
+    if not repo_path:
+        messagebox.showerror("Error", "No repository selected")
+        return
+    _run_export(lambda: write_summary(repo_path, rev_range, max_count, png), widget)
+
+def export_history_file(repo_path, fmt="csv", widget=None):
+    # Full history to commit-history-<timestamp>.<fmt> in the repo
+    if not repo_path:
+        messagebox.showerror("Error", "No repository selected")
+        return
+    out_path = os.path.join(repo_path, f"commit-history-{datetime.now():%Y%m%d-%H%M%S}.{fmt}")
 
-        img.save("commit_summary.png")
+    def job():
+        stats = export_history(repo_path, out_path, fmt=fmt)
+        return f"{os.path.basename(out_path)} ({stats['commits']} commits, {stats['commits_per_sec']} commits/s)"
+    _run_export(job, widget)
 
-        pdf = pdf_canvas.Canvas("commit_summary.pdf", pagesize=A4)
-        pdf.drawImage("commit_summary.png", 50, 400, width=500, preserveAspectRatio=True)
-        pdf.save()
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description="Stream a repository's commit history to CSV or JSONL")
+    parser.add_argument("repo", nargs="?", default=".")
+    parser.add_argument("--out", help="output path (default: commit-history.<format>)")
+    parser.add_argument("--format", choices=("csv", "jsonl"), default="jsonl")
+    parser.add_argument("--range", default="HEAD", help="revision range passed to git log")
+    parser.add_argument("--max-count", type=int, default=None)
+    args = parser.parse_args()
+    out_path = args.out or f"commit-history.{args.format}"
+    stats = export_history(args.repo, out_path, fmt=args.format, rev_range=args.range, max_count=args.max_count)
+    print(f"Exported {stats['commits']} commits to {out_path} "
+          f"({stats['bytes']} bytes, {stats['seconds']}s, {stats['commits_per_sec']} commits/s)")
 
-        messagebox.showinfo("Export Complete", "Saved commit_summary.png and commit_summary.pdf")
-    except Exception as e:
-        messagebox.showerror("Export Error", str(e))
\ No newline at end of file
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,346 @@
+# git_backend.py
+"""Pluggable git access for every git call in the app.
+
+    subprocess - one `git` process per call (the original behaviour)
+    catfile    - refs are resolved in-process and commits are read through one
+                 persistent `git cat-file --batch` coprocess per repo, so history
+                 queries cost no fork/exec; everything else falls back to subprocess
+    pygit2     - libgit2 in-process (when installed)
+    dulwich    - pure-Python in-process (when installed)
+
+Pick one with COMMIT_AI_GIT_BACKEND; the default ("auto") is catfile. pygit2 and
+dulwich are opt-in. Commands that write (add, commit, write-tree) or
+compare the work tree (status, diff) always run through `git` itself.
+"""
+import atexit
+import heapq
+import itertools
+import os
+import subprocess
+import threading
+from collections import OrderedDict
+
+from change_detector import resolve_git_dir
+import trace_utils
+
+DEFAULT_GIT_BACKEND = os.environ.get("COMMIT_AI_GIT_BACKEND", "auto")
+# Persistent cat-file processes kept open at once (one per repo)
+MAX_COPROCESSES = 8
+
+def _git_args(args, repo_path):
+    return ["git", "-C", repo_path] + list(args) if repo_path else ["git"] + list(args)
+
+def _subject(message):
+    # Same as %s: the first paragraph joined into one line
+    lines = []
+    for line in message.splitlines():
+        if not line.strip():
+            if lines:
+                break
+            continue
+        lines.append(line.strip())
+    return " ".join(lines)
+
+class GitBackend:
+    name = "subprocess"
+
+    def __init__(self):
+        self._abbrev = {}
+
+    def run(self, args, repo_path=None, **kwargs):
+        """subprocess.run for `git [-C repo_path] <args>`; same keyword arguments and result."""
+        return trace_utils.run(_git_args(args, repo_path), **kwargs)
+
+    def popen(self, args, repo_path=None, **kwargs):
+        """Streaming `git` process for diff/log readers; the caller closes and waits."""
+        return subprocess.Popen(_git_args(args, repo_path), **kwargs)
+
+    def rev_parse(self, rev="HEAD", repo_path=None):
+        """Full commit id of `rev`, or None when it does not resolve (e.g. an unborn branch)."""
+        result = self.run(["rev-parse", "-q", "--verify", f"{rev}^{{commit}}"], repo_path,
+                          capture_output=True, text=True)
+        return result.stdout.strip() or None
+
+    def log_subjects(self, repo_path=None, n=10, rev="HEAD"):
+        """[(abbreviated sha, subject)] of the newest n commits reachable from rev, like `git log --oneline`.
+
+        Returns [] for an unborn branch; raises CalledProcessError when repo_path is not a repository.
+        """
+        result = self.run(["log", "--pretty=format:%h%x1f%s", "-n", str(n), rev, "--"], repo_path,
+                          capture_output=True, text=True, encoding="utf-8", errors="ignore")
+        if result.returncode:
+            if self.rev_parse("HEAD", repo_path) is None and rev == "HEAD" and self._is_repo(repo_path):
+                return []
+            raise subprocess.CalledProcessError(result.returncode, result.args, result.stdout, result.stderr)
+        return [tuple(line.split("\x1f", 1)) for line in result.stdout.splitlines() if "\x1f" in line]
+
+    def _is_repo(self, repo_path):
+        return self.run(["rev-parse", "--git-dir"], repo_path, capture_output=True).returncode == 0
+
+    def _abbrev_len(self, repo_path, sha):
+        # Same abbreviation length as `git log --oneline` (grows with the object count), once per repo
+        key = os.path.abspath(repo_path or ".")
+        if key not in self._abbrev:
+            short = self.run(["rev-parse", "--short", sha], repo_path, capture_output=True, text=True)
+            self._abbrev[key] = len(short.stdout.strip()) or 7
+        return self._abbrev[key]
+
+    def close(self):
+        pass
+
+# -----------------------------
+# cat-file --batch coprocess
+# -----------------------------
+def _common_dir(git_dir):
+    commondir = os.path.join(git_dir, "commondir")
+    if os.path.isfile(commondir):
+        with open(commondir, "r", encoding="utf-8", errors="ignore") as f:
+            return os.path.normpath(os.path.join(git_dir, f.read().strip()))
+    return git_dir
+
+class _CatFile:
+    def __init__(self, repo_path):
+        self.proc = subprocess.Popen(["git", "-C", repo_path, "cat-file", "--batch"],
+                                     stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        self.lock = threading.Lock()
+
+    def read(self, oid):
+        # (type, raw bytes) or None when the object is missing
+        with self.lock:
+            self.proc.stdin.write(oid.encode() + b"\n")
+            self.proc.stdin.flush()
+            header = self.proc.stdout.readline().split()
+            if len(header) != 3:
+                if not header:
+                    raise OSError("git cat-file exited")
+                return None
+            data = self.proc.stdout.read(int(header[2]) + 1)[:-1]
+        trace_utils.count("git.bytes_read", len(data))
+        return header[1].decode(), data
+
+    def close(self):
+        if self.proc.poll() is None:
+            self.proc.stdin.close()
+            self.proc.wait()
+
+def _parse_commit(data):
+    # (parents, committer timestamp, message)
+    header, _, message = data.partition(b"\n\n")
+    parents, stamp = [], 0
+    for line in header.split(b"\n"):
+        if line.startswith(b"parent "):
+            parents.append(line[7:].decode())
+        elif line.startswith(b"committer "):
+            try:
+                stamp = int(line.rsplit(b" ", 2)[-2])
+            except (IndexError, ValueError):
+                pass
+    return parents, stamp, message.decode("utf-8", errors="ignore")
+
+class CatFileBackend(GitBackend):
+    name = "catfile"
+
+    def __init__(self):
+        super().__init__()
+        self._procs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _key(self, repo_path):
+        return os.path.abspath(repo_path or ".")
+
+    def _catfile(self, repo_path):
+        key = self._key(repo_path)
+        with self._lock:
+            proc = self._procs.get(key)
+            if proc is not None and proc.proc.poll() is None:
+                self._procs.move_to_end(key)
+                return proc
+            proc = self._procs[key] = _CatFile(key)
+            while len(self._procs) > MAX_COPROCESSES:
+                self._procs.popitem(last=False)[1].close()
+            return proc
+
+    def _read_ref(self, repo_path, rev):
+        # HEAD / branch names from the ref files; None means "ask git"
+        git_dir = resolve_git_dir(self._key(repo_path))
+        common = _common_dir(git_dir)
+        if not os.path.isdir(git_dir) or os.path.exists(os.path.join(common, "reftable")):
+            return None
+        if rev == "HEAD":
+            try:
+                with open(os.path.join(git_dir, "HEAD"), "r", encoding="utf-8") as f:
+                    head = f.read().strip()
+            except OSError:
+                return None
+            if not head.startswith("ref: "):
+                return head if len(head) in (40, 64) else None
+            ref = head[len("ref: "):]
+        elif rev.startswith("refs/heads/"):
+            ref = rev
+        else:
+            return None
+        try:
+            with open(os.path.join(common, ref), "r", encoding="utf-8") as f:
+                sha = f.read().strip()
+            return None if sha.startswith("ref: ") else sha
+        except OSError:
+            pass
+        try:
+            with open(os.path.join(common, "packed-refs"), "r", encoding="utf-8") as f:
+                for line in f:
+                    sha, _, name = line.strip().partition(" ")
+                    if name == ref:
+                        return sha
+        except OSError:
+            pass
+        return ""  # unborn branch
+
+    def rev_parse(self, rev="HEAD", repo_path=None):
+        sha = self._read_ref(repo_path, rev)
+        if sha is None:
+            return super().rev_parse(rev, repo_path)
+        return sha or None
+
+    def log_subjects(self, repo_path=None, n=10, rev="HEAD"):
+        head = self._read_ref(repo_path, rev)
+        if head is None:
+            return super().log_subjects(repo_path, n, rev)
+        if not head:
+            return []
+        with trace_utils.span("git log", backend=self.name):
+            catfile = self._catfile(repo_path)
+            # Newest committer date first across all parents, like `git log`'s default order;
+            # equal dates come out in insertion order (git's prio_queue does the same)
+            heap, seen, rows = [], {head}, []
+            order = itertools.count()
+            obj = catfile.read(head)
+            if obj is None or obj[0] != "commit":
+                return super().log_subjects(repo_path, n, rev)
+            parents, stamp, message = _parse_commit(obj[1])
+            heapq.heappush(heap, (-stamp, next(order), head, parents, message))
+            width = self._abbrev_len(repo_path, head)
+            while heap and len(rows) < n:
+                _, _, sha, parents, message = heapq.heappop(heap)
+                rows.append((sha[:width], _subject(message)))
+                for parent in parents:
+                    if parent in seen:
+                        continue
+                    seen.add(parent)
+                    obj = catfile.read(parent)
+                    if obj is None:
+                        continue  # shallow clone boundary
+                    p_parents, p_stamp, p_message = _parse_commit(obj[1])
+                    heapq.heappush(heap, (-p_stamp, next(order), parent, p_parents, p_message))
+            return rows
+
+    def close(self):
+        with self._lock:
+            for proc in self._procs.values():
+                proc.close()
+            self._procs.clear()
+
+# -----------------------------
+# In-process libraries
+# -----------------------------
+class Pygit2Backend(GitBackend):
+    name = "pygit2"
+
+    def __init__(self):
+        super().__init__()
+        import pygit2
+        self.pygit2 = pygit2
+        self._repos = {}
+
+    def _repo(self, repo_path):
+        key = os.path.abspath(repo_path or ".")
+        if key not in self._repos:
+            found = self.pygit2.discover_repository(key)
+            if found is None:
+                raise subprocess.CalledProcessError(128, ["git", "-C", key], "", "not a git repository")
+            self._repos[key] = self.pygit2.Repository(found)
+        return self._repos[key]
+
+    def rev_parse(self, rev="HEAD", repo_path=None):
+        try:
+            return str(self._repo(repo_path).revparse_single(rev).peel(self.pygit2.Commit).id)
+        except (KeyError, ValueError, self.pygit2.GitError):
+            return None
+
+    def log_subjects(self, repo_path=None, n=10, rev="HEAD"):
+        repo = self._repo(repo_path)
+        head = self.rev_parse(rev, repo_path)
+        if head is None:
+            return []
+        sort = getattr(self.pygit2, "GIT_SORT_TIME", None)
+        if sort is None:
+            sort = self.pygit2.enums.SortMode.TIME
+        rows = []
+        width = self._abbrev_len(repo_path, head)
+        with trace_utils.span("git log", backend=self.name):
+            for commit in repo.walk(head, sort):
+                rows.append((str(commit.id)[:width], _subject(commit.message)))
+                if len(rows) >= n:
+                    break
+        return rows
+
+class DulwichBackend(GitBackend):
+    name = "dulwich"
+
+    def __init__(self):
+        super().__init__()
+        from dulwich.repo import Repo
+        self.Repo = Repo
+        self._repos = {}
+
+    def _repo(self, repo_path):
+        key = os.path.abspath(repo_path or ".")
+        if key not in self._repos:
+            from dulwich.errors import NotGitRepository
+            try:
+                self._repos[key] = self.Repo.discover(key)
+            except NotGitRepository as e:
+                raise subprocess.CalledProcessError(128, ["git", "-C", key], "", str(e))
+        return self._repos[key]
+
+    def rev_parse(self, rev="HEAD", repo_path=None):
+        from dulwich.objectspec import parse_commit
+        try:
+            return parse_commit(self._repo(repo_path), rev).id.decode()
+        except (KeyError, ValueError):
+            return None
+
+    def log_subjects(self, repo_path=None, n=10, rev="HEAD"):
+        repo = self._repo(repo_path)
+        head = self.rev_parse(rev, repo_path)
+        if head is None:
+            return []
+        width = self._abbrev_len(repo_path, head)
+        with trace_utils.span("git log", backend=self.name):
+            return [(entry.commit.id.decode()[:width], _subject(entry.commit.message.decode("utf-8", errors="ignore")))
+                    for entry in repo.get_walker(include=[head.encode()], max_entries=n)]
+
+BACKENDS = {
+    "subprocess": GitBackend,
+    "catfile": CatFileBackend,
+    "pygit2": Pygit2Backend,
+    "dulwich": DulwichBackend,
+}
+
+def load_backend(name=None):
+    name = (name or DEFAULT_GIT_BACKEND).lower()
+    if name == "auto":
+        return CatFileBackend()
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown git backend {name!r}; choose from {', '.join(sorted(BACKENDS))} or auto")
+    return BACKENDS[name]()
+
+_backend = None
+_backend_lock = threading.Lock()
+
+def get_backend():
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            _backend = load_backend()
+            atexit.register(_backend.close)
+        return _backend
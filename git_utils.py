@@ -1,10 +1,20 @@
 import subprocess, os
-from tkinter import messagebox, filedialog, ttk, BooleanVar
+from tkinter import messagebox, filedialog, ttk
+from change_detector import ChangeDetector
+from git_backend import get_backend
+from history_index import update_index
 
 repo_path = None
 file_vars = {}
+files_tree = None
+files_hint = None
+_files_repo = None
+_file_items = {}  # path -> (tree item id, status, shown text)
+_item_paths = {}  # tree item id -> path
+_detector = None
+last_snapshot = None  # RepoSnapshot behind the files panel
 
-def choose_repo(repo_label, check_changes, load_files, load_history):
+def choose_repo(repo_label, refresh):
     global repo_path
     folder = filedialog.askdirectory(title="Select Git Repository")
     if not folder:
@@ -13,83 +23,255 @@ def choose_repo(repo_label, check_changes, load_files, load_history):
         repo_path = folder
         repo_label.config(text=f"Repo: {repo_path}")
         messagebox.showinfo("Repo Selected", f"Using repo: {repo_path}")
-        check_changes()
-        load_files()
-        load_history()
+        refresh()
     else:
         messagebox.showerror("Error", "Selected folder is not a Git repository")
 
-def check_changes(status_label, canvas, light):
+class RepoSnapshot:
+    # One `git status --porcelain=v2 --branch -z` parse shared by every refresh path
+    def __init__(self):
+        self.oid = None
+        self.branch = None
+        self.upstream = None
+        self.ahead = 0
+        self.behind = 0
+        self.staged = set()
+        self.unstaged = set()
+        self.untracked = set()
+        self.unmerged = set()
+        self.entries = []  # (xy, path, orig_path) in `git status --short` order
+
+    @property
+    def is_clean(self):
+        return not self.entries
+
+    @property
+    def light(self):
+        if self.is_clean:
+            return "green"
+        if self.staged or self.unmerged:
+            return "red"
+        return "orange"
+
+    def summary(self):
+        # Mirrors the first line of `git status -sb`
+        if self.branch is None:
+            return "## HEAD (no branch)"
+        if self.oid is None:
+            return f"## No commits yet on {self.branch}"
+        line = f"## {self.branch}"
+        if self.upstream:
+            line += f"...{self.upstream}"
+            counts = []
+            if self.ahead:
+                counts.append(f"ahead {self.ahead}")
+            if self.behind:
+                counts.append(f"behind {self.behind}")
+            if counts:
+                line += f" [{', '.join(counts)}]"
+        return line
+
+def parse_porcelain_v2(raw):
+    snap = RepoSnapshot()
+    records = raw.split("\0")
+    i = 0
+    while i < len(records):
+        rec = records[i]
+        i += 1
+        if not rec:
+            continue
+        kind = rec[0]
+        if kind == "#":
+            key, _, value = rec[2:].partition(" ")
+            if key == "branch.oid":
+                snap.oid = None if value == "(initial)" else value
+            elif key == "branch.head":
+                snap.branch = None if value == "(detached)" else value
+            elif key == "branch.upstream":
+                snap.upstream = value
+            elif key == "branch.ab":
+                ahead, behind = value.split()
+                snap.ahead, snap.behind = int(ahead), abs(int(behind))
+        elif kind in "12u":
+            fields = rec.split(" ", {"1": 8, "2": 9, "u": 10}[kind])
+            xy, path = fields[1], fields[-1]
+            orig = None
+            if kind == "2":
+                orig = records[i]
+                i += 1
+            if kind == "u":
+                snap.unmerged.add(path)
+            else:
+                if xy[0] != ".":
+                    snap.staged.add(path)
+                if xy[1] != ".":
+                    snap.unstaged.add(path)
+            snap.entries.append((xy.replace(".", " "), path, orig))
+        elif kind == "?":
+            path = rec[2:]
+            snap.untracked.add(path)
+            snap.entries.append(("??", path, None))
+    return snap
+
+def read_snapshot(path=None):
+    path = path or repo_path
+    result = get_backend().run(
+        # --no-optional-locks: a background status must not rewrite the index (and retrigger the detector)
+        ["--no-optional-locks", "status", "--porcelain=v2", "--branch", "-z"], path,
+        capture_output=True, text=True, encoding="utf-8", errors="surrogateescape", check=True
+    )
+    return parse_porcelain_v2(result.stdout)
+
+def check_changes(status_label, canvas, light, snapshot=None):
     global repo_path
     if not repo_path:
         status_label.config(text="Repo status: No repository selected")
         canvas.itemconfig(light, fill="grey")
         return
     try:
-        branch = subprocess.run(
-            ["git", "-C", repo_path, "rev-parse", "--abbrev-ref", "HEAD"],
-            capture_output=True, text=True, check=True
-        ).stdout.strip()
-
-        summary = subprocess.run(
-            ["git", "-C", repo_path, "status", "-sb"],
-            capture_output=True, text=True, check=True
-        ).stdout.strip().splitlines()[0]
-
-        status_label.config(text=f"Branch: {branch} | {summary}")
-
-        result = subprocess.run(
-            ["git", "-C", repo_path, "status", "--short"],
-            capture_output=True, text=True, check=True
-        )
-        changes = result.stdout.strip()
-        if not changes:
-            canvas.itemconfig(light, fill="green")
-        else:
-            staged = subprocess.run(
-                ["git", "-C", repo_path, "diff", "--cached", "--name-only"],
-                capture_output=True, text=True, check=True
-            ).stdout.strip()
-            if staged:
-                canvas.itemconfig(light, fill="red")
-            else:
-                canvas.itemconfig(light, fill="orange")
+        if snapshot is None:
+            snapshot = read_snapshot(repo_path)
+        branch = snapshot.branch or "HEAD"
+        status_label.config(text=f"Branch: {branch} | {snapshot.summary()}")
+        canvas.itemconfig(light, fill=snapshot.light)
     except subprocess.CalledProcessError as e:
         status_label.config(text=f"Git Error: {e}")
         canvas.itemconfig(light, fill="grey")
 
-def load_files(files_frame):
-    global repo_path, file_vars
+class FileSelection:
+    # Same get/set API as BooleanVar without a Tcl variable per changed file
+    __slots__ = ("value",)
+
+    def __init__(self, value=False):
+        self.value = value
+
+    def get(self):
+        return self.value
+
+    def set(self, value):
+        self.value = bool(value)
+
+CHECKED, UNCHECKED = "\u2611", "\u2610"
+
+def _ensure_files_tree(files_frame):
+    # Treeview only draws the visible rows, so thousands of changed files stay cheap
+    global files_tree, files_hint
+    if files_tree is not None and files_tree.winfo_exists():
+        return files_tree
     for widget in files_frame.winfo_children():
         widget.destroy()
+    _file_items.clear()
+    _item_paths.clear()
+    files_hint = ttk.Label(files_frame, text="")
+    files_hint.pack(anchor="w", pady=(0, 5))
+    scrollbar = ttk.Scrollbar(files_frame, orient="vertical")
+    files_tree = ttk.Treeview(files_frame, columns=("check", "status", "path"), show="headings",
+                              yscrollcommand=scrollbar.set)
+    scrollbar.config(command=files_tree.yview)
+    files_tree.heading("check", text=UNCHECKED)
+    files_tree.heading("status", text="St")
+    files_tree.heading("path", text="File")
+    files_tree.column("check", width=30, stretch=False, anchor="center")
+    files_tree.column("status", width=35, stretch=False, anchor="w")
+    files_tree.column("path", width=300, anchor="w")
+    scrollbar.pack(side="right", fill="y")
+    files_tree.pack(side="left", fill="both", expand=True)
+    files_tree.bind("<Button-1>", _on_files_click)
+    files_tree.bind("<space>", lambda e: [_toggle_file(iid) for iid in files_tree.selection()])
+    return files_tree
+
+def _toggle_file(iid):
+    var = file_vars[_item_paths[iid]]
+    var.set(not var.get())
+    files_tree.set(iid, "check", CHECKED if var.get() else UNCHECKED)
+
+def _on_files_click(event):
+    if files_tree.identify_column(event.x) != "#1":
+        return None
+    if files_tree.identify_region(event.x, event.y) == "heading":
+        # Header checkbox toggles every file
+        value = not all(var.get() for var in file_vars.values())
+        for iid, path in _item_paths.items():
+            file_vars[path].set(value)
+            files_tree.set(iid, "check", CHECKED if value else UNCHECKED)
+        files_tree.heading("check", text=CHECKED if value and file_vars else UNCHECKED)
+        return "break"
+    iid = files_tree.identify_row(event.y)
+    if iid:
+        _toggle_file(iid)
+        return "break"
+    return None
+
+def _clear_files():
+    if files_tree is not None:
+        files_tree.delete(*files_tree.get_children())
+    _file_items.clear()
+    _item_paths.clear()
     file_vars.clear()
 
+def _sync_files(entries):
+    # Diff the new status against the rows already shown and update in place,
+    # keeping the user's checkbox selections for files that are still changed
+    order = []
+    seen = set()
+    for status, filename, orig in entries:
+        shown = f"{orig} -> {filename}" if orig else filename
+        status = status.strip()
+        item = _file_items.get(filename)
+        if item is None:
+            var = file_vars.setdefault(filename, FileSelection())
+            iid = files_tree.insert("", "end", values=(CHECKED if var.get() else UNCHECKED, status, shown))
+            _file_items[filename] = (iid, status, shown)
+            _item_paths[iid] = filename
+        else:
+            iid = item[0]
+            if item[1:] != (status, shown):
+                files_tree.set(iid, "status", status)
+                files_tree.set(iid, "path", shown)
+                _file_items[filename] = (iid, status, shown)
+        order.append(iid)
+        seen.add(filename)
+    for filename in [f for f in _file_items if f not in seen]:
+        iid = _file_items.pop(filename)[0]
+        del _item_paths[iid]
+        file_vars.pop(filename, None)
+        files_tree.delete(iid)
+    if tuple(order) != files_tree.get_children():
+        files_tree.set_children("", *order)
+
+def load_files(files_frame, snapshot=None):
+    global repo_path, file_vars, _files_repo, last_snapshot
+    _ensure_files_tree(files_frame)
+    if _files_repo != repo_path:
+        _clear_files()
+        _files_repo = repo_path
+
     if not repo_path:
-        ttk.Label(files_frame, text="Select a repository to view changes").pack(anchor="w")
+        files_hint.config(text="Select a repository to view changes")
         return
 
     try:
-        result = subprocess.run(
-            ["git", "-C", repo_path, "status", "--short"],
-            capture_output=True, text=True, check=True
-        )
-        changes = result.stdout.strip().splitlines()
-        if not changes:
-            ttk.Label(files_frame, text="No changes detected").pack(anchor="w")
-        else:
-            ttk.Label(files_frame, text="Select files to stage:").pack(anchor="w", pady=(0, 5))
-            for line in changes:
-                status = line[:2]
-                filename = line[3:]
-                var = BooleanVar()
-                text = f"{status.strip():<2}  {filename}"
-                chk = ttk.Checkbutton(files_frame, text=text, variable=var)
-                chk.pack(anchor="w")
-                file_vars[filename] = var
+        if snapshot is None:
+            snapshot = read_snapshot(repo_path)
+        _sync_files(snapshot.entries)
+        last_snapshot = snapshot
+        files_hint.config(text="No changes detected" if snapshot.is_clean else "Select files to stage:")
     except subprocess.CalledProcessError:
-        ttk.Label(files_frame, text="Error loading files").pack(anchor="w")
+        files_hint.config(text="Error loading files")
 
-def load_history(history_tree):
+def read_history(path=None, n=10):
+    path = path or repo_path
+    rows = []
+    for sha, msg in get_backend().log_subjects(path, n):
+        tag = "default"
+        for t in ["feat", "fix", "docs", "chore", "refactor", "style", "test", "perf"]:
+            if msg.startswith(t):
+                tag = t
+                break
+        rows.append((sha, msg, tag))
+    return rows
+
+def load_history(history_tree, rows=None):
     global repo_path
     for row in history_tree.get_children():
         history_tree.delete(row)
@@ -98,20 +280,42 @@ def load_history(history_tree):
         return
 
     try:
-        result = subprocess.run(
-            ["git", "-C", repo_path, "log", "--oneline", "-n", "10"],
-            capture_output=True, text=True, check=True
-        )
-        commits = result.stdout.strip().splitlines()
-        for commit in commits:
-            parts = commit.split(" ", 1)
-            if len(parts) == 2:
-                sha, msg = parts
-                tag = "default"
-                for t in ["feat", "fix", "docs", "chore", "refactor", "style", "test", "perf"]:
-                    if msg.startswith(t):
-                        tag = t
-                        break
-                history_tree.insert("", "end", values=(sha, msg), tags=(tag,))
+        if rows is None:
+            rows = read_history(repo_path)
+        for sha, msg, tag in rows:
+            history_tree.insert("", "end", values=(sha, msg), tags=(tag,))
     except subprocess.CalledProcessError:
-        history_tree.insert("", "end", values=("Error", "Could not load history"))
\ No newline at end of file
+        history_tree.insert("", "end", values=("Error", "Could not load history"))
+
+def collect_state(path, force=True):
+    # Runs on the refresh worker thread: git only, no widgets.
+    # Returns None when the repo fingerprint is unchanged and the refresh was not forced.
+    global _detector
+    state = {"repo_path": path, "snapshot": None, "history": None, "error": None}
+    if not path:
+        return state
+    try:
+        if _detector is None or _detector.path != path:
+            _detector = ChangeDetector(path)
+        if not _detector.changed() and not force:
+            return None
+        state["snapshot"] = read_snapshot(path)
+        state["history"] = read_history(path)
+        # New commits go into the few-shot index here, so suggestions only query it
+        update_index(path)
+    except (subprocess.CalledProcessError, OSError) as e:
+        # OSError: git not installed, permission denied, repo removed
+        state["error"] = e
+    return state
+
+def apply_state(state, status_label, canvas, light, files_frame, history_tree):
+    # Runs on the Tk thread with the result of collect_state
+    if state["repo_path"] != repo_path:
+        return  # repo changed while git was running
+    if state["error"] is not None:
+        status_label.config(text=f"Git Error: {state['error']}")
+        canvas.itemconfig(light, fill="grey")
+        return
+    check_changes(status_label, canvas, light, state["snapshot"])
+    load_files(files_frame, state["snapshot"])
+    load_history(history_tree, state["history"])
@@ -0,0 +1,226 @@
+# history_index.py
+"""Persistent per-repo index of commit subjects and touched paths for few-shot retrieval.
+
+The index lives in <git dir>/commit-ai-index.sqlite3 and is brought up to date
+incrementally: only commits not reachable from an already indexed tip are read, so
+branch switches and rewritten history never trigger a rebuild.
+The GUI brings it up to date on the refresh worker (`update_index`) and only queries it
+on the Tk thread. `similar(paths, k)` returns the subjects of the k past commits most similar to the
+staged paths, by path/directory overlap plus TF-IDF of path words against subjects.
+Lookups touch at most CANDIDATES_PER_KEY rows per path or directory, so the cost per
+suggestion does not grow with the length of the history.
+"""
+import math
+import os
+import re
+import sqlite3
+import subprocess
+from collections import Counter
+
+from change_detector import resolve_git_dir
+from git_backend import get_backend
+import trace_utils
+
+INDEX_NAME = "commit-ai-index.sqlite3"
+CANDIDATES_PER_KEY = 200
+MAX_PATHS_PER_COMMIT = 200  # vendor drops and mass renames add noise, not signal
+MAX_QUERY_PATHS = 50
+BATCH = 5000
+MAX_TIPS = 32  # a dropped tip only means its commits are walked again (and skipped) once
+
+TOKEN_RE = re.compile(r'[A-Z]?[a-z]+|[A-Z]+(?![a-z])|\d+')
+STOP_WORDS = {"py", "js", "ts", "md", "txt", "json", "src", "lib", "the", "a", "an", "and", "to", "of", "in", "for"}
+
+def tokenize(text):
+    return [t for t in (w.lower() for w in TOKEN_RE.findall(text)) if t not in STOP_WORDS and len(t) > 1]
+
+def path_keys(path):
+    # Exact path plus every parent directory, deepest first
+    keys = [("p:" + path, 2.0)]
+    parts = path.split("/")[:-1]
+    for depth in range(len(parts), 0, -1):
+        keys.append(("d:" + "/".join(parts[:depth]), depth / (len(parts) + 1)))
+    return keys
+
+def _git(repo_path, *args):
+    return get_backend().run(list(args), repo_path, capture_output=True, text=True,
+                             encoding="utf-8", errors="surrogateescape")
+
+class HistoryIndex:
+    def __init__(self, repo_path):
+        self.repo_path = repo_path
+        self.path = os.path.join(resolve_git_dir(repo_path), INDEX_NAME)
+        self.db = sqlite3.connect(self.path, timeout=10)
+        self.db.executescript(
+            # Readers (suggestions) never wait for a writer (the refresh worker's update)
+            "PRAGMA journal_mode=WAL;"
+            "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);"
+            "CREATE TABLE IF NOT EXISTS commits (id INTEGER PRIMARY KEY, sha TEXT UNIQUE, subject TEXT);"
+            "CREATE TABLE IF NOT EXISTS touches (key TEXT, commit_id INTEGER);"
+            "CREATE INDEX IF NOT EXISTS touches_key ON touches (key, commit_id DESC);"
+            "CREATE TABLE IF NOT EXISTS terms (term TEXT PRIMARY KEY, df INTEGER);"
+        )
+
+    def _meta(self, key, value=None):
+        if value is None:
+            row = self.db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+            return row[0] if row else None
+        self.db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    def update(self):
+        """Index commits added since the last update; returns how many were added."""
+        head = get_backend().rev_parse("HEAD", self.repo_path)
+        if not head:
+            return 0
+        # Every branch tip indexed so far, newest first: switching between diverged branches
+        # only walks what none of them reached, and switching back costs nothing
+        tips = (self._meta("tips") or self._meta("last_sha") or "").split()
+        if head in tips:
+            if tips[0] != head:
+                self._meta("tips", " ".join([head] + [t for t in tips if t != head]))
+                self.db.commit()
+            return 0
+        rev_range = [head, "--ignore-missing", "--not"] + tips
+        with trace_utils.span("git log") as meta:
+            proc = get_backend().popen(
+                ["log", "--reverse", "--no-renames", "--name-only", "-z", "--format=%x1e%H%x1f%s"] + rev_range,
+                self.repo_path, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL
+            )
+            added = 0
+            pending = []
+            try:
+                for sha, subject, paths in _parse_log(proc.stdout):
+                    pending.append((sha, subject, paths))
+                    if len(pending) >= BATCH:
+                        added += self._insert(pending)
+                        pending = []
+                added += self._insert(pending)
+            finally:
+                proc.stdout.close()
+                proc.wait()
+            meta["commits"] = added
+        self._meta("tips", " ".join(self._independent([head] + tips)[:MAX_TIPS]))
+        self._meta("count", str(self.count()))
+        self.db.commit()
+        return added
+
+    def _independent(self, tips):
+        # Drops tips that are ancestors of another (e.g. the previous HEAD of this branch)
+        result = _git(self.repo_path, "merge-base", "--independent", *tips)
+        if result.returncode:
+            return tips  # a tip was garbage-collected
+        keep = set(result.stdout.split())
+        return [t for t in tips if t in keep]
+
+    def _insert(self, commits):
+        df = Counter()
+        for sha, subject, paths in commits:
+            cur = self.db.execute("INSERT OR IGNORE INTO commits (sha, subject) VALUES (?, ?)", (sha, subject))
+            if not cur.rowcount:
+                continue
+            commit_id = cur.lastrowid
+            keys = {key for path in paths[:MAX_PATHS_PER_COMMIT] for key, _ in path_keys(path)}
+            self.db.executemany("INSERT INTO touches (key, commit_id) VALUES (?, ?)",
+                                ((key, commit_id) for key in keys))
+            df.update(set(tokenize(subject)))
+        self.db.executemany(
+            "INSERT INTO terms (term, df) VALUES (?, ?) ON CONFLICT(term) DO UPDATE SET df = df + excluded.df",
+            df.items()
+        )
+        return len(commits)
+
+    def count(self):
+        return self.db.execute("SELECT COUNT(*) FROM commits").fetchone()[0]
+
+    def similar(self, paths, k=5):
+        """Subjects of the k indexed commits most similar to `paths`."""
+        paths = [p for p in paths if p][:MAX_QUERY_PATHS]
+        if not paths:
+            return []
+        overlap = Counter()
+        for path in paths:
+            for key, weight in path_keys(path):
+                rows = self.db.execute(
+                    "SELECT commit_id FROM touches WHERE key = ? ORDER BY commit_id DESC LIMIT ?",
+                    (key, CANDIDATES_PER_KEY)
+                ).fetchall()
+                for (commit_id,) in rows:
+                    overlap[commit_id] += weight
+        if not overlap:
+            return []
+        top = overlap.most_common(CANDIDATES_PER_KEY)
+        total = int(self._meta("count") or self.count() or 1)
+        query = Counter(t for p in paths for t in tokenize(p))
+        idf = {}
+        for term in query:
+            row = self.db.execute("SELECT df FROM terms WHERE term = ?", (term,)).fetchone()
+            idf[term] = math.log((1 + total) / (1 + (row[0] if row else 0))) + 1
+        qnorm = math.sqrt(sum((query[t] * idf[t]) ** 2 for t in query)) or 1.0
+        scored = []
+        for commit_id, score in top:
+            subject = self.db.execute("SELECT subject FROM commits WHERE id = ?", (commit_id,)).fetchone()[0]
+            terms = Counter(tokenize(subject))
+            dot = sum(query[t] * idf[t] * terms[t] * idf[t] for t in query if t in terms)
+            dnorm = math.sqrt(sum((terms[t] * idf.get(t, 1.0)) ** 2 for t in terms)) or 1.0
+            # Path overlap per query path, plus subject similarity; newer commits win ties
+            scored.append((score / len(paths) + dot / (qnorm * dnorm), commit_id, subject))
+        scored.sort(reverse=True)
+        seen = set()
+        subjects = []
+        for _, _, subject in scored:
+            if subject not in seen:
+                seen.add(subject)
+                subjects.append(subject)
+            if len(subjects) == k:
+                break
+        return subjects
+
+    def close(self):
+        self.db.close()
+
+def _parse_log(stream, chunk_size=1 << 16):
+    # Records: "\x1e<sha>\x1f<subject>\0" then "\n<path>\0<path>\0..."
+    buf = b""
+    sha = subject = None
+    paths = []
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        buf += chunk
+        *tokens, buf = buf.split(b"\0")
+        for token in tokens:
+            text = token.decode("utf-8", errors="surrogateescape")
+            if text.startswith("\x1e"):
+                if sha is not None:
+                    yield sha, subject, paths
+                sha, _, subject = text[1:].partition("\x1f")
+                paths = []
+            elif text:
+                paths.append(text[1:] if text.startswith("\n") else text)
+    if sha is not None:
+        yield sha, subject, paths
+
+def update_index(repo_path):
+    # Commits added to the index; 0 if the index cannot be used
+    try:
+        index = HistoryIndex(repo_path)
+        try:
+            return index.update()
+        finally:
+            index.close()
+    except (OSError, sqlite3.Error, subprocess.CalledProcessError):
+        return 0
+
+def similar_subjects(repo_path, paths, k=5, update=True):
+    # Index lookup, brought up to date first unless update=False; empty list if the index cannot be used
+    try:
+        index = HistoryIndex(repo_path)
+        try:
+            if update:
+                index.update()
+            return index.similar(paths, k)
+        finally:
+            index.close()
+    except (OSError, sqlite3.Error):
+        return []
@@ -0,0 +1,181 @@
+# inference_backends.py
+"""Pluggable inference backends for the generation path.
+
+    torch  - fp32 (or the GPU if there is one), prefix KV-cache reuse
+    int8   - torch with dynamic int8 quantization of every linear layer, CPU only
+    onnx   - ONNX Runtime through optimum.onnxruntime (exported once, saved under CACHE_DIR/onnx)
+
+Pick one with COMMIT_AI_BACKEND or `--backend`. Every backend returns plain
+continuation strings, so post_process_continuation / clean_candidate_line work
+unchanged, and keeps a running tokens/sec figure.
+"""
+import os
+import shutil
+import time
+
+from ai_utils import apply_stop_lines, detect_device, generate_from_ids
+from cache_utils import CACHE_DIR
+from trace_utils import count, span
+
+DEFAULT_BACKEND = os.environ.get("COMMIT_AI_BACKEND", "torch")
+
+class InferenceBackend:
+    name = "base"
+    supports_prefix_cache = False
+
+    def __init__(self, model_name):
+        self.model_name = model_name
+        self.model = None
+        self.tok = None
+        self.generated_tokens = 0
+        self.generation_seconds = 0.0
+        with span("model.load", model=model_name, backend=self.name):
+            self.load()
+        if self.tok.pad_token_id is None:
+            self.tok.pad_token = self.tok.eos_token
+
+    def load(self):
+        raise NotImplementedError
+
+    @property
+    def tokens_per_sec(self):
+        return self.generated_tokens / self.generation_seconds if self.generation_seconds else 0.0
+
+    def _generate(self, input_ids, n, **gen_kwargs):
+        import torch
+        ids = torch.tensor([input_ids], device=getattr(self.model, "device", "cpu")).repeat(n, 1)
+        gen_kwargs.setdefault("pad_token_id", self.tok.pad_token_id)
+        apply_stop_lines(gen_kwargs, self.tok)
+        with torch.no_grad():
+            out = self.model.generate(input_ids=ids, attention_mask=torch.ones_like(ids), **gen_kwargs)
+        return out[:, ids.shape[1]:]
+
+    def _decode(self, new_tokens):
+        # Count real tokens only: rows that stopped early are padded
+        generated = int((new_tokens != self.tok.pad_token_id).sum())
+        self.generated_tokens += generated
+        count("tokens.generated", generated)
+        return self.tok.batch_decode(new_tokens, skip_special_tokens=True)
+
+    def generate_ids(self, prefix_ids, suffix_ids, n=3, **gen_kwargs):
+        started = time.perf_counter()
+        try:
+            return self._decode(self._generate(list(prefix_ids) + list(suffix_ids), n, **gen_kwargs))
+        finally:
+            self.generation_seconds += time.perf_counter() - started
+
+    def generate_text(self, prompt, n=3, **gen_kwargs):
+        return self.generate_ids(self.tok.encode(prompt), [], n, **gen_kwargs)
+
+    def generate_batch(self, prompts, n=3, **gen_kwargs):
+        """n continuations for each prompt from one left-padded generate call; one list per prompt."""
+        import torch
+        prompts = list(prompts)
+        if not prompts:
+            return []
+        started = time.perf_counter()
+        try:
+            encoded = [self.tok.encode(p) for p in prompts]
+            width = max(len(ids) for ids in encoded)
+            pad = self.tok.pad_token_id
+            device = getattr(self.model, "device", "cpu")
+            ids = torch.tensor([[pad] * (width - len(e)) + e for e in encoded], device=device)
+            mask = torch.tensor([[0] * (width - len(e)) + [1] * len(e) for e in encoded], device=device)
+            gen_kwargs.setdefault("pad_token_id", pad)
+            apply_stop_lines(gen_kwargs, self.tok)
+            with torch.no_grad():
+                out = self.model.generate(input_ids=ids.repeat_interleave(n, dim=0),
+                                          attention_mask=mask.repeat_interleave(n, dim=0), **gen_kwargs)
+            texts = self._decode(out[:, width:])
+        finally:
+            self.generation_seconds += time.perf_counter() - started
+        return [texts[i * n:(i + 1) * n] for i in range(len(prompts))]
+
+class TorchBackend(InferenceBackend):
+    name = "torch"
+    supports_prefix_cache = True
+
+    def load(self):
+        from transformers import AutoModelForCausalLM, AutoTokenizer
+        self.tok = AutoTokenizer.from_pretrained(self.model_name, use_fast=True)
+        self.model = AutoModelForCausalLM.from_pretrained(self.model_name)
+        device = detect_device()
+        if device >= 0:
+            self.model = self.model.to(f"cuda:{device}")
+        self.model.eval()
+
+    def generate_ids(self, prefix_ids, suffix_ids, n=3, **gen_kwargs):
+        if not prefix_ids or not suffix_ids:
+            return super().generate_ids(prefix_ids, suffix_ids, n, **gen_kwargs)
+        started = time.perf_counter()
+        stats = {}
+        try:
+            outs = generate_from_ids(self.model, self.tok, prefix_ids, suffix_ids, n=n, stats=stats, **gen_kwargs)
+            self.generated_tokens += stats.get("new_tokens", 0)
+            count("tokens.generated", stats.get("new_tokens", 0))
+            return outs
+        except Exception:
+            # Older transformers cannot take a precomputed cache: prefill everything
+            return self._decode(self._generate(list(prefix_ids) + list(suffix_ids), n, **gen_kwargs))
+        finally:
+            self.generation_seconds += time.perf_counter() - started
+
+def linearize_conv1d(model):
+    # GPT-2 style models use transformers' Conv1D, which quantize_dynamic does not touch;
+    # swap each for the equivalent nn.Linear (weights are stored transposed)
+    import torch.nn as nn
+    from transformers.pytorch_utils import Conv1D
+    for module in list(model.modules()):
+        for child_name, child in list(module.named_children()):
+            if isinstance(child, Conv1D):
+                in_features, out_features = child.weight.shape
+                linear = nn.Linear(in_features, out_features)
+                linear.weight.data = child.weight.data.t().contiguous()
+                linear.bias.data = child.bias.data
+                setattr(module, child_name, linear)
+    return model
+
+class QuantizedTorchBackend(TorchBackend):
+    name = "int8"
+
+    def load(self):
+        import torch
+        from transformers import AutoModelForCausalLM, AutoTokenizer
+        self.tok = AutoTokenizer.from_pretrained(self.model_name, use_fast=True)
+        model = linearize_conv1d(AutoModelForCausalLM.from_pretrained(self.model_name).eval())
+        self.model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+def onnx_export_dir(model_name):
+    return os.path.join(CACHE_DIR, "onnx", model_name.replace("/", "--"))
+
+class OnnxBackend(InferenceBackend):
+    name = "onnx"
+
+    def load(self):
+        from optimum.onnxruntime import ORTModelForCausalLM
+        from transformers import AutoTokenizer
+        self.tok = AutoTokenizer.from_pretrained(self.model_name, use_fast=True)
+        # The export takes minutes for the large models: do it once and load the saved graph after
+        export_dir = onnx_export_dir(self.model_name)
+        if os.path.isfile(os.path.join(export_dir, "config.json")):
+            self.model = ORTModelForCausalLM.from_pretrained(export_dir, use_cache=True)
+            return
+        self.model = ORTModelForCausalLM.from_pretrained(self.model_name, export=True, use_cache=True)
+        tmp = export_dir + f".tmp{os.getpid()}"
+        self.model.save_pretrained(tmp)
+        try:
+            os.replace(tmp, export_dir)
+        except OSError:
+            shutil.rmtree(tmp, ignore_errors=True)  # another process saved it first
+
+BACKENDS = {
+    "torch": TorchBackend,
+    "int8": QuantizedTorchBackend,
+    "onnx": OnnxBackend,
+}
+
+def load_backend(name=None, model_name="gpt2-large"):
+    name = name or DEFAULT_BACKEND
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown inference backend {name!r}; choose from {', '.join(BACKENDS)}")
+    return BACKENDS[name](model_name)
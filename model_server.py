@@ -0,0 +1,311 @@
+# model_server.py
+"""Long-lived local inference daemon shared by the GUI, the CLI and git hooks.
+
+The model is loaded once; clients talk newline-delimited JSON over a Unix socket.
+Requests that arrive together (same sampling parameters) are batched into one
+generation call. A request that comes alone may name a `prefix` of its prompt (seed
+examples + rules); the daemon keeps that header's past key/values across requests, so
+repeat calls from one repo only prefill the diff. The daemon exits after
+`idle_timeout` seconds without requests.
+
+    python model_server.py --model gpt2-large          # start in the foreground
+    python model_server.py --stub                      # deterministic stub model, no transformers
+"""
+import argparse
+import json
+import os
+import queue
+import socket
+import socketserver
+import subprocess
+import sys
+import threading
+import time
+
+from cache_utils import CACHE_DIR
+from trace_utils import count, span
+
+SOCKET_PATH = os.environ.get("COMMIT_AI_SOCKET", os.path.join(CACHE_DIR, "model.sock"))
+DEFAULT_MODEL = "gpt2-large"
+BATCH_WINDOW = 0.025
+MAX_BATCH = 8
+IDLE_TIMEOUT = 15 * 60
+
+# -----------------------------
+# Models
+# -----------------------------
+class PipelineModel:
+    def __init__(self, model_name=DEFAULT_MODEL):
+        from transformers import pipeline
+        from ai_utils import detect_device
+        self.name = model_name
+        self.gen = pipeline("text-generation", model=model_name, device=detect_device())
+        try:
+            self.gen.model.config.pad_token_id = self.gen.model.config.eos_token_id
+        except Exception:
+            pass
+
+    def generate_batch(self, prompts, n, **params):
+        from ai_utils import generate_batch
+        params.setdefault("return_full_text", False)
+        return generate_batch(self.gen, prompts, n=n, batch_size=MAX_BATCH, **params)
+
+    def generate_prefixed(self, prefix, prompt, n, **params):
+        from ai_utils import generate_from_ids
+        params.pop("return_full_text", None)
+        tok = self.gen.tokenizer
+        stats = {}
+        try:
+            outs = generate_from_ids(self.gen.model, tok, tok.encode(prefix),
+                                     tok.encode(prompt[len(prefix):], add_special_tokens=False),
+                                     n=n, stats=stats, **params)
+        except Exception:
+            # Older transformers cannot take a precomputed cache: prefill everything
+            return self.generate_batch([prompt], n, **params)[0]
+        count("tokens.generated", stats.get("new_tokens", 0))
+        return outs
+
+class BackendModel:
+    # Serves through an inference_backends backend (torch / int8 / onnx)
+    def __init__(self, model_name=DEFAULT_MODEL, backend=None):
+        from inference_backends import load_backend
+        self.backend = load_backend(backend, model_name)
+        self.name = f"{model_name}:{self.backend.name}"
+
+    def generate_batch(self, prompts, n, **params):
+        params.pop("return_full_text", None)
+        return self.backend.generate_batch(prompts, n=n, **params)
+
+    def generate_prefixed(self, prefix, prompt, n, **params):
+        if not self.backend.supports_prefix_cache:
+            return self.generate_batch([prompt], n, **params)[0]
+        params.pop("return_full_text", None)
+        tok = self.backend.tok
+        return self.backend.generate_ids(tok.encode(prefix), tok.encode(prompt[len(prefix):], add_special_tokens=False),
+                                         n, **params)
+
+class StubModel:
+    # Deterministic stand-in for tests and offline runs
+    name = "stub"
+
+    def __init__(self, *args, **kwargs):
+        self.calls = []
+        self.prefixes = []
+
+    def generate_batch(self, prompts, n, **params):
+        self.calls.append(len(prompts))
+        return [[f"chore: stub suggestion {i + 1}\n" for i in range(n)] for _ in prompts]
+
+    def generate_prefixed(self, prefix, prompt, n, **params):
+        self.prefixes.append(prefix)
+        return self.generate_batch([prompt], n, **params)[0]
+
+# -----------------------------
+# Server
+# -----------------------------
+class _Job:
+    def __init__(self, prompt, n, params, prefix=None):
+        self.prompt = prompt
+        # Only a real leading part of the prompt can come from the prefix cache
+        self.prefix = prefix if prefix and prompt.startswith(prefix) else None
+        self.n = n
+        self.params = params
+        self.group = (n, json.dumps(params, sort_keys=True))
+        self.done = threading.Event()
+        self.outputs = None
+        self.error = None
+
+class ModelServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, model, socket_path=SOCKET_PATH, idle_timeout=IDLE_TIMEOUT,
+                 batch_window=BATCH_WINDOW, max_batch=MAX_BATCH):
+        self.model = model
+        self.idle_timeout = idle_timeout
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self.jobs = queue.Queue()
+        self.last_activity = time.monotonic()
+        self.in_flight = 0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(socket_path), exist_ok=True)
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)  # stale socket from a crashed daemon
+        super().__init__(socket_path, _Handler)
+        threading.Thread(target=self._model_loop, daemon=True).start()
+        threading.Thread(target=self._idle_watch, daemon=True).start()
+
+    def submit(self, prompt, n, params, prefix=None):
+        job = _Job(prompt, n, params, prefix)
+        with self._lock:
+            self.in_flight += 1
+            self.last_activity = time.monotonic()
+        self.jobs.put(job)
+        job.done.wait()
+        with self._lock:
+            self.in_flight -= 1
+            self.last_activity = time.monotonic()
+        if job.error is not None:
+            raise job.error
+        return job.outputs
+
+    def _model_loop(self):
+        held = []
+        while True:
+            first = held.pop(0) if held else self.jobs.get()
+            batch = [first]
+            deadline = time.monotonic() + self.batch_window
+            # Collect whatever arrives inside the window; other parameter groups wait for the next round
+            while len(batch) < self.max_batch:
+                try:
+                    job = self.jobs.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    break
+                (batch if job.group == first.group else held).append(job)
+            try:
+                if len(batch) == 1 and first.prefix and hasattr(self.model, "generate_prefixed"):
+                    # Alone: reuse the cached header instead of prefilling the whole prompt
+                    outputs = [self.model.generate_prefixed(first.prefix, first.prompt, first.n, **first.params)]
+                else:
+                    outputs = self.model.generate_batch([j.prompt for j in batch], first.n, **first.params)
+                for job, out in zip(batch, outputs):
+                    job.outputs = out
+            except Exception as e:
+                for job in batch:
+                    job.error = e
+            for job in batch:
+                job.done.set()
+
+    def _idle_watch(self):
+        while True:
+            time.sleep(min(self.idle_timeout, 5))
+            with self._lock:
+                idle = self.in_flight == 0 and time.monotonic() - self.last_activity >= self.idle_timeout
+            if idle:
+                threading.Thread(target=self.shutdown, daemon=True).start()
+                return
+
+    def server_close(self):
+        super().server_close()
+        try:
+            os.unlink(self.server_address)
+        except OSError:
+            pass
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            op = None
+            try:
+                req = json.loads(line)
+                op = req.get("op")
+                if op == "ping":
+                    resp = {"ok": True, "model": self.server.model.name}
+                elif op == "generate":
+                    outputs = self.server.submit(req["prompt"], int(req.get("n", 1)), req.get("params") or {},
+                                                 req.get("prefix"))
+                    resp = {"ok": True, "outputs": outputs}
+                elif op == "shutdown":
+                    resp = {"ok": True}
+                else:
+                    resp = {"ok": False, "error": f"unknown op {op!r}"}
+            except Exception as e:
+                resp = {"ok": False, "error": str(e)}
+            self.wfile.write((json.dumps(resp) + "\n").encode("utf-8"))
+            self.wfile.flush()
+            if op == "shutdown":
+                # Only after the reply is out: serve_forever returning ends the process
+                threading.Thread(target=self.server.shutdown, daemon=True).start()
+                return
+
+# -----------------------------
+# Client
+# -----------------------------
+class ModelClient:
+    def __init__(self, socket_path=SOCKET_PATH, timeout=120):
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self.model_name = None
+
+    def _call(self, payload, timeout=None):
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(timeout or self.timeout)
+            sock.connect(self.socket_path)
+            sock.sendall((json.dumps(payload) + "\n").encode("utf-8"))
+            with sock.makefile("rb") as f:
+                resp = json.loads(f.readline() or b"{}")
+        if not resp.get("ok"):
+            raise RuntimeError(resp.get("error", "model server error"))
+        return resp
+
+    def available(self):
+        if not hasattr(socket, "AF_UNIX") or not os.path.exists(self.socket_path):
+            return False
+        try:
+            self.model_name = self._call({"op": "ping"}, timeout=2)["model"]
+            return True
+        except (OSError, ValueError, RuntimeError):
+            return False
+
+    def generate(self, prompt, n=1, prefix=None, **params):
+        # prefix: leading part of prompt that repeats across requests (kept cached by the daemon)
+        payload = {"op": "generate", "prompt": prompt, "n": n, "params": params}
+        if prefix:
+            payload["prefix"] = prefix
+        with span("generate.server", n=n):
+            return self._call(payload)["outputs"]
+
+    def shutdown(self):
+        self._call({"op": "shutdown"}, timeout=5)
+
+class ServerGenerator:
+    # Callable with the pipeline's calling convention, backed by the daemon
+    def __init__(self, client):
+        self.client = client
+
+    def __call__(self, prompt, num_return_sequences=1, return_full_text=True, **params):
+        params.pop("truncation", None)
+        outputs = self.client.generate(prompt, n=num_return_sequences, **params)
+        return [{"generated_text": prompt + o if return_full_text else o} for o in outputs]
+
+def ensure_server(model_name=DEFAULT_MODEL, socket_path=SOCKET_PATH, wait=300, stub=False):
+    # Start a detached daemon unless one is already listening; returns a connected client
+    client = ModelClient(socket_path)
+    if client.available():
+        return client
+    args = [sys.executable, os.path.abspath(__file__), "--model", model_name, "--socket", socket_path]
+    if stub:
+        args.append("--stub")
+    subprocess.Popen(args, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                     stderr=subprocess.DEVNULL, start_new_session=True)
+    deadline = time.monotonic() + wait
+    while time.monotonic() < deadline:
+        if client.available():
+            return client
+        time.sleep(0.2)
+    raise RuntimeError("model server did not start")
+
+def main():
+    parser = argparse.ArgumentParser(description="Local commit-message model server")
+    parser.add_argument("--model", default=DEFAULT_MODEL)
+    parser.add_argument("--socket", default=SOCKET_PATH)
+    parser.add_argument("--idle-timeout", type=float, default=IDLE_TIMEOUT)
+    parser.add_argument("--stub", action="store_true", help="serve the deterministic stub model")
+    parser.add_argument("--backend", default=None,
+                        help="serve through an inference backend (torch, int8, onnx) instead of the pipeline")
+    args = parser.parse_args()
+    if args.stub:
+        model = StubModel()
+    elif args.backend:
+        model = BackendModel(args.model, args.backend)
+    else:
+        model = PipelineModel(args.model)
+    server = ModelServer(model, args.socket, idle_timeout=args.idle_timeout)
+    print(f"Serving {model.name} on {args.socket}")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    main()
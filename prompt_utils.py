@@ -0,0 +1,84 @@
+# Prompt template shared by debug_commit_ai.build_prompt and the token-id assembler
+from trace_utils import count, span
+
+EXAMPLES_HEADER = "Example commits:\n"
+RULES = (
+    "Rules:\n"
+    "- Write Conventional Commit messages.\n"
+    "- Format: type: description\n"
+    "- Imperative mood, under 12 words.\n"
+    "- Summarize actual changes from DIFF.\n"
+    "- Do not copy code. Write only commit messages.\n"
+    "- Only output commit messages. Do not include code, comments, or stack traces.\n\n"
+)
+DIFF_HEADER = "DIFF:\n"
+
+def prompt_prefix(seed_examples):
+    return EXAMPLES_HEADER + "\n".join(seed_examples) + "\n\n" + RULES
+
+def prompt_suffix(diff_summary, diff_text, candidates=3):
+    return f"{diff_summary}\n\n" + DIFF_HEADER + f"{diff_text}\n\n" + instruction(candidates)
+
+def instruction(candidates):
+    return f"Write {candidates} messages:\n1. "
+
+class PromptAssembler:
+    """Builds the prompt directly as token ids under a fixed token budget.
+
+    Static sections (headers, rules, each seed example, the closing instruction) are
+    tokenized once and cached. Examples and the file summary get their own budgets;
+    only the diff is truncated, so the "Write N messages: 1." tail is always kept.
+    """
+    MAX_CACHED = 4096
+
+    def __init__(self, tok, max_tokens=800, examples_budget=200, summary_budget=80):
+        self.tok = tok
+        self.max_tokens = max_tokens
+        self.examples_budget = examples_budget
+        self.summary_budget = summary_budget
+        self._ids = {}
+
+    def ids(self, text):
+        cached = self._ids.get(text)
+        if cached is None:
+            if len(self._ids) >= self.MAX_CACHED:
+                self._ids.clear()
+            cached = self._ids[text] = self.tok.encode(text, add_special_tokens=False)
+        return cached
+
+    def prefix_ids(self, seed_examples):
+        # Examples + rules; whole example lines are dropped once the examples budget is spent
+        ids = list(self.ids(EXAMPLES_HEADER))
+        spent = 0
+        for example in seed_examples:
+            line = self.ids(example + "\n")
+            if spent + len(line) > self.examples_budget:
+                break
+            ids.extend(line)
+            spent += len(line)
+        ids.extend(self.ids("\n" + RULES))
+        return ids
+
+    def suffix_ids(self, diff_summary, diff_text, candidates=3, used=0):
+        summary = self.tok.encode(f"{diff_summary}\n\n", add_special_tokens=False)[:self.summary_budget]
+        head = self.ids(DIFF_HEADER)
+        tail = self.ids("\n\n" + instruction(candidates))
+        room = self.max_tokens - used - len(summary) - len(head) - len(tail)
+        diff = self.tok.encode(diff_text, add_special_tokens=False)[:max(room, 0)] if room > 0 else []
+        return summary + head + diff + tail
+
+    def assemble(self, seed_examples, diff_summary, diff_text, candidates=3):
+        # (prefix ids, suffix ids); the prefix only depends on the seed examples
+        with span("tokenize"):
+            prefix = self.prefix_ids(seed_examples)
+            suffix = self.suffix_ids(diff_summary, diff_text, candidates, used=len(prefix))
+        count("prompt.tokens", len(prefix) + len(suffix))
+        return prefix, suffix
+
+_assemblers = {}
+
+def get_assembler(tok, max_tokens=800):
+    key = (id(tok), max_tokens)
+    if key not in _assemblers:
+        _assemblers[key] = PromptAssembler(tok, max_tokens)
+    return _assemblers[key]
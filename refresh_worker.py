@@ -0,0 +1,69 @@
+import logging
+import queue
+import threading
+
+logger = logging.getLogger("commit_ai_debug")
+
+class RefreshWorker:
+    # Runs git work on a background thread and hands results back through root.after.
+    # Requests that arrive while a refresh is running collapse into a single rerun.
+    # collect(force) may return None to signal "nothing changed".
+    def __init__(self, root, collect, apply, poll_ms=50):
+        self.root = root
+        self.collect = collect
+        self.apply = apply
+        self.poll_ms = poll_ms
+        self._lock = threading.Lock()
+        self._running = False
+        self._pending = False
+        self._force = False
+        self._polling = False
+        self._results = queue.Queue()
+
+    def request(self, force=True):
+        # Tk thread only
+        with self._lock:
+            self._force = self._force or force
+            if self._running:
+                self._pending = True
+                return
+            self._running = True
+        threading.Thread(target=self._run, daemon=True).start()
+        if not self._polling:
+            self._polling = True
+            self.root.after(self.poll_ms, self._poll)
+
+    @property
+    def busy(self):
+        with self._lock:
+            return self._running
+
+    def _run(self):
+        while True:
+            with self._lock:
+                force, self._force = self._force, False
+            try:
+                self._results.put(self.collect(force))
+            except Exception:
+                logger.exception("refresh failed")
+            with self._lock:
+                if not self._pending:
+                    self._running = False
+                    return
+                self._pending = False
+
+    def _poll(self):
+        latest = None
+        while True:
+            try:
+                result = self._results.get_nowait()
+            except queue.Empty:
+                break
+            if result is not None:
+                latest = result
+        if latest is not None:
+            self.apply(latest)
+        if self.busy or not self._results.empty():
+            self.root.after(self.poll_ms, self._poll)
+        else:
+            self._polling = False
@@ -0,0 +1,219 @@
+# retro_cli.py
+"""Suggest a Conventional Commit message for every existing commit in a range.
+
+    python retro_cli.py v1.0..main --repo ~/legacy --out retro.jsonl
+    python retro_cli.py v1.0..main --repo ~/legacy --out retro.jsonl     # rerun resumes
+
+A producer thread streams `git log -p --reverse --topo-order` and cuts each commit's
+patch down with the same bounded reader and compaction as the staged diff. A consumer
+batches the prompts into the model and appends one JSON line per commit. After every
+batch the tips of everything finished so far (finished commits with no finished child,
+one per line) go to the checkpoint file (default: <out>.checkpoint). Parents always come
+before children, so the finished commits are exactly the tips and their ancestors; a
+rerun excludes those and continues where the interrupted run stopped, side branches included.
+"""
+import argparse
+import itertools
+import json
+import os
+import queue
+import subprocess
+import sys
+import threading
+import time
+
+from batch_cli import DEFAULT_CANDIDATES, DEFAULT_MAX_TOKENS, DEFAULT_READ_BYTES, _seed_examples, \
+    generate_results, load_generator
+from diff_utils import DiffTally, _read_lines, compact_diff, is_generated_path, parse_diff
+from git_backend import get_backend
+from model_server import DEFAULT_MODEL, MAX_BATCH
+from prompt_utils import prompt_prefix, prompt_suffix
+import trace_utils
+
+COMMIT_MARK = b"\x1e"
+QUEUE_SIZE = 64
+PROGRESS_SECONDS = 10
+
+def iter_commit_diffs(repo, rev_args, max_bytes=DEFAULT_READ_BYTES, max_tokens=DEFAULT_MAX_TOKENS, unified=1):
+    """Yield (sha, parents, subject, compacted diff, numstat) per commit, oldest first.
+
+    Merges are yielded too (git log -p prints no patch for them) so callers can follow
+    the graph; memory stays per-commit.
+    """
+    args = ["log", "-p", "--reverse", "--topo-order", "--no-color",
+            f"--unified={unified}", "--format=%x1e%H%x1f%P%x1f%s"] + list(rev_args) + ["--"]
+    proc = get_backend().popen(args, repo, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    commit = [0]
+
+    def boundary(raw):
+        if raw.startswith(COMMIT_MARK):
+            commit[0] += 1
+        return commit[0]
+
+    done = False
+    try:
+        for _, group in itertools.groupby(_read_lines(proc.stdout), key=boundary):
+            first = next(group)
+            if not first.startswith(COMMIT_MARK):
+                continue
+            sha, parents, subject = first[1:].decode("utf-8", errors="replace").rstrip("\n").split("\x1f", 2)
+            tally = DiffTally(group)
+            files = list(parse_diff(tally, max_bytes, skip=is_generated_path))
+            tally.drain()
+            yield sha, parents.split(), subject, compact_diff(files, max_tokens, tally.numstat), list(tally.counts)
+        done = True
+    finally:
+        if not done:
+            proc.kill()
+        proc.stdout.close()
+        err = proc.stderr.read().decode("utf-8", errors="replace")
+        proc.stderr.close()
+        if proc.wait() and done:
+            raise RuntimeError(err.strip() or "git log failed")
+
+def read_checkpoint(path):
+    # Finished tips, one per line (a single SHA in checkpoints from older versions)
+    try:
+        with open(path, encoding="utf-8") as f:
+            return f.read().split()
+    except FileNotFoundError:
+        return []
+
+def write_checkpoint(path, tips):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write("".join(sha + "\n" for sha in tips))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+def produce(args, rev_args, seeds, out_queue, skip_subject):
+    # Runs on the producer thread; always ends the stream with None (or an exception)
+    prefix = prompt_prefix(seeds)
+    try:
+        for sha, parents, subject, diff_text, paths in iter_commit_diffs(args.repo, rev_args,
+                                                                         args.max_diff_bytes, args.max_tokens):
+            item = {"id": sha, "sha": sha, "parents": parents, "subject": subject, "files": paths,
+                    "candidates_wanted": args.candidates}
+            if len(parents) > 1:
+                item["merge"] = True  # no suggestion, only moves the checkpoint tips
+            elif not skip_subject(subject):
+                summary = "Changed files: " + ", ".join(paths[:10]) + (", ..." if len(paths) > 10 else "")
+                item["prompt"] = prefix + prompt_suffix(summary, diff_text, args.candidates)
+            out_queue.put(item)
+        out_queue.put(None)
+    except BaseException as e:
+        out_queue.put(e)
+
+def run_retro(args, out, log=sys.stderr):
+    rev_args = [args.range]
+    tips = read_checkpoint(args.checkpoint)
+    if tips:
+        rev_args += ["--not"] + tips
+        print(f"resuming after {', '.join(t[:12] for t in tips)}", file=log)
+
+    skip_subject = lambda subject: False
+    if args.only_nonconventional:
+        from export_utils import CONVENTIONAL_RE
+        skip_subject = lambda subject: bool(CONVENTIONAL_RE.match(subject))
+
+    seeds = _seed_examples(args.repo, [])
+    items = queue.Queue(maxsize=args.queue_size)
+    producer = threading.Thread(target=produce, args=(args, rev_args, seeds, items, skip_subject), daemon=True)
+    producer.start()
+
+    stats = {"commits": 0, "suggested": 0, "skipped": 0, "batches": 0, "generate_seconds": 0.0}
+    started = time.perf_counter()
+    model = None
+    batch = []
+    last_sha = None
+    last_report = started
+
+    def flush():
+        nonlocal model, last_report
+        if batch:
+            if model is None:
+                with trace_utils.span("model.load"):
+                    model = load_generator(args)
+            generate_results(model, batch, stats)
+            for item in batch:
+                candidates = item.get("candidates") or []
+                record = {"sha": item["sha"], "original": item["subject"],
+                          "suggestion": candidates[0] if candidates else None,
+                          "candidates": candidates, "files": len(item["files"])}
+                if item.get("error"):
+                    record["error"] = item["error"]
+                out.write(json.dumps(record, ensure_ascii=False) + "\n")
+                stats["suggested"] += bool(candidates)
+            batch.clear()
+        out.flush()
+        if last_sha:
+            write_checkpoint(args.checkpoint, tips)
+        now = time.perf_counter()
+        if now - last_report < PROGRESS_SECONDS:
+            return
+        last_report = now
+        elapsed = now - started
+        print(f"{stats['commits']} commits, {stats['commits'] / elapsed:.1f} commits/s, "
+              f"last {last_sha[:12] if last_sha else '-'}", file=log)
+
+    while True:
+        item = items.get()
+        if isinstance(item, BaseException):
+            flush()
+            raise item
+        if item is None:
+            break
+        last_sha = item["sha"]
+        tips = [t for t in tips if t not in item["parents"]] + [item["sha"]]
+        if item.get("merge"):
+            continue
+        stats["commits"] += 1
+        if "prompt" in item:
+            batch.append(item)
+        else:
+            stats["skipped"] += 1
+        if len(batch) >= args.batch_size:
+            flush()
+        if args.limit and stats["commits"] >= args.limit:
+            break
+    flush()
+
+    elapsed = time.perf_counter() - started
+    stats["seconds"] = round(elapsed, 3)
+    stats["generate_seconds"] = round(stats["generate_seconds"], 3)
+    stats["commits_per_sec"] = round(stats["commits"] / elapsed, 2) if elapsed else 0.0
+    return stats
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("range", help="revision range, e.g. A..B")
+    parser.add_argument("--repo", default=".")
+    parser.add_argument("--out", required=True, help="JSONL output, appended to")
+    parser.add_argument("--checkpoint", help="checkpoint file (default: <out>.checkpoint)")
+    parser.add_argument("--only-nonconventional", action="store_true",
+                        help="skip commits whose subject is already a Conventional Commit")
+    parser.add_argument("--limit", type=int, default=0, help="stop after this many commits (0 = all)")
+    parser.add_argument("--queue-size", type=int, default=QUEUE_SIZE,
+                        help="commits buffered between the git reader and the model")
+    parser.add_argument("--max-diff-bytes", type=int, default=DEFAULT_READ_BYTES,
+                        help="bytes of each commit's patch read before compaction")
+    parser.add_argument("--max-tokens", type=int, default=DEFAULT_MAX_TOKENS)
+    parser.add_argument("--batch-size", type=int, default=MAX_BATCH)
+    parser.add_argument("--candidates", type=int, default=DEFAULT_CANDIDATES)
+    parser.add_argument("--model", default=DEFAULT_MODEL)
+    parser.add_argument("--backend", default=None, help="torch, int8 or onnx (in-process only)")
+    parser.add_argument("--no-server", action="store_true", help="do not use a running model_server.py")
+    parser.add_argument("--stub", action="store_true", help="deterministic stub model, for dry runs")
+    args = parser.parse_args(argv)
+    args.repo = os.path.abspath(os.path.expanduser(args.repo))
+    args.checkpoint = args.checkpoint or args.out + ".checkpoint"
+
+    with open(args.out, "a", encoding="utf-8") as out:
+        stats = run_retro(args, out)
+    print(f"done: {stats['commits']} commits ({stats['suggested']} suggested, {stats['skipped']} skipped) "
+          f"in {stats['seconds']}s, {stats['commits_per_sec']} commits/s", file=sys.stderr)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
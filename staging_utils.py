@@ -0,0 +1,116 @@
+# staging_utils.py
+"""Stage and commit off the Tk thread.
+
+Selected paths go to `git add` on stdin (--pathspec-from-file), CHUNK_SIZE at a time,
+so 2,000 checked files cost a handful of processes instead of 2,000. paths=None means
+"stage all": one `git add -A`. Progress and the final result come back through
+a queue polled with after(); cancel() stops before the next chunk and skips the commit.
+"""
+import os
+import queue
+import re
+import subprocess
+import threading
+
+from git_backend import get_backend
+
+# Paths per `git add`; also how often progress is reported and cancel is checked
+CHUNK_SIZE = 500
+POLL_MS = 50
+
+_UNMATCHED_RE = re.compile(r"pathspec '(.*)' did not match any files")
+
+def stage_all(repo_path):
+    get_backend().run(["add", "-A"], repo_path, check=True, capture_output=True)
+
+def skip_staged_deletions(repo_path, paths, entries):
+    # "D " status entries are already removed from the index; with no file on disk there
+    # is nothing left to add and git would reject the whole chunk
+    deleted = {path for xy, path, _ in entries if xy == "D "}
+    return [p for p in paths if p not in deleted or os.path.lexists(os.path.join(repo_path, p))]
+
+def stage_paths(repo_path, paths):
+    """Stage exactly these paths (additions, edits and deletions) with one `git add`."""
+    paths = list(paths)
+    while paths:
+        # Literal pathspecs: a file named "*.py" must not stage every .py file
+        result = get_backend().run(["--literal-pathspecs", "add", "-A", "--pathspec-from-file=-",
+                                    "--pathspec-file-nul"], repo_path,
+                                   input=b"".join(p.encode("utf-8", "surrogateescape") + b"\0" for p in paths),
+                                   capture_output=True)
+        if not result.returncode:
+            return
+        # Safety net for a stale snapshot: a path that matches nothing fails the whole call
+        err = result.stderr.decode("utf-8", errors="replace")
+        match = _UNMATCHED_RE.search(err)
+        if not match or match.group(1) not in paths:
+            raise subprocess.CalledProcessError(result.returncode, result.args, result.stdout, result.stderr)
+        paths.remove(match.group(1))
+
+class StagingJob:
+    # on_progress(done, total) and on_done(error) run on the Tk thread;
+    # error is None after a commit, "cancelled", or git's message
+    def __init__(self, widget, repo_path, message, paths=None, on_progress=None, on_done=None,
+                 chunk_size=CHUNK_SIZE, poll_ms=POLL_MS):
+        self.widget = widget
+        self.repo_path = repo_path
+        self.message = message
+        self.paths = None if paths is None else list(paths)
+        self.on_progress = on_progress
+        self.on_done = on_done
+        self.chunk_size = chunk_size
+        self.poll_ms = poll_ms
+        self._cancel = threading.Event()
+        self._events = queue.Queue()
+        self.finished = False
+
+    def start(self):
+        threading.Thread(target=self._run, daemon=True).start()
+        self.widget.after(self.poll_ms, self._poll)
+        return self
+
+    def cancel(self):
+        self._cancel.set()
+
+    def _run(self):
+        try:
+            if self.paths is None:
+                self._events.put(("progress", 0, 1))
+                stage_all(self.repo_path)
+                self._events.put(("progress", 1, 1))
+            else:
+                total = len(self.paths)
+                for start in range(0, total, self.chunk_size):
+                    if self._cancel.is_set():
+                        self._events.put(("done", "cancelled"))
+                        return
+                    stage_paths(self.repo_path, self.paths[start:start + self.chunk_size])
+                    self._events.put(("progress", min(start + self.chunk_size, total), total))
+            if self._cancel.is_set():
+                self._events.put(("done", "cancelled"))
+                return
+            get_backend().run(["commit", "-m", self.message], self.repo_path, check=True, capture_output=True)
+            self._events.put(("done", None))
+        except subprocess.CalledProcessError as e:
+            err = e.stderr or e.stdout or b""
+            if isinstance(err, bytes):
+                err = err.decode("utf-8", errors="replace")
+            self._events.put(("done", err.strip() or str(e)))
+        except Exception as e:
+            self._events.put(("done", f"{type(e).__name__}: {e}"))
+
+    def _poll(self):
+        while True:
+            try:
+                event = self._events.get_nowait()
+            except queue.Empty:
+                break
+            if event[0] == "progress":
+                if self.on_progress:
+                    self.on_progress(event[1], event[2])
+            else:
+                self.finished = True
+                if self.on_done:
+                    self.on_done(event[1])
+                return
+        self.widget.after(self.poll_ms, self._poll)
@@ -0,0 +1,66 @@
+# tests/test_ai_utils.py
+import importlib.util
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+HAVE_TORCH = all(importlib.util.find_spec(m) for m in ("torch", "transformers"))
+CONTINUATION = "feat: add a\nfix: handle b\nchore: bump c\nmore text\n"
+
+class CharTokenizer:
+    # One token per character; 0 is padding
+    pad_token_id = 0
+    eos_token = "\0"
+
+    def encode(self, text, add_special_tokens=False):
+        return [ord(c) for c in text]
+
+    def batch_decode(self, rows, skip_special_tokens=True):
+        return ["".join(chr(int(i)) for i in row if int(i)) for row in rows]
+
+class FakePipeline:
+    # Mimics the text-generation pipeline: left-padded sub-batches of batch_size prompts,
+    # one generate() loop per sub-batch, stopping_criteria consulted after every token
+    def __init__(self):
+        self.tokenizer = CharTokenizer()
+
+    def __call__(self, prompts, num_return_sequences=1, batch_size=8, stopping_criteria=None, **kwargs):
+        import torch
+        outputs = []
+        for start in range(0, len(prompts), batch_size):
+            chunk = prompts[start:start + batch_size]
+            width = max(len(p) for p in chunk)
+            rows = [[0] * (width - len(p)) + self.tokenizer.encode(p) for p in chunk]
+            done = [False] * len(rows)
+            for token in self.tokenizer.encode(CONTINUATION):
+                for row, stopped in zip(rows, done):
+                    row.append(0 if stopped else token)
+                flags = [False] * len(rows)
+                for criterion in stopping_criteria or []:
+                    result = criterion(torch.tensor(rows), None)
+                    flags = [f or bool(r) for f, r in zip(flags, result)]
+                done = [d or f for d, f in zip(done, flags)]
+                if all(done):
+                    break
+            for row in rows:
+                text = self.tokenizer.batch_decode([row[width:]])[0]
+                outputs.append([{"generated_text": text}] * num_return_sequences)
+        return outputs
+
+@unittest.skipUnless(HAVE_TORCH, "needs torch and transformers")
+class GenerateBatchStopperTest(unittest.TestCase):
+    def test_each_sub_batch_stops_after_its_own_lines(self):
+        from ai_utils import generate_batch
+        # Second sub-batch is much wider and its prompt lines end in "{", which the
+        # stopper treats as code if it decodes from the first sub-batch's offset
+        prompts = ["short a", "short b"] + ["fn x() {\n" * 20 + "Message:\n"] * 2
+        results = generate_batch(FakePipeline(), prompts, n=1, batch_size=2, stop_lines=3)
+        self.assertEqual(len(results), 4)
+        for texts in results:
+            lines = [l for l in texts[0].split("\n") if l]
+            self.assertEqual(lines, ["feat: add a", "fix: handle b", "chore: bump c"])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,52 @@
+# tests/test_git_backend.py
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import git_backend
+
+# Every commit gets the same timestamp, so only the tie-break decides the order
+SAME_DATE = "2024-01-01T12:00:00+00:00"
+
+def git(repo, *args):
+    env = dict(os.environ, GIT_AUTHOR_DATE=SAME_DATE, GIT_COMMITTER_DATE=SAME_DATE)
+    return subprocess.run(["git", "-C", repo] + list(args), check=True, capture_output=True,
+                          text=True, env=env).stdout.strip()
+
+def commit(repo, name, subject):
+    with open(os.path.join(repo, name), "w", encoding="utf-8") as f:
+        f.write(subject + "\n")
+    git(repo, "add", name)
+    git(repo, "commit", "-q", "-m", subject)
+
+class LogSubjectsParityTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.repo = self.tmp.name
+        git(self.repo, "init", "-q", "-b", "main")
+        git(self.repo, "config", "user.email", "test@example.com")
+        git(self.repo, "config", "user.name", "test")
+        commit(self.repo, "init.txt", "feat: init")
+        git(self.repo, "checkout", "-q", "-b", "side")
+        commit(self.repo, "side.txt", "fix: side")
+        git(self.repo, "checkout", "-q", "main")
+        commit(self.repo, "main.txt", "docs: main")
+        git(self.repo, "merge", "-q", "--no-ff", "-m", "merge side", "side")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_catfile_matches_git_log_on_equal_dates(self):
+        catfile = git_backend.CatFileBackend()
+        try:
+            expected = git_backend.GitBackend().log_subjects(self.repo, 10)
+            self.assertEqual([s for _, s in expected], ["merge side", "docs: main", "fix: side", "feat: init"])
+            self.assertEqual(catfile.log_subjects(self.repo, 10), expected)
+        finally:
+            catfile.close()
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,43 @@
+# tests/test_model_server.py
+import os
+import sys
+import tempfile
+import threading
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import model_server
+
+@unittest.skipUnless(hasattr(model_server.socket, "AF_UNIX"), "needs Unix sockets")
+class PrefixRequestTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.model = model_server.StubModel()
+        self.server = model_server.ModelServer(self.model, os.path.join(self.tmp.name, "model.sock"),
+                                               batch_window=0.01)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.client = model_server.ModelClient(self.server.server_address)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.tmp.cleanup()
+
+    def test_lone_request_uses_prefix(self):
+        outs = self.client.generate("header\ndiff\n", n=2, prefix="header\n", max_new_tokens=5)
+        self.assertEqual(len(outs), 2)
+        self.assertEqual(self.model.prefixes, ["header\n"])
+
+    def test_prefix_must_lead_the_prompt(self):
+        self.client.generate("diff\n", n=1, prefix="header\n")
+        self.assertEqual(self.model.prefixes, [])
+        self.assertEqual(self.model.calls, [1])
+
+    def test_server_generator_forwards_prefix(self):
+        gen = model_server.ServerGenerator(self.client)
+        outs = gen("header\ndiff\n", num_return_sequences=1, prefix="header\n", truncation=True)
+        self.assertTrue(outs[0]["generated_text"].startswith("header\ndiff\n"))
+        self.assertEqual(self.model.prefixes, ["header\n"])
+
+if __name__ == "__main__":
+    unittest.main()
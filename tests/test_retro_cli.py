@@ -0,0 +1,70 @@
+# tests/test_retro_cli.py
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import retro_cli
+
+def git(repo, *args):
+    return subprocess.run(["git", "-C", repo] + list(args), check=True, capture_output=True,
+                          text=True).stdout.strip()
+
+def commit(repo, name):
+    with open(os.path.join(repo, name), "w", encoding="utf-8") as f:
+        f.write(name + "\n")
+    git(repo, "add", name)
+    git(repo, "commit", "-q", "-m", f"update {name}")
+    return git(repo, "rev-parse", "HEAD")
+
+class RetroResumeTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.repo = os.path.join(self.tmp.name, "repo")
+        os.makedirs(self.repo)
+        git(self.repo, "init", "-q", "-b", "main")
+        git(self.repo, "config", "user.email", "test@example.com")
+        git(self.repo, "config", "user.name", "test")
+        # base -> m1 -> m2 on main, s1 -> s2 on a side branch from base, merged back
+        self.base = commit(self.repo, "base")
+        git(self.repo, "checkout", "-q", "-b", "side")
+        self.side = [commit(self.repo, "s1"), commit(self.repo, "s2")]
+        git(self.repo, "checkout", "-q", "main")
+        self.main = [commit(self.repo, "m1"), commit(self.repo, "m2")]
+        git(self.repo, "merge", "-q", "--no-ff", "-m", "merge side", "side")
+        self.out = os.path.join(self.tmp.name, "retro.jsonl")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def run_retro(self, *extra):
+        argv = [f"{self.base}..main", "--repo", self.repo, "--out", self.out, "--stub", "--batch-size", "1"]
+        with open(os.devnull, "w") as log:
+            stderr, sys.stderr = sys.stderr, log
+            try:
+                retro_cli.main(argv + list(extra))
+            finally:
+                sys.stderr = stderr
+
+    def written(self):
+        with open(self.out, encoding="utf-8") as f:
+            return [json.loads(line)["sha"] for line in f]
+
+    def test_resume_across_merge_writes_each_commit_once(self):
+        self.run_retro("--limit", "3")
+        self.assertEqual(len(self.written()), 3)
+        self.run_retro()
+        shas = self.written()
+        self.assertEqual(sorted(shas), sorted(self.side + self.main))
+        self.assertEqual(len(shas), len(set(shas)))
+
+    def test_rerun_after_completion_writes_nothing(self):
+        self.run_retro()
+        self.run_retro()
+        self.assertEqual(len(self.written()), 4)
+
+if __name__ == "__main__":
+    unittest.main()
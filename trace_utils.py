@@ -0,0 +1,164 @@
+# trace_utils.py
+"""Lightweight spans and counters for the hot paths (git, model load, prompt, generation, export).
+
+    with span("build_prompt"):
+        ...
+    count("tokens.generated", n)
+
+Spans are kept in memory as Chrome trace events (open the export in chrome://tracing
+or Perfetto), logged at DEBUG to the "commit_ai_debug" logger, and summarized as
+p50/p95 per span name for the GUI. Set COMMIT_AI_TRACE=path to write a trace on exit.
+"""
+import atexit
+import functools
+import json
+import logging
+import os
+from logging.handlers import RotatingFileHandler
+import subprocess
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+
+logger = logging.getLogger("commit_ai_debug")
+LOG_PATH = os.path.expanduser(r"~\\commit_ai_debug.log")
+
+MAX_EVENTS = 50_000
+# Latest durations kept per span name for the percentiles
+WINDOW = 200
+
+class Tracer:
+    def __init__(self, max_events=MAX_EVENTS, window=WINDOW):
+        self.lock = threading.Lock()
+        self.events = deque(maxlen=max_events)
+        self.samples = defaultdict(lambda: deque(maxlen=window))
+        self.counters = defaultdict(int)
+        self.pid = os.getpid()
+        self.origin = time.perf_counter()
+
+    def _us(self, t):
+        return round((t - self.origin) * 1_000_000, 1)
+
+    @contextmanager
+    def span(self, name, **args):
+        """Times the block; the yielded dict can be filled with extra args (bytes, rc, ...)."""
+        start = time.perf_counter()
+        try:
+            yield args
+        finally:
+            self.record(name, start, time.perf_counter(), args)
+
+    def record(self, name, start, end, args=None):
+        event = {"name": name, "ph": "X", "ts": self._us(start), "dur": self._us(end) - self._us(start),
+                 "pid": self.pid, "tid": threading.get_ident()}
+        if args:
+            event["args"] = args
+        with self.lock:
+            self.events.append(event)
+            self.samples[name].append(end - start)
+        logger.debug("span %s %.1f ms %s", name, (end - start) * 1000, args or "")
+
+    def count(self, name, n=1):
+        with self.lock:
+            self.counters[name] += n
+            self.events.append({"name": name, "ph": "C", "ts": self._us(time.perf_counter()),
+                                "pid": self.pid, "args": {name: self.counters[name]}})
+
+    def traced(self, name=None):
+        def wrap(fn):
+            label = name or fn.__qualname__
+
+            @functools.wraps(fn)
+            def inner(*args, **kwargs):
+                with self.span(label):
+                    return fn(*args, **kwargs)
+            return inner
+        return wrap
+
+    def summary(self):
+        """{name: {"p50_ms", "p95_ms", "count"}} over the latest WINDOW samples of each span."""
+        with self.lock:
+            samples = {name: sorted(values) for name, values in self.samples.items() if values}
+        out = {}
+        for name, values in samples.items():
+            out[name] = {
+                "p50_ms": round(values[len(values) // 2] * 1000, 2),
+                "p95_ms": round(values[min(len(values) - 1, int(len(values) * 0.95))] * 1000, 2),
+                "count": len(values),
+            }
+        return out
+
+    def export_chrome(self, path):
+        with self.lock:
+            events = list(self.events)
+            counters = dict(self.counters)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms",
+                       "otherData": {"counters": counters}}, f)
+        return path
+
+    def log_summary(self, level=logging.INFO):
+        for name, stats in sorted(self.summary().items()):
+            logger.log(level, "%-24s p50 %8.1f ms  p95 %8.1f ms  n=%d",
+                       name, stats["p50_ms"], stats["p95_ms"], stats["count"])
+        for name, value in sorted(self.counters.items()):
+            logger.log(level, "%-24s %d", name, value)
+
+    def reset(self):
+        with self.lock:
+            self.events.clear()
+            self.samples.clear()
+            self.counters.clear()
+
+tracer = Tracer()
+span = tracer.span
+count = tracer.count
+traced = tracer.traced
+
+def git_label(args):
+    # ["git", "-C", path, "--no-optional-locks", "status", ...] -> "git status"
+    args = list(args)
+    if not args or os.path.basename(args[0]) != "git":
+        return os.path.basename(args[0]) if args else "subprocess"
+    i = 1
+    while i < len(args) and args[i].startswith("-"):
+        i += 2 if args[i] in ("-C", "-c") else 1
+    return "git " + args[i] if i < len(args) else "git"
+
+def _output_size(output):
+    return len(output) if output else 0
+
+def run(args, **kwargs):
+    """subprocess.run inside a "git <subcommand>" span that counts bytes read from stdout."""
+    with span(git_label(args)) as meta:
+        result = subprocess.run(args, **kwargs)
+        meta["rc"] = result.returncode
+        size = _output_size(result.stdout)
+        if size:
+            meta["bytes"] = size
+            count("git.bytes_read", size)
+    return result
+
+def setup_logging(console=False):
+    """Sends the commit_ai_debug logger (spans included) to the rotating LOG_PATH file, once."""
+    if getattr(logger, "_commit_ai_configured", False):
+        return logger
+    logger.setLevel(logging.DEBUG)
+    formatter = logging.Formatter("%(asctime)s %(levelname)s %(message)s")
+    file_handler = RotatingFileHandler(LOG_PATH, maxBytes=5_000_000, backupCount=3)
+    file_handler.setLevel(logging.DEBUG)
+    file_handler.setFormatter(formatter)
+    logger.addHandler(file_handler)
+    if console:
+        console_handler = logging.StreamHandler()
+        console_handler.setLevel(logging.INFO)
+        console_handler.setFormatter(formatter)
+        logger.addHandler(console_handler)
+    logger._commit_ai_configured = True
+    logger.debug("Logging initialized to %s", LOG_PATH)
+    return logger
+
+_trace_path = os.environ.get("COMMIT_AI_TRACE")
+if _trace_path:
+    atexit.register(lambda: tracer.export_chrome(_trace_path))